@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import json
+import time
+import threading
+import numpy as np
+
+# Closed-loop latency, from the stimuli shown by the client to the predictions broadcast to the admins.
+#
+# A trace is identified by the timestamp (in ms) of the data it is about: the client timestamp of the
+# 'show' event for the ERP predictions (it is the onset of the epoch in the Timeflux graphs), and the
+# last sample of the window for the MI predictions. The times of the stages, all from time.time(), are:
+#   onset: the trace id itself (client clock)
+#   show: the engine received the 'show' event from the client
+#   marker: the engine pushed the marker to the MarkerStream
+#   epoch: the Epoch node completed the epoch (in calculate)
+#   model: the prediction was computed (AverageERP or Inference)
+#   received: the engine got the prediction from the ml_results stream
+#   broadcast: the prediction was sent to the admins
+# The calculate stages come with the prediction, in its "trace". The time between two consecutive known
+# stages, and the total from the onset and from the show, are added to histograms with log-spaced bins
+# from 0.1 ms to 100 s. The percentiles are computed from the histograms.
+#
+# The clocks of the client, the engine and calculate must agree, so this is meant for a single computer.
+
+STAGES = ["onset", "show", "marker", "epoch", "model", "received", "broadcast"]
+BIN_EDGES_MS = np.logspace(-1, 5, 121) # 0.1 ms to 100 s, 20 bins per decade
+
+# The upper edge of the bin of the p-th quantile, from the cumulative counts of a histogram
+def percentile(cumulative, p):
+  index = np.searchsorted(cumulative, p * cumulative[-1])
+  return float(BIN_EDGES_MS[min(index, len(BIN_EDGES_MS) - 1)])
+
+class LatencyTracker:
+
+  def __init__(self, filename=None, write_interval=10.0, max_pending=4096):
+    self.filename = filename # The histograms are written to this JSON file, at most every write_interval seconds
+    self.write_interval = write_interval
+    self.max_pending = max_pending
+    self.lock = threading.Lock()
+    self.pending = {} # trace id -> stage times of the shows without a prediction yet
+    self.histograms = {}
+    self.max_ms = {}
+    self.last_write = time.monotonic()
+
+  # The engine got a 'show' with the client timestamp (ms) trace_id
+  def record_show(self, trace_id, show, marker):
+    with self.lock:
+      self.pending[int(round(trace_id))] = {"show": show, "marker": marker}
+      while len(self.pending) > self.max_pending:
+        # The shows without prediction (e.g. before there are enough epochs) are forgotten, oldest first
+        del self.pending[next(iter(self.pending))]
+
+  # The engine got a prediction with the trace from calculate, and broadcast it
+  def record_prediction(self, trace, received, broadcast):
+    trace_id = int(round(trace["id"]))
+    with self.lock:
+      times = self.pending.pop(trace_id, {})
+      times.update({stage: trace[stage] for stage in ("epoch", "model") if trace.get(stage) is not None})
+      times.update({"onset": trace_id / 1000.0, "received": received, "broadcast": broadcast})
+      known = [stage for stage in STAGES if stage in times]
+      for start, stop in zip(known[:-1], known[1:]):
+        self._add("%s->%s" % (start, stop), times[stop] - times[start])
+      self._add("onset->broadcast", times["broadcast"] - times["onset"])
+      if "show" in times:
+        self._add("show->broadcast", times["broadcast"] - times["show"])
+    if self.filename is not None and time.monotonic() - self.last_write >= self.write_interval:
+      self.write(self.filename)
+
+  # p50, p90 and p99 (upper edge of the bin) and max of each interval, in ms
+  def stats(self):
+    with self.lock:
+      stats = {}
+      for name, counts in self.histograms.items():
+        cumulative = np.cumsum(counts)
+        top = self.max_ms[name] # The percentiles are at most the max
+        stats[name] = {"count": int(cumulative[-1]), "p50_ms": min(percentile(cumulative, 0.5), top), "p90_ms": min(percentile(cumulative, 0.9), top), "p99_ms": min(percentile(cumulative, 0.99), top), "max_ms": top}
+      return stats
+
+  def write(self, filename):
+    with self.lock:
+      histograms = {name: counts.tolist() for name, counts in self.histograms.items()}
+      self.last_write = time.monotonic()
+    with open(filename, 'w') as f:
+      json.dump({"bin_edges_ms": BIN_EDGES_MS.tolist(), "histograms": histograms, "stats": self.stats()}, f)
+
+  def _add(self, name, seconds):
+    ms = 1000.0 * seconds
+    if name not in self.histograms:
+      self.histograms[name] = np.zeros(len(BIN_EDGES_MS) + 1, dtype=np.int64) # With underflow and overflow bins
+      self.max_ms[name] = ms
+    self.histograms[name][np.searchsorted(BIN_EDGES_MS, ms, side='right')] += 1
+    self.max_ms[name] = max(self.max_ms[name], ms)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import time
+import logging
+import argparse
+import numpy as np
+import pylsl
+from replay import setup_EEG_outlet, setup_marker_outlet
+
+# Synthetic EEG and markers over LSL, to test the engine and the Timeflux graphs with more channels, higher
+# rates and more stimuli than a real headset and subject give.
+#
+# An EEG stream (type EEG, as the headsets) and a MarkerStream (as the engine, with [label, data] channels)
+# are published. The markers mimic the client: 'start' with the user_no, then a 'show' with 1000 + the
+# stimulus every show_interval (+ a random part) seconds and an 'unshow' with 2000 + the stimulus
+# show_duration seconds later, and 'stop' at the end. The stimulus is drawn in [0, nof_stimuli).
+#
+# The EEG is noise with an alpha rhythm. Depending on --signal, a response to each 'show' is added:
+#   erp: a P300-like bump, 300 ms after the stimuli that are targets, i.e. stimulus % nof_classes == target_class
+#   mi: an event-related desynchronization, the alpha rhythm of channel (stimulus % nof_classes) is attenuated
+#       for mi_duration seconds after the 'show'
+#   noise: nothing
+#
+# The timestamps are on the time.time() scale, as the client timestamps. --jitter adds a gaussian noise
+# (standard deviation in seconds) to the timestamp of each chunk, as with Bluetooth headsets.
+# With --speed 0, the samples are pushed as fast as possible, to find the maximum throughput.
+#
+#   python load_generator.py --nof-channels 64 --rate 2000 --chunk-size 64
+#   python load_generator.py --names TP9 AF7 AF8 TP10 "Right AUX" --signal erp   # Like a Muse S
+
+logging.basicConfig(level=logging.INFO)
+
+ALPHA_FREQUENCY = 10.0 # Hz
+ALPHA_AMPLITUDE = 10.0
+NOISE_AMPLITUDE = 5.0
+ERP_AMPLITUDE = 8.0
+ERP_LATENCY = 0.3 # s
+ERP_WIDTH = 0.05 # s
+RESPONSE_DURATION = 1.0 # How long (s) after a 'show' a response can last
+
+# The EEG at the times t (n_samples) after the start, with a response to each (show time, stimulus) in shows
+def generate_EEG(t, shows, args, phases, erp_weights, rng):
+  alpha = ALPHA_AMPLITUDE * np.sin(2 * np.pi * ALPHA_FREQUENCY * t[:, None] + phases)
+  data = NOISE_AMPLITUDE * rng.standard_normal((len(t), args.nof_channels))
+  for show_time, stimulus in shows:
+    after = t - show_time
+    active = (after >= 0) & (after < RESPONSE_DURATION)
+    if not active.any():
+      continue
+    if args.signal == "erp" and stimulus % args.nof_classes == args.target_class:
+      bump = ERP_AMPLITUDE * np.exp(-0.5 * ((after[active] - ERP_LATENCY) / ERP_WIDTH) ** 2)
+      data[active] += bump[:, None] * erp_weights
+    elif args.signal == "mi":
+      channel = stimulus % args.nof_classes % args.nof_channels
+      imagery = (after >= 0) & (after < args.mi_duration)
+      alpha[imagery, channel] *= 0.3
+  return data + alpha
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Publish synthetic EEG and markers over LSL.")
+  parser.add_argument("--nof-channels", type=int, default=8)
+  parser.add_argument("--names", nargs="+", help="The channel names. Default: 1, 2, ...")
+  parser.add_argument("--rate", type=float, default=256.0, help="The sample rate (Hz).")
+  parser.add_argument("--chunk-size", type=int, default=32, help="The number of samples pushed at once.")
+  parser.add_argument("--format", default="float32", choices=["float32", "double64"])
+  parser.add_argument("--jitter", type=float, default=0.0, help="The standard deviation (s) of the noise on the timestamps.")
+  parser.add_argument("--signal", default="erp", choices=["erp", "mi", "noise"])
+  parser.add_argument("--show-interval", type=float, default=0.5, help="The time (s) between two shows, as in the client.")
+  parser.add_argument("--show-randomness", type=float, default=0.2, help="A random time (s) in [0, show_randomness] added to the interval.")
+  parser.add_argument("--show-duration", type=float, default=0.3, help="The time (s) until the unshow.")
+  parser.add_argument("--nof-stimuli", type=int, default=100)
+  parser.add_argument("--nof-classes", type=int, default=4)
+  parser.add_argument("--target-class", type=int, default=0)
+  parser.add_argument("--mi-duration", type=float, default=1.5, help="How long (s) the imagery lasts after a show.")
+  parser.add_argument("--user-no", type=int, default=1)
+  parser.add_argument("--duration", type=float, default=0.0, help="How long (s) to generate EEG, 0 for ever.")
+  parser.add_argument("--speed", type=float, default=1.0, help="1 for real time, N for N times faster, 0 for as fast as possible.")
+  parser.add_argument("--name", default="LoadGenerator", help="The name of the EEG stream.")
+  parser.add_argument("--wait", type=float, default=10.0, help="How long (s) to wait for the graphs to connect before starting.")
+  parser.add_argument("--seed", type=int)
+  args = parser.parse_args()
+
+  names = args.names or [str(i + 1) for i in range(args.nof_channels)]
+  args.nof_channels = len(names)
+  rng = np.random.default_rng(args.seed)
+  phases = rng.uniform(0, 2 * np.pi, args.nof_channels)
+  erp_weights = np.linspace(1.0, 0.5, args.nof_channels)
+  dtype = np.float32 if args.format == "float32" else np.float64
+
+  EEG_outlet = setup_EEG_outlet(args.name, names, args.rate, args.format)
+  marker_outlet = setup_marker_outlet("MarkerStream")
+  for outlet in (EEG_outlet, marker_outlet):
+    if not outlet.wait_for_consumers(args.wait):
+      logging.warning("### No consumer of the %s stream after %g s, starting anyway." % (outlet.get_info().name(), args.wait))
+  logging.info("### Generating %d channels at %g Hz, %s signal, in chunks of %d samples" % (args.nof_channels, args.rate, args.signal, args.chunk_size))
+
+  origin = time.time() # Timestamp of the first sample
+  start_time = time.monotonic()
+  marker_outlet.push_sample(["start", repr(args.user_no)], origin)
+  shows = [] # (show time, stimulus) of the recent shows
+  unshows = [] # (unshow time, stimulus)
+  next_show = args.show_interval
+  nof_samples = 0
+  nof_markers = 1
+  max_lateness = 0.0
+  next_report = 10.0
+  try:
+    while args.duration <= 0 or nof_samples < args.duration * args.rate:
+      t = (nof_samples + np.arange(args.chunk_size)) / args.rate
+      if args.speed > 0:
+        delay = start_time + t[-1] / args.speed - time.monotonic()
+        if delay > 0:
+          time.sleep(delay)
+        max_lateness = max(max_lateness, -delay)
+      # The markers up to the end of this chunk go first:
+      while next_show <= t[-1]:
+        stimulus = int(rng.integers(args.nof_stimuli))
+        marker_outlet.push_sample(["show", repr(1000 + stimulus)], origin + next_show)
+        shows.append((next_show, stimulus))
+        unshows.append((next_show + args.show_duration, stimulus))
+        nof_markers += 1
+        next_show += args.show_interval + rng.uniform(0, args.show_randomness)
+      while unshows and unshows[0][0] <= t[-1]:
+        unshow_time, stimulus = unshows.pop(0)
+        marker_outlet.push_sample(["unshow", repr(2000 + stimulus)], origin + unshow_time)
+        nof_markers += 1
+      shows = [(show_time, stimulus) for show_time, stimulus in shows if show_time + RESPONSE_DURATION > t[0]]
+      data = generate_EEG(t, shows, args, phases, erp_weights, rng).astype(dtype)
+      EEG_outlet.push_chunk(data, origin + t[-1] + (rng.normal(0, args.jitter) if args.jitter > 0 else 0.0))
+      nof_samples += args.chunk_size
+      elapsed = time.monotonic() - start_time
+      if elapsed >= next_report:
+        logging.info("%d samples (%.0f samples/s, %.0f values/s), %d markers, max lateness %.1f ms" % (nof_samples, nof_samples / elapsed, nof_samples * args.nof_channels / elapsed, nof_markers, 1000 * max_lateness))
+        next_report += 10.0
+  except KeyboardInterrupt:
+    pass
+  marker_outlet.push_sample(["stop", repr(3000)], origin + nof_samples / args.rate)
+  elapsed = time.monotonic() - start_time
+  logging.info("### Done: %d samples in %.1f s (%.0f samples/s), %d markers, max lateness %.1f ms" % (nof_samples, elapsed, nof_samples / max(elapsed, 1e-9), nof_markers + 1, 1000 * max_lateness))
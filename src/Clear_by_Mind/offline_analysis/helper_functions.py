@@ -33,6 +33,35 @@ marker_color_position = 3
 marker_attribute_position = 2
 
 
+def label_codes(y, unique_labels=None):
+    """
+    Function for mapping each label to the position of its class in unique_labels
+
+    :param y: labels
+    :param unique_labels: Unique labels (classes). Defaults to the labels in order of apparance.
+    :return codes, unique_labels: class index of each label (-1 if the label is not in unique_labels), corresponding labels
+    """ 
+    if unique_labels is None:
+        unique_labels = pd.unique(y)
+    codes = pd.Index(list(unique_labels)).get_indexer(np.asarray(y))
+    return codes, unique_labels
+
+def class_sums(X, codes, n_classes):
+    """
+    Function for summing epochs per class, in one pass over X
+
+    The sums are computed as one matrix product between the one-hot encoded classes and the epochs.
+
+    :param X: epoch data (epochs x channels x samples)
+    :param codes: class index of each epoch (-1 for epochs to ignore)
+    :param n_classes: number of classes
+    :return sums, counts: sum of the epochs of each class (classes x channels x samples), number of epochs of each class
+    """ 
+    one_hot = (codes[None, :] == np.arange(n_classes)[:, None]).astype(X.dtype)  # shape: (n_classes, n_epochs)
+    sums = (one_hot @ X.reshape(X.shape[0], -1)).reshape((n_classes,) + X.shape[1:])
+    counts = np.bincount(codes[codes >= 0], minlength=n_classes)
+    return sums, counts
+
 def average_epochs(X, y, unique_labels=None):
     """
     Function for averaging epochs for each unique label in the dataset (X,y)
@@ -42,18 +71,10 @@ def average_epochs(X, y, unique_labels=None):
     :param unique_labels: Unique labels to find averages for. Use this if we want a specific order of the outputed epochs. 
     :return X_avg, unique_labels: averaged epochs for each class (in order of labels apparance), corresponding labels
     """ 
-    if unique_labels is None:
-        unique_labels = pd.unique(y)
-
-    X_avg = None
-    for label in unique_labels:
-        index = np.where(y==label)[0] # index for all epochs with y=label. Use '[0]' to unpack tuple
-        temp = np.mean(X[index,:,:], axis=0)  # shape is: (n_epochs, n_channels, n_ts)
-        temp = np.expand_dims(temp, axis=0)
-        if X_avg is None:
-            X_avg = temp
-        else:
-            X_avg = np.vstack((X_avg, temp))
+    codes, unique_labels = label_codes(y, unique_labels)
+    sums, counts = class_sums(X, codes, len(unique_labels))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        X_avg = sums / counts[:, None, None]  # classes without epochs are NaN, as with np.mean
     return X_avg, unique_labels
 
 def std_epochs(X, y, unique_labels=None):
@@ -65,18 +86,18 @@ def std_epochs(X, y, unique_labels=None):
     :param unique_labels: Unique labels to find std.dev. for. Use this if we want a specific order of the outputed epochs. 
     :return X_std, unique_labels: standard deviation of epochs of each class (in order of labels apparance), corresponding labels
     """ 
-    if unique_labels is None:
-        unique_labels = pd.unique(y)
-
-    X_std = None
-    for label in unique_labels:
-        index = np.where(y==label)[0] # index for all epochs with y=label. Use '[0]' to unpack tuple
-        temp = np.std(X[index,:,:], axis=0)  # shape is: (n_epochs, n_channels, n_ts)
-        temp = np.expand_dims(temp, axis=0)
-        if X_std is None:
-            X_std = temp
-        else:
-            X_std = np.vstack((X_std, temp))
+    codes, unique_labels = label_codes(y, unique_labels)
+    n_classes = len(unique_labels)
+    sums, counts = class_sums(X, codes, n_classes)
+    X_avg = sums / np.maximum(counts, 1)[:, None, None]
+
+    # Center before squaring, as np.std does (ignored epochs are centered on class 0 but have no weight in the sums)
+    deviations = np.take(X_avg, np.maximum(codes, 0), axis=0)
+    np.subtract(X, deviations, out=deviations)
+    np.square(deviations, out=deviations)
+    squares, _ = class_sums(deviations, codes, n_classes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        X_std = np.sqrt(squares / counts[:, None, None])  # classes without epochs are NaN, as with np.std
     return X_std, unique_labels
 
 def ERP_aug(X_avg_class):
@@ -87,28 +108,32 @@ def ERP_aug(X_avg_class):
     :return X_avg_class_aug: augmented EEG-epoch for each class of interest (n_classes x 2*n_channels x n_samples)
     """ 
 
-    X_avg_class_aug = None 
-    for i in range(X_avg_class.shape[0]):
- 
-        X_avg_class_not_i = np.mean(np.delete(X_avg_class, i, axis=0), axis=0) #, keepdims=True)  # shape: (Ch, Ts)
-        
-        X_aug = np.block([[X_avg_class[i,:,:]],[X_avg_class_not_i]]) # shape: [(Ch, Ts); (Ch, Ts)] --> (2*Ch, Ts)
-        X_aug = np.expand_dims(X_aug, axis=0)
-
-        # Verify shapes are ok: # remove
-        #print("X_avg_class_i: ", X_avg_class[i,:,:].shape)
-        #print("X_avg_class_not_i: ", X_avg_class_not_i.shape)
-        #print("X_aug: ", X_aug.shape)
-
-        if X_avg_class_aug is None:
-            X_avg_class_aug = X_aug
-        else:
-            X_avg_class_aug = np.vstack((X_avg_class_aug, X_aug))
+    # Average of all other classes, for each class: (sum - X_avg_class[i])/(n_classes-1)
+    X_avg_class_not = (np.sum(X_avg_class, axis=0, keepdims=True) - X_avg_class) / (X_avg_class.shape[0] - 1)  # shape: (n_classes, Ch, Ts)
+    X_avg_class_aug = np.concatenate((X_avg_class, X_avg_class_not), axis=1)  # shape: [(Ch, Ts); (Ch, Ts)] --> (2*Ch, Ts) for each class
 
     #print("X_avg_class_aug: ", X_avg_class_aug.shape) # remove
     return X_avg_class_aug
 
 
+def distance_riemann_batch(A, B):
+    """
+    Riemannian distance between pairs of SPD matrices, computed for all the pairs at once
+
+    Equivalent to pyriemann's distance_riemann(A[k], B[k]) for each k: B is whitened with its Cholesky factor L,
+    and the generalized eigenvalues of (A, B) are the eigenvalues of inv(L) @ A @ inv(L).T (one batched decomposition).
+
+    :param A: SPD matrices (n_matrices x n_channels x n_channels)
+    :param B: SPD matrices (n_matrices x n_channels x n_channels)
+    :return dist: distance between each pair of matrices (n_matrices)
+    """ 
+    L = np.linalg.cholesky(B)
+    L_inv_A = np.linalg.solve(L, A)
+    M = np.linalg.solve(L, np.swapaxes(L_inv_A, 1, 2))  # inv(L) @ A @ inv(L).T, since A is symmetric
+    eigvals = np.linalg.eigvalsh(M)
+    return np.sqrt(np.sum(np.log(eigvals)**2, axis=-1))
+
+
 def ERP_probabilities(X_avg_class, cov, map2prob="softmax", compare="avg"):
     """
     Function to compute odd-one-out probabilites for a set of EEG-epochs averages for a differnt conditions
@@ -118,30 +143,28 @@ def ERP_probabilities(X_avg_class, cov, map2prob="softmax", compare="avg"):
     :return probabilities: probability for each class the be the odd one out.
     """ 
 
-    dist_vec = np.zeros((X_avg_class.shape[0]))
-    dist_mat = np.zeros((X_avg_class.shape[0]-1, X_avg_class.shape[0]))
     # print("X_avg_class.shape: ", X_avg_class.shape) # remove
+    n_classes = X_avg_class.shape[0]
+
+    # Original method: 
+    #  - Take distance between dist(cov(X_avg_class[i]),cov(mean(X_avg_class[~i]))
+    #  - All the leave-one-out means are (sum - X_avg_class[i])/(n_classes-1), and all the 2*n_classes covariance matrices are estimated at once.
+    if compare == "avg":
+        X_avg_class_not_avg = (np.sum(X_avg_class, axis=0, keepdims=True) - X_avg_class) / (n_classes - 1)  # shape: (n_classes,Ch,Ts)
+        Covs = cov.transform(np.concatenate((X_avg_class, X_avg_class_not_avg), axis=0))
+        dist_vec = distance_riemann_batch(Covs[:n_classes], Covs[n_classes:])
+
+    # Alternative method: 
+    #  - Take distance between dist(cov(X_avg_class[i]),cov(X_avg_class[~i]), for EACH X_avg_class[~i]
+    #  - OBS. This does not seem to perform as good as the "avg" method.        
+    elif compare == "individual":
+        Covs = cov.transform(X_avg_class)
+        i, j = np.nonzero(~np.eye(n_classes, dtype=bool))  # all pairs (i,j) with i != j, grouped by i
+        dist_mat = distance_riemann_batch(Covs[j], Covs[i]).reshape(n_classes, n_classes - 1)
+        dist_vec = np.mean(dist_mat, axis=1)
 
-    
-    for i in range(X_avg_class.shape[0]):
-
-        Cov_i = cov.transform(X_avg_class[[i],:,:]) # Covariance matrix for X_avg_class[i], shape: (1,ch,ts)
-
-        # Original method: 
-        #  - Take distance between dist(cov(X_avg_class[i]),cov(mean(X_avg_class[~i]))
-        if compare == "avg":
-            X_avg_class_not_i_avg = np.mean(np.delete(X_avg_class, i, axis=0), axis=0, keepdims=True)  # shape: (1,Ch,Ts)
-            Cov_avg_not_i_avg = cov.transform(X_avg_class_not_i_avg)
-            dist_vec[i] = distance_riemann(Cov_i[0,:,:], Cov_avg_not_i_avg[0,:,:])
-
-        # Alternative method: 
-        #  - Take distance between dist(cov(X_avg_class[i]),cov(X_avg_class[~i]), for EACH X_avg_class[~i]
-        #  - OBS. This does not seem to perform as good as the "avg" method.        
-        if compare == "individual":
-            X_avg_class_not_i = np.delete(X_avg_class, i, axis=0)  # shape: (nof_classes-1,Ch,Ts)
-            Cov_avg_not_i = cov.transform(X_avg_class_not_i)
-            dist_mat[:,[i]] = distance(Cov_avg_not_i[:,:,:], Cov_i[0,:,:], metric='riemann') # use pyriemann.distance to allow fo a set of SPD matrices in the 2nd argument.
-            dist_vec = np.mean(dist_mat, axis=0)
+    else:
+        dist_vec = np.zeros((n_classes))
 
     if map2prob == "softmax":
         return softmax(dist_vec)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+# Columnar in-memory store for the EEG collected by the engine.
+#
+# The samples are kept in a preallocated float64 array of shape (nof_samples, nof_channels), with one
+# float64 column per kind of timestamp (local clock, LSL timestamp and LSL time correction).
+# When the arrays are full, their capacity is doubled, so appending a chunk costs the same during the
+# whole trial. The store also remembers how many samples have been written to disk, so the samples
+# to flush are always the rows after that position.
+#
+# The methods return views of the arrays: copy them (with np.array) if they are used after the
+# EEG_data_lock has been released, since the rows can be moved by clear().
+
+class EEGStore:
+
+  def __init__(self, nof_channels, capacity=65536):
+    self.nof_channels = nof_channels
+    self.data = np.empty((capacity, nof_channels), dtype=np.float64)
+    self.timestamps = np.empty(capacity, dtype=np.float64)
+    self.LSL_timestamps = np.empty(capacity, dtype=np.float64)
+    self.time_corrections = np.empty(capacity, dtype=np.float64)
+    self.nof_samples = 0
+    self.nof_written_samples = 0
+
+  def __len__(self):
+    return self.nof_samples
+
+  # Append a chunk of samples (nof_samples x nof_channels). The timestamps can be arrays or scalars.
+  def append(self, samples, timestamps, LSL_timestamps, time_corrections):
+    samples = np.asarray(samples, dtype=np.float64).reshape(-1, self.nof_channels)
+    start = self.nof_samples
+    stop = start + len(samples)
+    if stop > len(self.timestamps) or not self.timestamps.flags.writeable:
+      self.reserve(stop)
+    self.data[start:stop] = samples
+    self.timestamps[start:stop] = timestamps
+    self.LSL_timestamps[start:stop] = LSL_timestamps
+    self.time_corrections[start:stop] = time_corrections
+    self.nof_samples = stop
+
+  # Use existing arrays as the samples, without copying them, e.g. the memory-mapped columns of a
+  # recorded trial (see TrialReader). The samples are considered written. Appending copies them to
+  # new arrays first, since memory-mapped columns are read-only.
+  def attach(self, data, timestamps, LSL_timestamps, time_corrections):
+    self.data = data
+    self.timestamps = timestamps
+    self.LSL_timestamps = LSL_timestamps
+    self.time_corrections = time_corrections
+    self.nof_samples = len(timestamps)
+    self.nof_written_samples = self.nof_samples
+
+  # Double the capacity until at least nof_samples fit.
+  def reserve(self, nof_samples):
+    capacity = max(len(self.timestamps), 1)
+    while capacity < nof_samples:
+      capacity *= 2
+    if capacity == len(self.timestamps) and self.timestamps.flags.writeable:
+      return
+    for name in ("data", "timestamps", "LSL_timestamps", "time_corrections"):
+      old = getattr(self, name)
+      new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+      new[:self.nof_samples] = old[:self.nof_samples]
+      setattr(self, name, new)
+
+  # Views of the samples between start and stop: (data, timestamps, LSL_timestamps, time_corrections)
+  def slice(self, start, stop):
+    start = max(start, 0)
+    stop = min(stop, self.nof_samples)
+    return self.data[start:stop], self.timestamps[start:stop], self.LSL_timestamps[start:stop], self.time_corrections[start:stop]
+
+  # Views of the last nof_samples samples
+  def tail(self, nof_samples):
+    return self.slice(self.nof_samples - nof_samples, self.nof_samples)
+
+  # Views of the samples that have not been written to disk yet. Call mark_written() once they are.
+  def unwritten(self):
+    return self.slice(self.nof_written_samples, self.nof_samples)
+
+  def nof_unwritten_samples(self):
+    return self.nof_samples - self.nof_written_samples
+
+  def mark_written(self):
+    self.nof_written_samples = self.nof_samples
+
+  # Remove the samples, e.g. when a new trial starts. Samples not yet written to disk are kept.
+  def clear(self):
+    nof_unwritten = self.nof_unwritten_samples()
+    if not self.timestamps.flags.writeable:
+      self.reserve(nof_unwritten) # Attached read-only arrays, see attach()
+    for column in (self.data, self.timestamps, self.LSL_timestamps, self.time_corrections):
+      column[:nof_unwritten] = column[self.nof_written_samples:self.nof_samples]
+    self.nof_samples = nof_unwritten
+    self.nof_written_samples = 0
@@ -9,7 +9,6 @@ import datetime
 import threading
 import ctypes
 import pylsl
-import struct
 import sys
 import functools
 import time
@@ -18,11 +17,17 @@ import mne
 import matplotlib as plt
 import random
 import math
-import re
 import janus
+import eeg_store
+import latency
+import stream_resolver
+import trial_catalog
+import trial_reader
+import trial_writer
 import signal
 
 session_log_filename = "session_log.txt"
+session_catalog_filename = "session_catalog.sqlite"
 trial_no = 0
 trial_is_running = False
 END_PROGRAM = False
@@ -33,13 +38,21 @@ logging.basicConfig(level=logging.INFO)  # DEBUG / INFO / WARNING / ERRROR
 
 # We need a lock for taking care of threaded asynchronous accesses to anything related to the log file and memory:
 log_lock = threading.Lock()
-# The in-memory version of the log:
+# The in-memory version of the log (the rows written by this session):
 log = []
+# The catalog of the trials, see trial_catalog.py:
+catalog = None
 now = str(datetime.datetime.now())
 
 # We need a lock for taking care of threaded asynchronous accesses to the collected EEG data:
 EEG_data_lock = threading.Lock()
 
+# The EEG is pulled from LSL in chunks into a preallocated buffer. These can be set with environment variables:
+LSL_CHUNK_SIZE = int(os.environ.get("LSL_CHUNK_SIZE", 64)) # Max number of samples per pull
+LSL_CHUNK_TIMEOUT = float(os.environ.get("LSL_CHUNK_TIMEOUT", 0.02)) # Max time (s) to wait for a full chunk, i.e. the added latency
+LSL_TIME_CORRECTION_INTERVAL = float(os.environ.get("LSL_TIME_CORRECTION_INTERVAL", 1.0)) # How often (s) the time correction is updated
+LSL_DTYPES = {pylsl.cf_float32: np.float32, pylsl.cf_double64: np.float64, pylsl.cf_int32: np.int32, pylsl.cf_int16: np.int16, pylsl.cf_int8: np.int8, pylsl.cf_int64: np.int64} # Other formats (string) are not EEG
+
 # The websockets for communication with CLIENTs, ADMINs and COMPUTEs:
 ADMINS = set()
 CLIENTS = set()
@@ -75,15 +88,9 @@ def start_trial (user_no, timestamp):
     # Append this to the session log file
     with open(session_log_filename, 'a') as f:
       ok = f.write(row)
+    catalog.start(trial_no, user_no, timestamp, now)
   with EEG_data_lock:
-    collected_EEG_timestamps = []
-    collected_EEG_LSL_timestamps = []
-    collected_EEG_time_corrections = []
-    collected_EEG = []
-    not_yet_written_EEG_timestamps = []
-    not_yet_written_EEG_LSL_timestamps = []
-    not_yet_written_EEG_time_corrections = []
-    not_yet_written_EEG = []
+    EEG_store.clear()
     not_yet_written_marker_timestamps = []
     not_yet_written_marker_LSL_timestamps = []
     not_yet_written_marker = []
@@ -101,6 +108,7 @@ def stop_trial (timestamp):
     # Append this to the session log file
     with open(session_log_filename, 'a') as f:
       ok = f.write(row)
+    catalog.stop(trial_no, timestamp, now)
 
 def end_trial (timestamp, correct_category):
   global trial_no, trial_is_running, log_lock
@@ -112,20 +120,23 @@ def end_trial (timestamp, correct_category):
     # Append this to the session log file
     with open(session_log_filename, 'a') as f:
       ok = f.write(row)
+    catalog.end(trial_no, timestamp, now, correct_category)
   trial_is_running = False
 
 
 not_yet_written_marker = []
 not_yet_written_marker_timestamps = []
 not_yet_written_marker_LSL_timestamps = []
-collected_EEG = []
-collected_EEG_timestamps = []
-collected_EEG_LSL_timestamps = []
-collected_EEG_time_corrections = []
-not_yet_written_EEG = []
-not_yet_written_EEG_timestamps = []
-not_yet_written_EEG_LSL_timestamps = []
-not_yet_written_EEG_time_corrections = []
+# The EEG of the current trial (samples and timestamps), also keeps track of what has been written to disk:
+EEG_nof_channels = 8
+EEG_store = eeg_store.EEGStore(EEG_nof_channels)
+EEG_reader = None # TrialReader of the trial loaded from disk, if any
+# Writes the EEG and markers in a background thread, and keeps the files of the current trial open, see trial_writer.py.
+# Set DISK_FSYNC_INTERVAL (in seconds) to also fsync the files regularly.
+DISK_FSYNC_INTERVAL = float(os.environ["DISK_FSYNC_INTERVAL"]) if "DISK_FSYNC_INTERVAL" in os.environ else None
+EEG_writer = trial_writer.TrialWriter("data", fsync_interval=DISK_FSYNC_INTERVAL) # The catalog is set at startup
+# Latency from the stimuli shown to the predictions sent to the admins, see latency.py. The histograms are written to latency.json:
+latency_tracker = latency.LatencyTracker("latency.json")
 current_EEG = []
 current_EEG_timestamp = 0
 not_yet_sent_to_client_EEG = []
@@ -140,135 +151,135 @@ def read_floats_from_disk(filename):
   return np_array.tolist()
 
 def load_EEG_from_disk(from_trial_no):
-  global collected_EEG, collected_EEG_timestamps, collected_EEG_time_corrections, collected_EEG_LSL_timestamps
-  EEG_filename = "data/T%04d_EEG.bin" % from_trial_no
-  EEG_timestamps_filename = "data/T%04d_EEG_timestamps.bin" % from_trial_no
-  EEG_LSL_timestamps_filename = "data/T%04d_EEG_LSL_timestamps.bin" % from_trial_no
-  EEG_time_corrections_filename = "data/T%04d_EEG_time_corrections.bin" % from_trial_no
-  collected_EEG = read_doubles_from_disk(EEG_filename)
-  collected_EEG_timestamps = read_doubles_from_disk(EEG_timestamps_filename)
-  collected_EEG_LSL_timestamps = read_doubles_from_disk(EEG_LSL_timestamps_filename)
-  collected_EEG_time_corrections = read_doubles_from_disk(EEG_time_corrections_filename)
-  logging.info("Nof loaded EEG samples is %d" % len(collected_EEG_timestamps))
+  global EEG_store, EEG_nof_channels, EEG_reader
+  # The files are memory-mapped, so the samples are only read from disk when they are used:
+  EEG_reader = trial_reader.TrialReader(from_trial_no, nof_channels=EEG_nof_channels)
+  EEG_nof_channels = EEG_reader.nof_channels
+  EEG_store = eeg_store.EEGStore(EEG_nof_channels)
+  EEG_store.attach(EEG_reader.EEG, EEG_reader.EEG_timestamps, EEG_reader.EEG_LSL_timestamps, EEG_reader.EEG_time_corrections)
+  logging.info("Nof loaded EEG samples is %d" % len(EEG_store))
 
 def write_EEG_to_disk():
-  global trial_no, not_yet_written_EEG, not_yet_written_EEG_timestamps, not_yet_written_EEG_time_corrections, not_yet_written_EEG_LSL_timestamps
+  global trial_no
   logging.debug("Writing EEG to disk at %s" % datetime.datetime.now())
-  EEG_filename = "data/T%04d_EEG.bin" % trial_no
-  EEG_timestamps_filename = "data/T%04d_EEG_timestamps.bin" % trial_no
-  EEG_LSL_timestamps_filename = "data/T%04d_EEG_LSL_timestamps.bin" % trial_no
-  EEG_time_corrections_filename = "data/T%04d_EEG_time_corrections.bin" % trial_no
-  with open(EEG_filename, 'ab') as f:
-    ok = f.write(struct.pack('<%sd' % len(not_yet_written_EEG),*not_yet_written_EEG))
-  not_yet_written_EEG = []
-  with open(EEG_timestamps_filename, 'ab') as f:
-    ok = f.write(struct.pack('<%sd' % len(not_yet_written_EEG_timestamps),*not_yet_written_EEG_timestamps))
-  not_yet_written_EEG_timestamps = []
-  with open(EEG_LSL_timestamps_filename, 'ab') as f:
-    ok = f.write(struct.pack('<%sd' % len(not_yet_written_EEG_LSL_timestamps),*not_yet_written_EEG_LSL_timestamps))
-  not_yet_written_EEG_LSL_timestamps = []
-  with open(EEG_time_corrections_filename, 'ab') as f:
-    ok = f.write(struct.pack('<%sd' % len(not_yet_written_EEG_time_corrections),*not_yet_written_EEG_time_corrections))
-  not_yet_written_EEG_time_corrections = []
+  # Only take the samples not written yet while holding the lock (a copy of a few hundred rows), the writer thread writes them:
+  with EEG_data_lock:
+    EEG, EEG_timestamps, EEG_LSL_timestamps, EEG_time_corrections = [np.array(column) for column in EEG_store.unwritten()]
+    EEG_store.mark_written()
+  if len(EEG_timestamps) == 0:
+    return
+  EEG_writer.submit(trial_no, EEG_nof_channels, {"EEG": EEG, "EEG_timestamps": EEG_timestamps, "EEG_LSL_timestamps": EEG_LSL_timestamps, "EEG_time_corrections": EEG_time_corrections})
   # Tell the admin GUI that weäve recorded EEG data:
   send_to_admins(json.dumps({"type": "recording"}))
 
 def write_marker_to_disk():
   global trial_no, not_yet_written_marker, not_yet_written_marker_timestamps, not_yet_written_marker_LSL_timestamps
   logging.debug("Writing marker to disk at %s" % datetime.datetime.now())
-  marker_filename = "data/T%04d_marker.bin" % trial_no
-  marker_timestamps_filename = "data/T%04d_marker_timestamps.bin" % trial_no
-  marker_LSL_timestamps_filename = "data/T%04d_marker_LSL_timestamps.bin" % trial_no
-  with open(marker_filename, 'ab') as f:
-    ok = f.write(struct.pack('<%sd' % len(not_yet_written_marker),*not_yet_written_marker))
-  not_yet_written_marker = []
-  with open(marker_timestamps_filename, 'ab') as f:
-    ok = f.write(struct.pack('<%sd' % len(not_yet_written_marker_timestamps),*not_yet_written_marker_timestamps))
-  not_yet_written_marker_timestamps = []
-  with open(marker_LSL_timestamps_filename, 'ab') as f:
-    ok = f.write(struct.pack('<%sd' % len(not_yet_written_marker_LSL_timestamps),*not_yet_written_marker_LSL_timestamps))
-  not_yet_written_marker_LSL_timestamps = []
+  # Swap the marker lists while holding the lock, the writer thread writes them:
+  with EEG_data_lock:
+    marker, marker_timestamps, marker_LSL_timestamps = not_yet_written_marker, not_yet_written_marker_timestamps, not_yet_written_marker_LSL_timestamps
+    not_yet_written_marker = []
+    not_yet_written_marker_timestamps = []
+    not_yet_written_marker_LSL_timestamps = []
+  if len(marker_timestamps) == 0:
+    return
+  EEG_writer.submit(trial_no, EEG_nof_channels, {"marker": marker, "marker_timestamps": marker_timestamps, "marker_LSL_timestamps": marker_LSL_timestamps})
 
 
 def lsl_thread(name):
-  global END_PROGRAM, trial_is_running, trial_no, not_yet_sent_to_client_EEG, not_yet_written_EEG, not_yet_written_EEG_timestamps, not_yet_written_EEG_time_corrections, not_yet_written_EEG_LSL_timestamps, trial_is_started_and_first_EEG_not_yet_received, trial_is_started_and_user_no
+  global END_PROGRAM, trial_is_running, trial_no, not_yet_sent_to_client_EEG, EEG_store, EEG_nof_channels, trial_is_started_and_first_EEG_not_yet_received, trial_is_started_and_user_no
   try:
     # first resolve an EEG stream on the lab network
     logging.info("### Looking for LSL EEG streams from nearby devices at %s" % datetime.datetime.now())
 
-    # As of now you can't specify a timeout which means a python program can get stuck indefinitely if no stream is found.
-    streams = pylsl.resolve_stream('type', 'EEG')
-    if len(streams) > 1:
-      logging.warning('### Number of EEG streams is > 1, picking the first one.')
-    elif len(streams) == 1:
-      logging.info('### Found the EEG stream.')
-
-    info = streams[0]
-    # create a new inlet to read from the stream
-    #proc_flags = 0  # Marker events are relatively rare. No need to post-process.
-    #proc_flags = pysls.proc_clocksync | pylsl.proc_dejitter | pylsl.proc_monotonize
     proc_flags = pylsl.proc_clocksync | pylsl.proc_dejitter
-    inlet = pylsl.StreamInlet(info, max_buflen=1, processing_flags=proc_flags)
-
-    logging.info('### pylsl streamInfo:')
-    logging.info("LSL stream name %s", info.name())
-    logging.info("LSL hostname %s", info.hostname())
-    logging.info("LSL stream channel count %d", info.channel_count())
-    logging.info("LSL time correction %s", inlet.time_correction())
-    logging.info("LSL stream created at %s", info.created_at())
-    EEG_samplerate = info.nominal_srate()
-    logging.debug("LSL info as xml %s", info.as_xml())
-    log_string = "LSL_name=%s,LSL_hostname=%s,LSL_nof_channels=%d,LSL_created_at=%s,LSL_time_correction=%s" % (info.name(), info.hostname(), info.channel_count(), info.created_at(), inlet.time_correction())
-    with log_lock:
-      row = str(trial_no) + " " + now + " " + log_string + "\n"
-      log.append(row)
-      with open(session_log_filename, 'a') as f:
-        ok = f.write(row)
-    logging.info("Wrote session info to log: %s" % log_string)
-
     while END_PROGRAM == False:
-      sample, timestamp = inlet.pull_sample()
-      # Push eeg_data to CLIENTS:
-      if (len(not_yet_sent_to_client_EEG) >= 1024):
-        # Just flush it if nobody is listening:
-        not_yet_sent_to_client_EEG = []
-      not_yet_sent_to_client_EEG.extend(sample)
-      local_clock = pylsl.local_clock()
-      # Time correctiong will change approximately once per second, but only very little
+      # The stream is looked for again when it is lost, e.g. when the headset reconnects
+      inlet, info = stream_resolver.open_inlet('type', 'EEG', lambda: END_PROGRAM, max_buflen=1, processing_flags=proc_flags)
+      if inlet is None:
+        break
+
+      logging.info('### pylsl streamInfo:')
+      logging.info("LSL stream name %s", info.name())
+      logging.info("LSL hostname %s", info.hostname())
+      logging.info("LSL stream channel count %d", info.channel_count())
+      logging.info("LSL time correction %s", inlet.time_correction())
+      logging.info("LSL stream created at %s", info.created_at())
+      EEG_samplerate = info.nominal_srate()
+      logging.debug("LSL info as xml %s", info.as_xml())
+      log_string = "LSL_name=%s,LSL_hostname=%s,LSL_nof_channels=%d,LSL_created_at=%s,LSL_time_correction=%s" % (info.name(), info.hostname(), info.channel_count(), info.created_at(), inlet.time_correction())
+      with log_lock:
+        row = str(trial_no) + " " + now + " " + log_string + "\n"
+        log.append(row)
+        with open(session_log_filename, 'a') as f:
+          ok = f.write(row)
+      logging.info("Wrote session info to log: %s" % log_string)
+
+      with EEG_data_lock:
+        # The samples of the running trial are kept when the same headset reconnects
+        if EEG_store.nof_channels != info.channel_count():
+          EEG_nof_channels = info.channel_count()
+          EEG_store = eeg_store.EEGStore(EEG_nof_channels)
+
+      # The channel names (only in the full stream info, from the inlet) and the rate go in the manifest of the trials:
+      channel = info.desc().child("channels").first_child()
+      channel_names = []
+      for _ in range(info.channel_count()):
+        channel_names.append(channel.child_value("label"))
+        channel = channel.next_sibling()
+      EEG_writer.set_stream(channel_names, info.nominal_srate())
+
+      # Samples are pulled in chunks, directly into this buffer (one row per sample):
+      # pull_chunk() fills it with the values of the format of the stream, so it must have the same dtype
+      if info.channel_format() not in LSL_DTYPES:
+        raise ValueError("Unsupported channel format %d of the EEG stream %s" % (info.channel_format(), info.name()))
+      chunk_buffer = np.zeros((LSL_CHUNK_SIZE, info.channel_count()), dtype=LSL_DTYPES[info.channel_format()])
       time_correction = inlet.time_correction()
-
-      # We're only interested in storing EEG signals if we have an ongoing trial:
-      if trial_is_running == True:
-        if trial_is_started_and_first_EEG_not_yet_received == True:
-          trial_is_started_and_first_EEG_not_yet_received = False
-          # Save a marker with the same timestamp as the initial EEG, to be able to sync them:
-          log_marker(trial_is_started_and_user_no + 4000, timestamp - time_correction)
-        with EEG_data_lock:
-          collected_EEG_timestamps.append(local_clock)
-          collected_EEG_LSL_timestamps.append(timestamp)
-          collected_EEG_time_corrections.append(time_correction)
-          collected_EEG.extend(sample)
-          not_yet_written_EEG_timestamps.append(local_clock)
-          not_yet_written_EEG_LSL_timestamps.append(timestamp)
-          not_yet_written_EEG_time_corrections.append(time_correction)
-          not_yet_written_EEG.extend(sample)
-          if len(not_yet_written_EEG_timestamps) > 256:
-            write_EEG_to_disk()
-            write_marker_to_disk()
-      else:
-        if len(not_yet_written_EEG_timestamps) > 0:
-          with EEG_data_lock:
-            write_EEG_to_disk()
-            print("Flushed the EEG data at the end of a trial\n")
-        if len(not_yet_written_marker_timestamps) > 0:
-          with EEG_data_lock:
-            write_marker_to_disk()
-            print("Flushed the markers at the end of a trial\n")
+      next_time_correction = pylsl.local_clock() + LSL_TIME_CORRECTION_INTERVAL
+
+      try:
+        while END_PROGRAM == False:
+          _, chunk_timestamps = inlet.pull_chunk(timeout=LSL_CHUNK_TIMEOUT, max_samples=LSL_CHUNK_SIZE, dest_obj=chunk_buffer)
+          nof_samples = len(chunk_timestamps)
+          chunk = chunk_buffer[:nof_samples].ravel().tolist() # All samples of the chunk, one after the other
+          # Push eeg_data to CLIENTS:
+          if (len(not_yet_sent_to_client_EEG) >= 1024):
+            # Just flush it if nobody is listening:
+            not_yet_sent_to_client_EEG = []
+          not_yet_sent_to_client_EEG.extend(chunk)
+          # All samples of a chunk get the local clock at which the chunk was pulled
+          local_clock = pylsl.local_clock()
+          # Time correctiong will change approximately once per second, but only very little
+          if local_clock >= next_time_correction:
+            time_correction = inlet.time_correction()
+            next_time_correction = local_clock + LSL_TIME_CORRECTION_INTERVAL
+
+          # We're only interested in storing EEG signals if we have an ongoing trial:
+          if trial_is_running == True and nof_samples > 0:
+            if trial_is_started_and_first_EEG_not_yet_received == True:
+              trial_is_started_and_first_EEG_not_yet_received = False
+              # Save a marker with the same timestamp as the initial EEG, to be able to sync them:
+              log_marker(trial_is_started_and_user_no + 4000, chunk_timestamps[0] - time_correction)
+            with EEG_data_lock:
+              EEG_store.append(chunk_buffer[:nof_samples], local_clock, chunk_timestamps, time_correction)
+            if EEG_store.nof_unwritten_samples() > 256:
+              write_EEG_to_disk()
+              write_marker_to_disk()
+          elif trial_is_running == False:
+            if EEG_store.nof_unwritten_samples() > 0:
+              write_EEG_to_disk()
+              print("Flushed the EEG data at the end of a trial\n")
+            if len(not_yet_written_marker_timestamps) > 0:
+              write_marker_to_disk()
+              print("Flushed the markers at the end of a trial\n")
+      except RuntimeError as e:
+        # pylsl.LostError
+        logging.warning("### Lost the EEG stream (%s) at %s, looking for it again." % (e, datetime.datetime.now()))
     logging.info("### Ending LSL thread at %s" % datetime.datetime.now())
     logging.info("### Writing last EEG samples to disk at %s" % datetime.datetime.now())
-    with EEG_data_lock:
-      write_EEG_to_disk()
-      write_marker_to_disk()
+    write_EEG_to_disk()
+    write_marker_to_disk()
+    EEG_writer.close()
   except KeyboardInterrupt as e:
     logging.info("### Ending LSL thread at %s" % datetime.datetime.now())
     raise e
@@ -280,54 +291,58 @@ def lsl_thread_2(name):
     # first resolve an EEG stream on the lab network
     logging.info("### Looking for LSL2 ml_results Marker streams at %s" % datetime.datetime.now())
 
-    # As of now you can't specify a timeout which means a python program can get stuck indefinitely if no stream is found.
-    streams = pylsl.resolve_byprop('name', 'ml_results')
-    if len(streams) > 1:
-      logging.warning('### Number of ml_results Marker streams is > 1, picking the first one.')
-    elif len(streams) == 1:
-      logging.info('### Found the ml_results stream.')
-
-    info = streams[0]
-    # create a new inlet to read from the stream
     proc_flags = pylsl.proc_clocksync | pylsl.proc_dejitter
-    inlet2 = pylsl.StreamInlet(info, max_buflen=1, processing_flags=proc_flags)
-
-    logging.info('### pylsl2 streamInfo:')
-    logging.info("LSL2 stream name %s", info.name())
-    logging.info("LSL2 hostname %s", info.hostname())
-    logging.info("LSL2 stream channel count %d", info.channel_count())
-    logging.info("LSL2 time correction %s", inlet2.time_correction())
-    logging.info("LSL2 stream created at %s", info.created_at())
-
-    logging.debug("LSL2 info as xml %s", info.as_xml())
     while END_PROGRAM == False:
-      logging.info("### Pulling ml_results sample at %s" % datetime.datetime.now())
-      sample, timestamp = inlet2.pull_sample()
-      local_clock = pylsl.local_clock()
-      # Time correctiong will change approximately once per second, but only very little
-      time_correction = inlet2.time_correction()   # -1642543235.8716614
-
-      # Push eeg_quality to CLIENTS and ADMINS:
-      if (sample[0] == "variance"):
-        dict_to_send = json.loads(sample[1])
-        send_to_admins(json.dumps({"type": "eeg_quality", "data":dict_to_send}))
-      elif (sample[0] == "predictions"):
-        dict_to_send = json.loads(sample[1])
-        send_to_admins(json.dumps({"type": "prediction", "data":dict_to_send}))
-        print("Prediction from calculate: ", sample[1])
+      # The stream is looked for again when it is lost, e.g. when the Timeflux graphs are restarted
+      inlet2, info = stream_resolver.open_inlet('name', 'ml_results', lambda: END_PROGRAM, max_buflen=1, processing_flags=proc_flags)
+      if inlet2 is None:
+        break
+
+      logging.info('### pylsl2 streamInfo:')
+      logging.info("LSL2 stream name %s", info.name())
+      logging.info("LSL2 hostname %s", info.hostname())
+      logging.info("LSL2 stream channel count %d", info.channel_count())
+      logging.info("LSL2 time correction %s", inlet2.time_correction())
+      logging.info("LSL2 stream created at %s", info.created_at())
+
+      logging.debug("LSL2 info as xml %s", info.as_xml())
+      try:
+        while END_PROGRAM == False:
+          sample, timestamp = inlet2.pull_sample(timeout=1.0)
+          if sample is None:
+            continue # Check END_PROGRAM
+          logging.info("### Pulled ml_results sample at %s" % datetime.datetime.now())
+          local_clock = pylsl.local_clock()
+          # Time correctiong will change approximately once per second, but only very little
+          time_correction = inlet2.time_correction()   # -1642543235.8716614
+
+          # Push eeg_quality to CLIENTS and ADMINS:
+          if (sample[0] == "variance"):
+            dict_to_send = json.loads(sample[1])
+            send_to_admins(json.dumps({"type": "eeg_quality", "data":dict_to_send}))
+          elif (sample[0] == "predictions"):
+            received = time.time()
+            dict_to_send = json.loads(sample[1])
+            # The trace of the prediction is only for the latency measurements:
+            trace = dict_to_send.pop("trace", None)
+            on_sent = None if trace is None else functools.partial(latency_tracker.record_prediction, trace, received)
+            send_to_admins(json.dumps({"type": "prediction", "data":dict_to_send}), on_sent)
+            print("Prediction from calculate: ", sample[1])
       
-      elif (sample[0] == "status_fitting"):
-        dict_to_send = json.loads(sample[1])
-        send_to_admins(json.dumps({"type": "status_fitting", "data":dict_to_send}))
-
-        # Set new status based on what we want to do after fitting model. 3 corresponds to READY.
-        if int(sample[1]) == 1:
-          print("Fitting ongoing...")
-        if int(sample[1]) == 2:
-          print("Fitting ready, move to status READY.")
-          ts = time.time() #convert from ms to s to match time.time() format
-          LSLOutletStatus.push_sample(["status", str(3)], ts)
-
+          elif (sample[0] == "status_fitting"):
+            dict_to_send = json.loads(sample[1])
+            send_to_admins(json.dumps({"type": "status_fitting", "data":dict_to_send}))
+
+            # Set new status based on what we want to do after fitting model. 3 corresponds to READY.
+            if int(sample[1]) == 1:
+              print("Fitting ongoing...")
+            if int(sample[1]) == 2:
+              print("Fitting ready, move to status READY.")
+              ts = time.time() #convert from ms to s to match time.time() format
+              LSLOutletStatus.push_sample(["status", str(3)], ts)
+      except RuntimeError as e:
+        # pylsl.LostError
+        logging.warning("### Lost the ml_results stream (%s) at %s, looking for it again." % (e, datetime.datetime.now()))
     logging.info("### Ending LSL2 thread at %s" % datetime.datetime.now())
   except KeyboardInterrupt as e:
     logging.info("### Ending LSL2 thread at %s" % datetime.datetime.now())
@@ -380,31 +395,29 @@ def plot_graph_event():
 
   seconds_to_use = 2.0
   nof_samples_to_use = int(seconds_to_use * EEG_samplerate)
-  if len(collected_EEG_timestamps) < (nof_samples_to_use):
+  if len(EEG_store) < (nof_samples_to_use):
     logging.warning("Not enough EEG data to make a plot")
     return ""
   # Create a numpy buffer of the last X seconds of EEG:
   with EEG_data_lock:
-    nof_samples = len(collected_EEG_timestamps)
-    start_sample = nof_samples - nof_samples_to_use - int(100 * random.random())
+    nof_samples = len(EEG_store)
+    start_sample = max(nof_samples - nof_samples_to_use - int(100 * random.random()), 0)
     #start_sample = nof_samples - nof_samples_to_use
     logging.info("nof_samples=%d" % nof_samples)
-    the_EEG = collected_EEG[(8*(start_sample)):(8*(start_sample + nof_samples_to_use))]
-    the_EEG_timestamps = collected_EEG_timestamps[(start_sample):(start_sample + nof_samples_to_use)]
-    the_EEG_LSL_timestamps = collected_EEG_LSL_timestamps[(start_sample):(start_sample + nof_samples_to_use)]
-    the_EEG_time_corrections = collected_EEG_time_corrections[(start_sample):(start_sample + nof_samples_to_use)]
+    # Copy the slices, since the store can change once the lock is released:
+    the_EEG, the_EEG_timestamps, the_EEG_LSL_timestamps, the_EEG_time_corrections = [np.array(column) for column in EEG_store.slice(start_sample, start_sample + nof_samples_to_use)]
 
   #3. Create a numpy buffer with the EEG data
   # The correct unit for mne is volts.
   # the Crown is giving us EEG measurements in nV, so multiply by 1e-9
 
   # This is the wrong way around:
-  the_EEG_np = np.asarray(the_EEG).reshape((nof_samples_to_use,8)) * 1e-9
+  the_EEG_np = the_EEG * 1e-9
   the_EEG_np = the_EEG_np.T
 
-  the_EEG_timestamps_np = np.asarray(the_EEG_timestamps)
-  the_EEG_LSL_timestamps_np = np.asarray(the_EEG_LSL_timestamps)
-  the_EEG_time_corrections_np = np.asarray(the_EEG_time_corrections)
+  the_EEG_timestamps_np = the_EEG_timestamps
+  the_EEG_LSL_timestamps_np = the_EEG_LSL_timestamps
+  the_EEG_time_corrections_np = the_EEG_time_corrections
 
   channel_labels = ["CP3", "C3", "F5", "PO3", "PO4", "F6", "C4", "CP4"]
   logging.info("the_EEG_np shape %dx%d" % np.shape(the_EEG_np))
@@ -493,9 +506,8 @@ async def admin_consumer_handler(websocket):
         LSLOutletMarkers.push_sample([event["action"],repr(9999)], ts)
         log_marker(9999, event["timestamp"])
         end_trial(event['timestamp'], 999)
-        with EEG_data_lock:
-          write_marker_to_disk()
-          print("Flushed the markers at the end of a trial\n")
+        write_marker_to_disk()
+        print("Flushed the markers at the end of a trial\n")
       elif event["action"] == "pling":
         logging.debug("### pling from admin")  
       elif event["action"] == "accumulate":
@@ -526,17 +538,20 @@ async def admin_consumer_handler(websocket):
     send_to_clients(users_event())
     send_to_admins(users_event())
 
-def send_to_admins(json_message):
+# on_sent, if given, is called with the time.time() when the message has been broadcast
+def send_to_admins(json_message, on_sent=None):
   global admin_queue
   if admin_queue != False:
-    admin_queue.sync_q.put(json_message)
+    admin_queue.sync_q.put((json_message, on_sent))
 
 async def admin_producer_handler(websocket):
   global admin_queue
   try:
     while True:
-      message = await admin_queue.async_q.get()
+      message, on_sent = await admin_queue.async_q.get()
       websockets.broadcast(ADMINS, message)
+      if on_sent is not None:
+        on_sent(time.time())
   finally:
     print("Got Error:")
     print(websocket)
@@ -583,7 +598,7 @@ def admin_thread():
 client_queue = False
 
 async def client_consumer_handler(websocket):
-  global CLIENTS, VALUE, COMPUTES, LSLOutletMarkers, not_yet_sent_to_client_EEG, collected_EEG_timestamps
+  global CLIENTS, VALUE, COMPUTES, LSLOutletMarkers, not_yet_sent_to_client_EEG, EEG_store
   try:
     # We come here when a new client is connecting:
     print("client client connecting")
@@ -612,15 +627,17 @@ async def client_consumer_handler(websocket):
           send_to_clients(the_json)
           send_to_admins(the_json)
           # Push eeg_status data to ADMINS:
-          send_to_admins(json.dumps({"type": "eeg_status", "nof_eeg_samples": len(collected_EEG_timestamps)}))
+          send_to_admins(json.dumps({"type": "eeg_status", "nof_eeg_samples": len(EEG_store), "disk_writer": EEG_writer.stats(), "latency": latency_tracker.stats()}))
         #event = plot_graph_event();
         #send_to_clients(poll_event(event))
       elif event["action"] == "show":
+        show_received = time.time()
         # The subject now started to look at the stimuli we setup before.
         # Push LSL marker to outlet.
         logging.info(event)
         ts = event["timestamp"]/1000.0 #convert from ms to s to match time.time() format
         LSLOutletMarkers.push_sample([event["action"],repr(event["marker_id"])], ts)
+        latency_tracker.record_show(event["timestamp"], show_received, time.time())
         log_marker(event["marker_id"], event["timestamp"])
         # Select the stimuli_no to show next in the client:
         stimuli_no = get_next_stimuli()
@@ -715,7 +732,7 @@ def client_thread():
 
 def poll_event(event):
   return event
-  #return json.dumps({"type": "status", "value": len(collected_EEG_timestamps)})
+  #return json.dumps({"type": "status", "value": len(EEG_store)})
 
 
 # Compute websocket implementation, inspired by
@@ -829,15 +846,16 @@ if __name__ == "__main__":
       log.append(row)
       with open(session_log_filename, 'w') as f:
         ok = f.write(row)
-  else:
+  # The last trial number comes from the catalog. The first time, the catalog is built from the session log:
+  new_catalog = not os.path.exists(session_catalog_filename)
+  catalog = trial_catalog.TrialCatalog(session_catalog_filename)
+  EEG_writer.catalog = catalog
+  if new_catalog:
+    logging.info("Building the trial catalog '%s' from the session log." % session_catalog_filename)
     with log_lock:
-      with open(session_log_filename, 'r') as f:
-        for row in f:
-          log.append(row)
-          result = re.match('^T([0-9]{4})_', row)
-          if result:
-            trial_no = int(result.group(1))
-  logging.info("There are %d rows in the trial log file '%s'." % (len(log), session_log_filename))
+      logging.info("Imported %d rows of the session log '%s'." % (catalog.import_session_log(session_log_filename), session_log_filename))
+  trial_no = catalog.last_trial_no()
+  logging.info("There are %d trials in the trial catalog '%s'." % (len(catalog), session_catalog_filename))
   logging.info("The last trial number was T%04d." % trial_no)
   # Let the LSL thread write the session information into the session log
 
@@ -851,6 +869,9 @@ if __name__ == "__main__":
     logging.info("### Grabbing EEG data from previous session no %d" % from_trial_no)
     load_EEG_from_disk(from_trial_no)
   else:
+    logging.info("### Starting the disk writer thread at %s" % datetime.datetime.now())
+    EEG_writer.start()
+
     logging.info("### Setting up LSL thread at %s" % datetime.datetime.now())
     thread = threading.Thread(target=lsl_thread, args=(1,))
     # Thread will not prevent main function to exit. Exit anytime when thread is daemon:
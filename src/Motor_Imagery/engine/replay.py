@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+import os
+import time
+import logging
+import argparse
+import numpy as np
+import pylsl
+import trial_catalog
+import trial_reader
+
+# Replay of recorded trials over LSL, so the Timeflux graphs (preprocessing, epochs, ML and predictions)
+# can be run on real recordings without a headset and without a subject.
+#
+# The EEG of the trials, data/T%04d_*.bin (see trial_writer.py), is published as an EEG stream and the
+# markers as a MarkerStream with the same [label, data] channels as the engine. So run this instead of
+# the engine (whose MarkerStream outlet would have the same name), with the graphs of calculate/.
+#
+#   python replay.py 12 13            # Trials 12 and 13 at the recorded speed
+#   python replay.py --speed 10 12    # 10 times faster
+#   python replay.py --speed 0 12     # As fast as possible
+#   python replay.py --user 3         # All the trials of user 3 in the trial catalog
+#
+# The samples and the markers are pushed with their recorded spacing, on the time.time() scale (as the
+# client timestamps), whatever the speed. So the timestamps seen by the graphs are the same at any
+# speed, only the wall clock time to get them changes. The trials are pushed one after the other.
+#
+# The marker files only have the marker ids, not the action of the client that gave them. The action
+# ('show', 'unshow', 'start', ...) is found from the ids, see marker_label().
+
+logging.basicConfig(level=logging.INFO)
+
+# The action of the client that gave a marker (or None for the markers the engine doesn't send over LSL),
+# from the ranges of marker ids used by the client and the engine:
+def marker_label(marker_id):
+  marker_id = int(marker_id)
+  if marker_id == 998:
+    return "calibrate"
+  if 1000 <= marker_id < 2000:
+    return "show" # 1000 + the stimulus shown
+  if 2000 <= marker_id < 3000:
+    return "unshow" # 2000 + the stimulus removed
+  if marker_id == 3000:
+    return "stop"
+  if marker_id == 4000:
+    return "pause"
+  if 8000 < marker_id < 8998:
+    return "show_calibrate"
+  if 4000 < marker_id < 9000:
+    return None # 4000 + user_no, logged when the first EEG of a trial is received
+  if 9000 <= marker_id < 9999:
+    return "end" # 9000 + correct_category
+  if marker_id == 9999:
+    return "cancel"
+  return "start" # The user_no
+
+# The same outlet as setup_lsl_outlet() in the engine
+def setup_marker_outlet(name):
+  info = pylsl.StreamInfo(name=name, type="Markers", channel_count=2, nominal_srate=0, channel_format="string", source_id="GameEngine")
+  chns = info.desc().append_child("channels")
+  for label in ["label", "data"]:
+    ch = chns.append_child("channel")
+    ch.append_child_value("label", label)
+    ch.append_child_value("unit", "misc")
+    ch.append_child_value("type", "marker")
+  return pylsl.StreamOutlet(info)
+
+def setup_EEG_outlet(name, channels, rate, channel_format="double64"):
+  info = pylsl.StreamInfo(name=name, type="EEG", channel_count=len(channels), nominal_srate=rate, channel_format=channel_format, source_id=name)
+  chns = info.desc().append_child("channels")
+  for label in channels:
+    ch = chns.append_child("channel")
+    ch.append_child_value("label", label)
+    ch.append_child_value("unit", "microvolts")
+    ch.append_child_value("type", "EEG")
+  return pylsl.StreamOutlet(info)
+
+# The sample rate of a trial, from the manifest or from the timestamps
+def trial_rate(reader):
+  if reader.rate:
+    return reader.rate
+  timestamps = np.array(reader.EEG_LSL_timestamps[:1024])
+  if len(timestamps) < 2:
+    return 256.0
+  return float(1.0 / np.median(np.diff(timestamps)))
+
+# The local clock times of the samples start to stop (the LSL timestamps are on the clock of the headset)
+def EEG_times(reader, start, stop):
+  return np.asarray(reader.EEG_LSL_timestamps[start:stop]) + np.asarray(reader.EEG_time_corrections[start:stop])
+
+# Push a trial. The recorded time t is pushed with the timestamp origin + t - t0.
+# Returns the last timestamp pushed.
+def replay_trial(reader, EEG_outlet, marker_outlet, speed, chunk_size, origin):
+  # The marker timestamps are on the local clock as well:
+  marker_times = np.asarray(reader.marker_timestamps)
+  marker_ids = np.asarray(reader.marker)
+  labels = [marker_label(marker_id) for marker_id in marker_ids]
+  t0 = EEG_times(reader, 0, 1)[0]
+  if len(marker_times) > 0:
+    t0 = min(t0, marker_times[0])
+  start_time = time.monotonic()
+  next_marker = 0
+  last_stamp = origin
+  for start in range(0, len(reader), chunk_size):
+    stop = min(start + chunk_size, len(reader))
+    times = EEG_times(reader, start, stop)
+    if speed > 0:
+      delay = start_time + (times[-1] - t0) / speed - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+    # The markers up to the end of this chunk go first:
+    while next_marker < len(marker_times) and marker_times[next_marker] <= times[-1]:
+      if labels[next_marker] is not None:
+        marker_outlet.push_sample([labels[next_marker], repr(int(marker_ids[next_marker]))], origin + marker_times[next_marker] - t0)
+      next_marker += 1
+    # The timestamps of the other samples of the chunk are derived from the rate of the stream:
+    last_stamp = origin + times[-1] - t0
+    EEG_outlet.push_chunk(np.array(reader.EEG[start:stop], dtype=np.float64), last_stamp)
+  for i in range(next_marker, len(marker_times)):
+    if labels[i] is not None:
+      last_stamp = max(last_stamp, origin + marker_times[i] - t0)
+      marker_outlet.push_sample([labels[i], repr(int(marker_ids[i]))], last_stamp)
+  return last_stamp
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Replay recorded trials over LSL.")
+  parser.add_argument("trials", type=int, nargs="*", help="The trial numbers. Default: all the trials of the trial catalog.")
+  parser.add_argument("--user", type=int, help="Replay the trials of this user_no, from the trial catalog.")
+  parser.add_argument("--speed", type=float, default=1.0, help="1 for the recorded speed, N for N times faster, 0 for as fast as possible.")
+  parser.add_argument("--chunk-size", type=int, default=32, help="The number of samples pushed at once.")
+  parser.add_argument("--loop", action="store_true", help="Replay the trials again and again.")
+  parser.add_argument("--name", default="Replay", help="The name of the EEG stream.")
+  parser.add_argument("--channels", nargs="+", help="The channel names, for the trials recorded without them.")
+  parser.add_argument("--nof-channels", type=int, default=8, help="The number of channels of the trials recorded without a manifest.")
+  parser.add_argument("--wait", type=float, default=10.0, help="How long (s) to wait for the graphs to connect before starting.")
+  parser.add_argument("--folder", default="data")
+  parser.add_argument("--catalog", default="session_catalog.sqlite")
+  args = parser.parse_args()
+
+  trial_nos = args.trials
+  if not trial_nos:
+    if not os.path.exists(args.catalog):
+      parser.error("No trial numbers and no trial catalog '%s'." % args.catalog)
+    catalog = trial_catalog.TrialCatalog(args.catalog)
+    conditions = {} if args.user is None else {"user_no": args.user}
+    trial_nos = [trial["trial_no"] for trial in catalog.trials(**conditions)]
+  readers = [trial_reader.TrialReader(trial_no, args.folder, nof_channels=args.nof_channels) for trial_no in trial_nos]
+  readers = [reader for reader in readers if len(reader) > 0]
+  if not readers:
+    parser.error("No trial with EEG to replay.")
+
+  # The stream is set up from the first trial:
+  first = readers[0]
+  channels = args.channels or first.channels
+  if not channels or len(channels) != first.nof_channels or "" in channels:
+    channels = [str(i + 1) for i in range(first.nof_channels)]
+  rate = trial_rate(first)
+  logging.info("### Replaying %d trials with %d channels at %g Hz, speed %s" % (len(readers), len(channels), rate, args.speed or "as fast as possible"))
+  EEG_outlet = setup_EEG_outlet(args.name, channels, rate)
+  marker_outlet = setup_marker_outlet("MarkerStream")
+  for outlet in (EEG_outlet, marker_outlet):
+    if not outlet.wait_for_consumers(args.wait):
+      logging.warning("### No consumer of the %s stream after %g s, starting anyway." % (outlet.get_info().name(), args.wait))
+
+  last_stamp = 0.0
+  while True:
+    for reader in readers:
+      if reader.nof_channels != len(channels):
+        logging.warning("### Skipping T%04d, it has %d channels." % (reader.trial_no, reader.nof_channels))
+        continue
+      # The timestamps go on from the previous trial:
+      origin = max(time.time(), last_stamp + 1.0 / rate)
+      start = time.monotonic()
+      last_stamp = replay_trial(reader, EEG_outlet, marker_outlet, args.speed, args.chunk_size, origin)
+      elapsed = time.monotonic() - start
+      duration = last_stamp - origin
+      logging.info("Replayed T%04d: %d samples, %d markers, %.1f s of EEG in %.1f s (%.1fx)" % (reader.trial_no, len(reader), reader.nof_markers, duration, elapsed, duration / max(elapsed, 1e-9)))
+    if not args.loop:
+      break
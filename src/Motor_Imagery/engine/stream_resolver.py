@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import logging
+import pylsl
+
+# Resolution of the LSL streams that the engine reads (the EEG and the ml_results).
+#
+# pylsl.resolve_stream() waits for ever, so an LSL thread that is looking for a stream can't be
+# stopped, and once the stream is found, a headset that disconnects and reconnects is never read
+# again. Instead, the streams are looked for with a timeout, again and again until one is found or
+# should_stop() is true, and the inlets are opened with recover=False: when the stream is lost, the
+# pull functions raise pylsl.LostError (a RuntimeError), and the LSL threads look for the stream
+# again with open_inlet().
+
+RESOLVE_TIMEOUT = 1.0 # How long (s) each resolve waits for the stream
+INFO_TIMEOUT = 5.0 # How long (s) to wait for the full stream info (with the channel names)
+
+# Find a stream with the property prop == value and open an inlet to it.
+# Returns (inlet, info), with the full info of the stream, or (None, None) if should_stop() became
+# true first. inlet_args are passed to the StreamInlet, e.g. max_buflen or processing_flags.
+def open_inlet(prop, value, should_stop, **inlet_args):
+  while not should_stop():
+    streams = pylsl.resolve_byprop(prop, value, timeout=RESOLVE_TIMEOUT)
+    if len(streams) == 0:
+      continue
+    if len(streams) > 1:
+      logging.warning("### Number of streams with %s=%s is > 1, picking the first one." % (prop, value))
+    else:
+      logging.info("### Found the stream with %s=%s." % (prop, value))
+    inlet = pylsl.StreamInlet(streams[0], recover=False, **inlet_args)
+    try:
+      return inlet, inlet.info(timeout=INFO_TIMEOUT)
+    except RuntimeError as e:
+      # pylsl.TimeoutError or pylsl.LostError, the stream is gone already
+      logging.warning("### Could not open the stream with %s=%s: %s" % (prop, value, e))
+  return None, None
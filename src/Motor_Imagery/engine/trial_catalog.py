@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import re
+import json
+import sqlite3
+import threading
+
+# Catalog of the recorded trials, kept in an SQLite database next to the session log.
+#
+# There is one row per trial, updated when the trial is started, stopped and ended, and when its files
+# are written (see TrialWriter). So the last trial number is found with one query at startup, instead
+# of reading the whole session log, and the trials to analyse or train on can be selected with
+# trials(), e.g. trials(user_no=3, correct_category=2), instead of parsing the log or the file names.
+#
+# The session log is still written as before, it remains the reference. A catalog can be (re)built
+# from it with import_session_log(), which is done at startup when there is no catalog yet.
+#
+# The database is in WAL mode with synchronous=NORMAL, so an update doesn't wait for the disk.
+# All the accesses go through one connection, protected by a lock, so the catalog can be used from
+# the websocket handlers and from the disk writer thread.
+
+COLUMNS = [
+  ("trial_no", "INTEGER PRIMARY KEY"),
+  ("user_no", "INTEGER"),
+  ("start_timestamp", "TEXT"), # The timestamps sent by the client
+  ("start_date", "TEXT"), # The local dates, as in the session log
+  ("stop_timestamp", "TEXT"),
+  ("stop_date", "TEXT"),
+  ("end_timestamp", "TEXT"),
+  ("end_date", "TEXT"),
+  ("correct_category", "TEXT"),
+  ("files", "TEXT"), # JSON: column name -> file name
+  ("nof_channels", "INTEGER"),
+  ("nof_samples", "INTEGER"),
+  ("nof_markers", "INTEGER"),
+]
+
+class TrialCatalog:
+
+  def __init__(self, filename="session_catalog.sqlite"):
+    self.filename = filename
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(filename, check_same_thread=False)
+    self.connection.row_factory = sqlite3.Row
+    with self.lock, self.connection:
+      self.connection.execute("PRAGMA journal_mode=WAL")
+      self.connection.execute("PRAGMA synchronous=NORMAL")
+      self.connection.execute("CREATE TABLE IF NOT EXISTS trials (%s)" % ", ".join("%s %s" % column for column in COLUMNS))
+      self.connection.execute("CREATE INDEX IF NOT EXISTS trials_user_no ON trials (user_no)")
+
+  def __len__(self):
+    with self.lock:
+      return self.connection.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+
+  # The highest trial number, 0 if there is no trial
+  def last_trial_no(self):
+    with self.lock:
+      return self.connection.execute("SELECT COALESCE(MAX(trial_no), 0) FROM trials").fetchone()[0]
+
+  def start(self, trial_no, user_no, timestamp, date):
+    self.update(trial_no, user_no=user_no, start_timestamp=str(timestamp), start_date=date)
+
+  def stop(self, trial_no, timestamp, date):
+    self.update(trial_no, stop_timestamp=str(timestamp), stop_date=date)
+
+  def end(self, trial_no, timestamp, date, correct_category):
+    self.update(trial_no, end_timestamp=str(timestamp), end_date=date, correct_category=str(correct_category))
+
+  # Called by the TrialWriter when the files of a trial are opened and closed
+  def set_files(self, trial_no, files, nof_channels, nof_samples, nof_markers):
+    self.update(trial_no, files=json.dumps(files), nof_channels=nof_channels, nof_samples=nof_samples, nof_markers=nof_markers)
+
+  # Set some fields of a trial, adding the trial if needed
+  def update(self, trial_no, **fields):
+    names = list(fields)
+    with self.lock, self.connection:
+      self.connection.execute("INSERT OR IGNORE INTO trials (trial_no) VALUES (?)", (trial_no,))
+      if names:
+        self.connection.execute("UPDATE trials SET %s WHERE trial_no = ?" % ", ".join("%s = ?" % name for name in names), [fields[name] for name in names] + [trial_no])
+
+  def trial(self, trial_no):
+    trials = self.trials(trial_no=trial_no)
+    return trials[0] if trials else None
+
+  # The trials (as dicts) whose fields have the given values, in trial number order.
+  # A value can also be a list of values, e.g. trials(user_no=[1, 2]).
+  def trials(self, **conditions):
+    where = []
+    values = []
+    for name, value in conditions.items():
+      if name not in dict(COLUMNS):
+        raise ValueError("Unknown trial field '%s'" % name)
+      if isinstance(value, (list, tuple, set)):
+        value = list(value)
+        where.append("%s IN (%s)" % (name, ", ".join("?" * len(value))))
+        values += value
+      else:
+        where.append("%s = ?" % name)
+        values.append(value)
+    query = "SELECT * FROM trials"
+    if where:
+      query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY trial_no"
+    with self.lock:
+      rows = self.connection.execute(query, values).fetchall()
+    trials = [dict(row) for row in rows]
+    for trial in trials:
+      trial["files"] = json.loads(trial["files"]) if trial["files"] else {}
+    return trials
+
+  # Add the trials of a session log (the rows written by start_trial, stop_trial and end_trial).
+  # Returns the number of rows imported.
+  def import_session_log(self, filename):
+    nof_rows = 0
+    with open(filename, 'r') as f:
+      for row in f:
+        result = re.match(r"^T([0-9]{4})_start @([0-9]+) timestamp=(.*) date='(.*)'$", row.rstrip("\n"))
+        if result:
+          self.start(int(result.group(1)), int(result.group(2)), result.group(3), result.group(4))
+          nof_rows += 1
+          continue
+        result = re.match(r"^T([0-9]{4})_stop timestamp=(.*) date='(.*)'$", row.rstrip("\n"))
+        if result:
+          self.stop(int(result.group(1)), result.group(2), result.group(3))
+          nof_rows += 1
+          continue
+        result = re.match(r"^T([0-9]{4})_end correct_category='(.*)' timestamp=(.*) date='(.*)'$", row.rstrip("\n"))
+        if result:
+          self.end(int(result.group(1)), result.group(3), result.group(4), result.group(2))
+          nof_rows += 1
+          continue
+        result = re.match(r"^T([0-9]{4})_", row)
+        if result:
+          # E.g. a marker, only make sure the trial is known
+          self.update(int(result.group(1)))
+          nof_rows += 1
+    return nof_rows
+
+  def close(self):
+    with self.lock:
+      self.connection.close()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import os
+import json
+import numpy as np
+
+from trial_writer import EEG_COLUMNS, MARKER_COLUMNS
+
+# Reader for the raw data of a recorded trial, i.e. the data/T%04d_<column>.bin files written by the
+# TrialWriter (or by older versions of the engine).
+#
+# The files are opened with np.memmap, so nothing is read until it is used and a multi-hour trial
+# does not have to fit in memory. The columns are numpy views of the files: the EEG column has the
+# shape (nof_samples, nof_channels) and the other columns are 1D. Slicing a column (or using
+# EEG_slice() and marker_slice() to select a time range) gives views as well, the data is only read
+# from disk when the values are used.
+#
+# The number of channels is taken from the manifest of the trial, data/T%04d_manifest.json, if there
+# is one, and from the nof_channels argument otherwise (for the trials recorded before the manifest).
+# The channel names and the sample rate of the stream are also taken from the manifest (None for the
+# trials recorded before they were saved). Missing or empty files give empty columns. The views are
+# read-only.
+#
+# The numbers of rows are taken from the sizes of the files, not from the manifest: the manifest of a
+# trial that is being written (or that was interrupted by a crash) is only updated from time to time,
+# so its numbers of rows are a lower bound.
+
+class TrialReader:
+
+  def __init__(self, trial_no, folder="data", nof_channels=8):
+    self.trial_no = trial_no
+    self.folder = folder
+    self.nof_channels = nof_channels
+    self.channels = None
+    self.rate = None
+    manifest_filename = os.path.join(folder, "T%04d_manifest.json" % trial_no)
+    if os.path.exists(manifest_filename):
+      with open(manifest_filename) as f:
+        manifest = json.load(f)
+      if manifest.get("nof_channels"):
+        self.nof_channels = manifest["nof_channels"]
+      self.channels = manifest.get("channels")
+      self.rate = manifest.get("rate")
+    self.columns = {}
+    for column in EEG_COLUMNS + MARKER_COLUMNS:
+      self.columns[column] = self._map(self.filename(column), (self.nof_channels,) if column == "EEG" else ())
+    # The EEG and timestamp files are flushed separately, so the last chunk can be in some files only:
+    self.nof_samples = min(len(self.columns[column]) for column in EEG_COLUMNS)
+    self.nof_markers = min(len(self.columns[column]) for column in MARKER_COLUMNS)
+    for column in EEG_COLUMNS:
+      self.columns[column] = self.columns[column][:self.nof_samples]
+    for column in MARKER_COLUMNS:
+      self.columns[column] = self.columns[column][:self.nof_markers]
+
+  def __len__(self):
+    return self.nof_samples
+
+  def __getitem__(self, column):
+    return self.columns[column]
+
+  def filename(self, column):
+    return os.path.join(self.folder, "T%04d_%s.bin" % (self.trial_no, column))
+
+  @property
+  def EEG(self):
+    return self.columns["EEG"]
+
+  @property
+  def EEG_timestamps(self):
+    return self.columns["EEG_timestamps"]
+
+  @property
+  def EEG_LSL_timestamps(self):
+    return self.columns["EEG_LSL_timestamps"]
+
+  @property
+  def EEG_time_corrections(self):
+    return self.columns["EEG_time_corrections"]
+
+  @property
+  def marker(self):
+    return self.columns["marker"]
+
+  @property
+  def marker_timestamps(self):
+    return self.columns["marker_timestamps"]
+
+  @property
+  def marker_LSL_timestamps(self):
+    return self.columns["marker_LSL_timestamps"]
+
+  # Index range [start, stop) of the rows whose timestamp is in [from_time, to_time). The timestamps
+  # are assumed to be increasing, which is the case for the local clock and the LSL timestamps.
+  def index_range(self, timestamps, from_time=None, to_time=None):
+    start = 0 if from_time is None else int(np.searchsorted(timestamps, from_time, side='left'))
+    stop = len(timestamps) if to_time is None else int(np.searchsorted(timestamps, to_time, side='left'))
+    return start, max(start, stop)
+
+  # Views of the EEG columns between from_time and to_time, as a dict of column name -> view.
+  # time_column is the column used to select the samples (EEG_timestamps or EEG_LSL_timestamps).
+  def EEG_slice(self, from_time=None, to_time=None, time_column="EEG_timestamps"):
+    start, stop = self.index_range(self.columns[time_column], from_time, to_time)
+    return {column: self.columns[column][start:stop] for column in EEG_COLUMNS}
+
+  # Views of the marker columns between from_time and to_time (see EEG_slice).
+  def marker_slice(self, from_time=None, to_time=None, time_column="marker_timestamps"):
+    start, stop = self.index_range(self.columns[time_column], from_time, to_time)
+    return {column: self.columns[column][start:stop] for column in MARKER_COLUMNS}
+
+  # Map a file as an array of nof_rows x row_shape
+  def _map(self, filename, row_shape):
+    row_size = 8 * int(np.prod(row_shape))
+    nof_rows = os.path.getsize(filename) // row_size if os.path.exists(filename) else 0
+    if nof_rows == 0:
+      # np.memmap can't map an empty file
+      return np.empty((0,) + row_shape, dtype='<f8')
+    return np.memmap(filename, dtype='<f8', mode='r', shape=(nof_rows,) + row_shape)
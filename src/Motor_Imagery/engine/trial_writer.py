@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import logging
+import queue
+import threading
+import numpy as np
+
+# Writer for the raw data of a trial.
+#
+# Each column is appended to its own file, data/T%04d_<column>.bin, as little-endian float64 with
+# one row after the other (a row of the EEG column has one value per channel). These are the same
+# files as before, so old and new trials are read the same way.
+#
+# The files of the current trial are kept open, and numpy arrays are written to them directly with
+# tofile(), so no format strings or Python lists are involved. A small manifest,
+# data/T%04d_manifest.json, describes the columns (file, width and number of rows). It is written
+# when the files of a trial are opened and when they are closed, and during the trial at most once
+# every manifest_interval seconds (and after each fsync), replacing the previous manifest atomically.
+# The numbers of rows of a trial being written (or of a trial interrupted by a crash) are therefore
+# a lower bound: the TrialReader takes the numbers of rows from the sizes of the files. The manifest
+# also has the channel names and the sample rate of the EEG stream, if they are given with
+# set_stream().
+#
+# The writer has its own lock, so it can be used from several threads without holding the
+# EEG_data_lock while writing.
+#
+# After start(), the writing is done by a background thread: submit() only puts the buffers in a
+# queue and returns, so a slow disk never stalls the LSL acquisition. Optionally, the files are
+# fsync'ed at most once every fsync_interval seconds. stats() gives the queue depth and the write
+# latencies, to see if the disk keeps up. A batch that can't be written (e.g. the disk is full) is
+# logged and counted in stats() as a failed batch, and the thread goes on with the next batches.
+#
+# If a TrialCatalog is given, the files and the number of rows of the trial are also recorded in it,
+# at the same time as the manifest (so with the same lower bound).
+
+EEG_COLUMNS = ["EEG", "EEG_timestamps", "EEG_LSL_timestamps", "EEG_time_corrections"]
+MARKER_COLUMNS = ["marker", "marker_timestamps", "marker_LSL_timestamps"]
+
+class TrialWriter:
+
+  def __init__(self, folder="data", fsync_interval=None, catalog=None, manifest_interval=1.0):
+    self.folder = folder
+    self.catalog = catalog
+    self.fsync_interval = fsync_interval # In seconds, None to never fsync (except when closing)
+    self.manifest_interval = manifest_interval # In seconds, None to only write the manifest when opening and closing
+    self.trial_no = None
+    self.nof_channels = None
+    self.channels = None # The channel names of the EEG stream, see set_stream()
+    self.rate = None # The nominal sample rate of the EEG stream
+    self.files = {}
+    self.nof_rows = {}
+    self.lock = threading.Lock()
+    self.queue = None
+    self.thread = None
+    self.last_fsync = time.monotonic()
+    self.last_manifest = time.monotonic()
+    # Counters:
+    self.max_queue_depth = 0
+    self.nof_batches = 0
+    self.nof_failed_batches = 0
+    self.last_error = None
+    self.last_write_time = 0.0 # Time (s) to write the last batch
+    self.max_write_time = 0.0
+    self.last_latency = 0.0 # Time (s) from submit() until the last batch was written
+    self.max_latency = 0.0
+
+  # The channel names and the nominal sample rate of the EEG stream, for the manifest.
+  def set_stream(self, channels, rate):
+    with self.lock:
+      self.channels = list(channels)
+      self.rate = rate
+
+  # Start the background writer thread.
+  def start(self):
+    self.queue = queue.Queue()
+    self.thread = threading.Thread(target=self._run, args=(), daemon=True)
+    self.thread.start()
+
+  # Write the columns in the background if the writer thread is started, and right away otherwise.
+  # The arrays must not be modified afterwards.
+  def submit(self, trial_no, nof_channels, columns):
+    if self.queue is None:
+      self.write(trial_no, nof_channels, columns)
+      return
+    self.queue.put((time.monotonic(), trial_no, nof_channels, columns))
+    self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+  def stats(self):
+    return {
+      "queue_depth": 0 if self.queue is None else self.queue.qsize(),
+      "max_queue_depth": self.max_queue_depth,
+      "nof_batches": self.nof_batches,
+      "nof_failed_batches": self.nof_failed_batches,
+      "last_error": self.last_error,
+      "last_write_ms": 1000 * self.last_write_time,
+      "max_write_ms": 1000 * self.max_write_time,
+      "last_latency_ms": 1000 * self.last_latency,
+      "max_latency_ms": 1000 * self.max_latency,
+    }
+
+  def filename(self, column, trial_no=None):
+    if trial_no is None:
+      trial_no = self.trial_no
+    return os.path.join(self.folder, "T%04d_%s.bin" % (trial_no, column))
+
+  def manifest_filename(self, trial_no=None):
+    if trial_no is None:
+      trial_no = self.trial_no
+    return os.path.join(self.folder, "T%04d_manifest.json" % trial_no)
+
+  # Append the columns (a dict of column name -> array) to the files of the trial.
+  # The files of a new trial are opened (and the ones of the previous trial closed) when needed.
+  def write(self, trial_no, nof_channels, columns):
+    with self.lock:
+      if trial_no != self.trial_no:
+        self._close()
+        self._open(trial_no, nof_channels)
+      for column, values in columns.items():
+        values = np.ascontiguousarray(values, dtype='<f8')
+        if values.size == 0:
+          continue
+        values.tofile(self.files[column])
+        self.nof_rows[column] += len(values)
+      for column in columns:
+        self.files[column].flush()
+      if self.fsync_interval is not None and time.monotonic() - self.last_fsync >= self.fsync_interval:
+        self._fsync()
+        self._write_manifest() # With the rows that are on disk for sure
+      elif self.manifest_interval is not None and time.monotonic() - self.last_manifest >= self.manifest_interval:
+        self._write_manifest()
+
+  # Stop the writer thread once everything submitted is written, and close the files.
+  def close(self):
+    if self.thread is not None:
+      self.queue.put(None)
+      self.thread.join()
+      self.thread = None
+      self.queue = None
+    with self.lock:
+      self._close()
+
+  def _run(self):
+    while True:
+      batch = self.queue.get()
+      if batch is None:
+        return
+      submitted, trial_no, nof_channels, columns = batch
+      start = time.monotonic()
+      try:
+        self.write(trial_no, nof_channels, columns)
+      except Exception as e:
+        # Keep the thread alive, the next batches may be written (e.g. once some disk space is freed)
+        logging.exception("### Could not write a batch of trial %s to disk" % trial_no)
+        self.nof_failed_batches += 1
+        self.last_error = repr(e)
+        continue
+      done = time.monotonic()
+      self.nof_batches += 1
+      self.last_write_time = done - start
+      self.max_write_time = max(self.max_write_time, self.last_write_time)
+      self.last_latency = done - submitted
+      self.max_latency = max(self.max_latency, self.last_latency)
+
+  def _fsync(self):
+    for f in self.files.values():
+      os.fsync(f.fileno())
+    self.last_fsync = time.monotonic()
+
+  def _open(self, trial_no, nof_channels):
+    try:
+      for column in EEG_COLUMNS + MARKER_COLUMNS:
+        filename = self.filename(column, trial_no)
+        # Append, in case some data of this trial is already on disk (e.g. after a restart)
+        self.files[column] = open(filename, 'ab')
+        width = nof_channels if column == "EEG" else 1
+        self.nof_rows[column] = os.path.getsize(filename) // (8 * width)
+    except OSError:
+      # The trial is only set once all its files are open, so the next batch tries again
+      for f in self.files.values():
+        f.close()
+      self.files = {}
+      self.nof_rows = {}
+      raise
+    self.trial_no = trial_no
+    self.nof_channels = nof_channels
+    self._write_manifest()
+
+  def _close(self):
+    if self.trial_no is None:
+      return
+    if self.fsync_interval is not None:
+      self._fsync()
+    for f in self.files.values():
+      f.close()
+    self._write_manifest()
+    self.files = {}
+    self.nof_rows = {}
+    self.trial_no = None
+
+  def _write_manifest(self):
+    manifest = {
+      "trial_no": self.trial_no,
+      "dtype": "<f8",
+      "nof_channels": self.nof_channels,
+      "channels": self.channels,
+      "rate": self.rate,
+      "columns": {
+        column: {
+          "file": os.path.basename(self.filename(column)),
+          "width": self.nof_channels if column == "EEG" else 1,
+          "nof_rows": self.nof_rows[column],
+        }
+        for column in EEG_COLUMNS + MARKER_COLUMNS
+      },
+    }
+    # Readers never see a partly written manifest:
+    filename = self.manifest_filename()
+    with open(filename + ".tmp", 'w') as f:
+      json.dump(manifest, f, indent=2)
+    os.replace(filename + ".tmp", filename)
+    self.last_manifest = time.monotonic()
+    if self.catalog is not None:
+      files = {column: self.filename(column) for column in EEG_COLUMNS + MARKER_COLUMNS}
+      self.catalog.set_files(self.trial_no, files, self.nof_channels, self.nof_rows["EEG_timestamps"], self.nof_rows["marker_timestamps"])
@@ -0,0 +1,512 @@
+"""Benchmarks of the nodes_dev nodes and of the ERP helper functions
+
+The nodes are driven directly, with their ports set as the Timeflux scheduler does, on
+synthetic EEG streams (or on a recorded trial) with 'show' events. Each update is timed,
+and the peak memory allocated by each update is measured in a second run, with
+:py:mod:`tracemalloc`. The nodes downstream of `Epoch` get the epochs that `Epoch` sent
+for the same stream, as in the graphs.
+
+The streams cover the fixtures given by ``--rates``, ``--channels`` and ``--densities``
+(the number of 'show' events per second). The results (percentiles of the time per
+update, in µs, and of the bytes allocated per update) are written to
+``results/<date>_<commit>.json`` and compared with the previous results file, so a
+regression between two commits shows up as a ratio above ``--threshold``.
+
+The nodes_dev folder must be linked into Timeflux (see the README), since the nodes are
+imported as ``timeflux.nodes_dev``. Examples::
+
+    python benchmark_nodes.py                       # All the fixtures
+    python benchmark_nodes.py --quick               # A few fixtures, for a quick check
+    python benchmark_nodes.py --only Epoch Trim --rates 512 --channels 64
+    python benchmark_nodes.py --trial 12 --folder ../Clear_by_Mind/engine/data
+    python benchmark_nodes.py --compare results/old.json --fail
+
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "Clear_by_Mind")) # For offline_analysis, as in the graphs
+
+from sklearn.pipeline import make_pipeline
+from pyriemann.estimation import Covariances
+from pyriemann.classification import MDM
+from offline_analysis.helper_functions import average_epochs, std_epochs, ERP_probabilities
+from timeflux.nodes_dev.epoch import Epoch, Trim, ToXArray
+from timeflux.nodes_dev.save_numpy import SaveNumpy
+from timeflux.nodes_dev.ml_inference import Inference, AverageERP, READY
+from timeflux.nodes_dev.band_node import ChannelVarianceNode
+
+RATES = [256, 512, 1000]
+CHANNELS = [4, 8, 32, 64]
+DENSITIES = [1, 2, 4]
+GRAPH_RATE = 10 # Updates per second of the preprocessing graph
+WINDOW = 0.5 # Length (s) of the rolling windows, as in the graphs (128 samples at 256 Hz)
+STEP = 0.125 # Step (s) of the rolling windows
+EPOCH = {"before": 0.5, "after": 2.0} # As in preprocessing_CBM.yaml
+COLORS = 5 # The last digit of the 'show' markers is the color (see helper_functions)
+
+
+class Stream:
+    """An EEG stream with 'show' events, cut into the chunks of each update.
+
+    Args:
+        data (ndarray): The EEG (n_samples x n_channels).
+        times (ndarray): The timestamps of the samples (datetime64[ns]).
+        shows (DataFrame): The 'show' events, with their marker as data.
+        rate (float): The sample rate.
+        name (str): The name of the fixture.
+        density (float): The mean number of 'show' events per second, computed from the
+            events if `None`.
+
+    """
+
+    def __init__(self, data, times, shows, rate, name, density=None):
+
+        self.data = data
+        self.times = times
+        self.shows = shows
+        self.rate = rate
+        self.name = name
+        self.columns = [str(channel + 1) for channel in range(data.shape[1])]
+        self.density = density if density is not None else round(len(shows) * rate / max(len(data), 1), 1)
+
+    def ticks(self):
+        """Get the inputs of the Epoch node, for each update of the graph
+
+        Returns:
+            list: For each update, a dict of port name -> (data, meta).
+
+        """
+        bounds = np.round(np.arange(0, len(self.data) + 1, self.rate / GRAPH_RATE)).astype(int)
+        ticks = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            index = pd.DatetimeIndex(self.times[start:stop])
+            tick = {"i": (pd.DataFrame(self.data[start:stop], index=index, columns=self.columns), {"rate": self.rate})}
+            events = self.shows[(self.shows.index >= index[0]) & (self.shows.index <= index[-1])]
+            if len(events):
+                tick["i_events"] = (events, {})
+            ticks.append(tick)
+        return ticks
+
+    def windows(self):
+        """Get the rolling windows, one per update
+
+        Returns:
+            list: The windows, as DataFrames.
+
+        """
+        length = int(round(WINDOW * self.rate))
+        step = int(round(STEP * self.rate))
+        return [
+            pd.DataFrame(self.data[start : start + length], index=pd.DatetimeIndex(self.times[start : start + length]), columns=self.columns)
+            for start in range(0, len(self.data) - length + 1, step)
+        ]
+
+
+def synthetic_stream(rate, channels, density, duration, seed=42):
+    """Generate noise with 'show' events at random times
+
+    Args:
+        rate (float): The sample rate.
+        channels (int): The number of channels.
+        density (float): The mean number of 'show' events per second.
+        duration (float): The length of the stream, in seconds.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        Stream: The stream.
+
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = int(duration * rate)
+    origin = np.datetime64("2023-01-01T00:00:00", "ns")
+    times = origin + (np.arange(n_samples) * (1e9 / rate)).astype("timedelta64[ns]")
+    data = rng.standard_normal((n_samples, channels)) * 10
+    onsets = np.cumsum(rng.uniform(0.5, 1.5, int(2 * duration * density)) / density)
+    onsets = onsets[onsets < duration - 0.1]
+    markers = [str(1000 + 10 * rng.integers(10) + rng.integers(COLORS)) for _ in onsets]
+    shows = pd.DataFrame(
+        {"label": "show", "data": markers},
+        index=pd.DatetimeIndex(origin + (onsets * 1e9).astype("timedelta64[ns]")),
+    )
+    return Stream(data, times, shows, rate, "synthetic", density)
+
+
+def recorded_stream(trial_no, folder, nof_channels=8):
+    """Read the EEG and the 'show' markers of a recorded trial
+
+    Args:
+        trial_no (int): The trial number.
+        folder (str): The data folder of the engine.
+        nof_channels (int): The number of channels of the trials recorded without a manifest.
+
+    Returns:
+        Stream: The stream.
+
+    """
+    sys.path.insert(0, os.path.join(HERE, "..", "Clear_by_Mind", "engine"))
+    from trial_reader import TrialReader
+
+    reader = TrialReader(trial_no, folder, nof_channels=nof_channels)
+    if len(reader) == 0:
+        raise ValueError("No EEG in trial {}".format(trial_no))
+    # The local clock times, as in replay.py
+    seconds = np.asarray(reader.EEG_LSL_timestamps) + np.asarray(reader.EEG_time_corrections)
+    rate = reader.rate or float(1.0 / np.median(np.diff(seconds)))
+    markers = np.asarray(reader.marker).astype(int)
+    keep = (markers >= 1000) & (markers < 2000)
+    shows = pd.DataFrame(
+        {"label": "show", "data": [str(marker) for marker in markers[keep]]},
+        index=pd.to_datetime(np.asarray(reader.marker_timestamps)[keep], unit="s"),
+    )
+    return Stream(np.array(reader.EEG), pd.to_datetime(seconds, unit="s").values, shows, rate, "T%04d" % trial_no)
+
+
+def outputs(node):
+    """Get the outputs of a node after an update
+
+    Args:
+        node (Node): The node.
+
+    Returns:
+        list: The (port name, data, meta) of each output port with data.
+
+    """
+    seen = set()
+    result = []
+    for name, port in node.ports.items():
+        if name.startswith("o") and port.data is not None and id(port) not in seen:
+            seen.add(id(port))
+            result.append((name, port.data, port.meta))
+    return result
+
+
+def run(node, ticks, memory=False):
+    """Update a node with the inputs of each tick
+
+    Args:
+        node (Node): The node.
+        ticks (list): For each update, a dict of port name -> (data, meta).
+        memory (bool): Measure the peak bytes allocated by each update instead of the time.
+
+    Returns:
+        (tuple): A tuple containing:
+
+        * values (`ndarray`): The time (s) or the bytes of each update.
+        * sent (`list`): The outputs of each update (see :py:func:`outputs`).
+
+    """
+    values = np.zeros(len(ticks))
+    sent = []
+    for k, tick in enumerate(ticks):
+        node.clear()
+        for name, (data, meta) in tick.items():
+            port = getattr(node, name)
+            port.data = data
+            port.meta = meta
+        if memory:
+            tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+            node.update()
+            values[k] = tracemalloc.get_traced_memory()[1] - allocated
+        else:
+            start = time.perf_counter()
+            node.update()
+            values[k] = time.perf_counter() - start
+        sent.append(outputs(node))
+    return values, sent
+
+
+def summary(values, scale=1.0):
+    """Get the percentiles of the values of all the updates"""
+    values = np.asarray(values) * scale
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"mean": float(np.mean(values)), "p50": float(p50), "p90": float(p90), "p99": float(p99), "max": float(np.max(values))}
+
+
+def measure(factory, ticks, memory=True):
+    """Time a new node on the ticks, then measure its allocations on another new node
+
+    Args:
+        factory (function): Creates the node.
+        ticks (list): For each update, a dict of port name -> (data, meta).
+        memory (bool): Also measure the allocations.
+
+    Returns:
+        (tuple): The result (dict) and the outputs of each update.
+
+    """
+    times, sent = run(factory(), ticks)
+    result = {"updates": len(ticks), "time_us": summary(times, 1e6), "total_ms": float(np.sum(times) * 1e3)}
+    if memory:
+        tracemalloc.start()
+        try:
+            allocated, _ = run(factory(), ticks, memory=True)
+        finally:
+            tracemalloc.stop()
+        result["bytes"] = summary(allocated)
+    return result, sent
+
+
+def measure_function(function, repeat, memory=True):
+    """Time a function called without arguments, as :py:func:`measure` does for a node"""
+    times = np.zeros(repeat)
+    for k in range(repeat):
+        start = time.perf_counter()
+        function()
+        times[k] = time.perf_counter() - start
+    result = {"updates": repeat, "time_us": summary(times, 1e6), "total_ms": float(np.sum(times) * 1e3)}
+    if memory:
+        tracemalloc.start()
+        try:
+            allocated = np.zeros(repeat)
+            for k in range(repeat):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                function()
+                allocated[k] = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+        result["bytes"] = summary(allocated)
+    return result
+
+
+def downstream(sent, rename=None):
+    """Get the ticks of a node fed by the outputs of another node
+
+    Args:
+        sent (list): The outputs of each update of the upstream node.
+        rename (function): Maps the (index, data, meta) of each output to the (port name,
+            data, meta) of the input.
+
+    Returns:
+        list: The ticks.
+
+    """
+    rename = rename or (lambda index, data, meta: ("i_%d" % index, data, meta))
+    ticks = []
+    for outputs in sent:
+        tick = {}
+        for index, (_, data, meta) in enumerate(outputs):
+            name, data, meta = rename(index, data, meta)
+            tick[name] = (data, meta)
+        ticks.append(tick)
+    return ticks
+
+
+def single_epoch(index, data, meta):
+    # Epoch sends the meta of epoch N as "epochN", ToXArray expects "epoch"
+    key = next(key for key in meta if key.startswith("epoch"))
+    return "i_%d" % index, data, {**meta, "epoch": meta[key]}
+
+
+def benchmark_stream(stream, only=None, memory=True):
+    """Run all the benchmarks on a stream
+
+    Args:
+        stream (Stream): The stream.
+        only (list): The names of the benchmarks to run, all if `None`.
+        memory (bool): Also measure the allocations.
+
+    Returns:
+        dict: The result of each benchmark.
+
+    """
+    results = {}
+    wanted = lambda name: not only or name in only or name.split("[")[0] in only
+    ticks = stream.ticks()
+    columns = len(stream.columns)
+
+    # Epochs cut by time, one per port, as in preprocessing_MI.yaml (with a Trim)
+    result, sent_time = measure(lambda: Epoch("show", rate=stream.rate, **EPOCH), ticks, memory)
+    if wanted("Epoch[time]"):
+        results["Epoch[time]"] = result
+    trim_ticks = downstream(sent_time)
+    result, sent_trim = measure(lambda: Trim(), trim_ticks, memory)
+    if wanted("Trim"):
+        results["Trim"] = result
+    if wanted("ToXArray"):
+        results["ToXArray"] = measure(lambda: ToXArray(), downstream(sent_trim, single_epoch), memory)[0]
+        results["ToXArray[max_epochs]"] = measure(lambda: ToXArray(max_epochs=8), downstream(sent_trim, single_epoch), memory)[0]
+
+    # Batches of epochs of a fixed number of samples, as in preprocessing_CBM.yaml
+    result, sent_batch = measure(lambda: Epoch("show", rate=stream.rate, batch=True, index="sample", **EPOCH), ticks, memory)
+    if wanted("Epoch[batch]"):
+        results["Epoch[batch]"] = result
+    epoch_ticks = downstream(sent_batch, lambda index, data, meta: ("i_epochs", data, meta))
+    if wanted("AverageERP"):
+        results["AverageERP"] = measure(lambda: AverageERP(), epoch_ticks, memory)[0]
+    if wanted("SaveNumpy"):
+        with tempfile.TemporaryDirectory() as folder:
+            start = pd.DataFrame([["start", "1"]], index=[stream.times[0]], columns=["label", "data"])
+            save_ticks = [dict(tick) for tick in epoch_ticks]
+            if save_ticks:
+                save_ticks[0]["i_events"] = (start, {})
+            factory = lambda: SaveNumpy(data_folder=folder, status_admin=True, save_interval=0, storage="npy")
+            results["SaveNumpy[npy]"] = measure(factory, save_ticks, memory)[0]
+
+    # Rolling windows, as in process_MI.yaml
+    windows = stream.windows()
+    window_ticks = [{"i": (window, {})} for window in windows]
+    if wanted("ChannelVarianceNode"):
+        results["ChannelVarianceNode"] = measure(lambda: ChannelVarianceNode(device="crown"), window_ticks, memory)[0]
+    if wanted("Inference") and windows:
+        rng = np.random.default_rng(0)
+        X = rng.standard_normal((40, columns, len(windows[0])))
+        model = make_pipeline(Covariances(), MDM(metric="logeuclid")).fit(X, np.arange(len(X)) % 4)
+
+        def inference():
+            node = Inference()
+            node.status = READY
+            node.ml_model = model
+            return node
+
+        results["Inference"] = measure(inference, [{"i_rolling": (window, {})} for window in windows], memory)[0]
+
+    # The ERP helper functions, on all the epochs of the stream
+    batches = [data for outputs in sent_batch for _, data, _ in outputs]
+    if batches and (wanted("average_epochs") or wanted("std_epochs") or wanted("ERP_probabilities")):
+        X = np.nan_to_num(np.concatenate(batches))
+        y = [str(label)[3] for outputs in sent_batch for _, _, meta in outputs for label in meta["epochs"]["context"]]
+        classes = [str(color) for color in range(COLORS)]
+        repeat = 20
+        if wanted("average_epochs"):
+            results["average_epochs"] = measure_function(lambda: average_epochs(X, y, classes), repeat, memory)
+        if wanted("std_epochs"):
+            results["std_epochs"] = measure_function(lambda: std_epochs(X, y, classes), repeat, memory)
+        if wanted("ERP_probabilities"):
+            X_avg, _ = average_epochs(X, y, classes)
+            X_avg = np.nan_to_num(X_avg) + np.random.default_rng(0).standard_normal(X_avg.shape)
+            cov = Covariances()
+            results["ERP_probabilities"] = measure_function(lambda: ERP_probabilities(X_avg, cov), repeat, memory)
+    return results
+
+
+def git_commit():
+    """Get the short hash of the current commit, with a '+' if the tree has changes"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+        return commit + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline, threshold):
+    """Print the ratio of the results to a baseline, and return the regressions
+
+    Args:
+        results (dict): The results of this run.
+        baseline (dict): The results of a previous run.
+        threshold (float): The ratio above which a change is a regression.
+
+    Returns:
+        list: The (fixture, benchmark, metric, ratio) of the regressions.
+
+    """
+    regressions = []
+    print("\nCompared with {} ({}):".format(baseline["commit"], baseline["date"]))
+    print("{:<34} {:<22} {:>10} {:>10} {:>10}".format("fixture", "benchmark", "p50 time", "p99 time", "p50 bytes"))
+    for fixture, benchmarks in results["fixtures"].items():
+        for name, result in benchmarks.items():
+            old = baseline["fixtures"].get(fixture, {}).get(name)
+            if old is None:
+                continue
+            ratios = []
+            for metric, key in (("time_us", "p50"), ("time_us", "p99"), ("bytes", "p50")):
+                if metric in result and metric in old and old[metric][key] > 0:
+                    ratio = result[metric][key] / old[metric][key]
+                    ratios.append("{:.2f}x".format(ratio))
+                    # The p99 of the time is noisy, only the medians are checked
+                    if key == "p50" and ratio > threshold:
+                        regressions.append((fixture, name, metric, ratio))
+                else:
+                    ratios.append("-")
+            print("{:<34} {:<22} {:>10} {:>10} {:>10}".format(fixture, name, *ratios))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the nodes_dev nodes and the ERP helper functions.")
+    parser.add_argument("--rates", type=float, nargs="+", default=RATES)
+    parser.add_argument("--channels", type=int, nargs="+", default=CHANNELS)
+    parser.add_argument("--densities", type=float, nargs="+", default=DENSITIES, help="The 'show' events per second.")
+    parser.add_argument("--duration", type=float, default=20.0, help="The length (s) of the synthetic streams.")
+    parser.add_argument("--quick", action="store_true", help="Only 256 and 1000 Hz, 4 and 32 channels, 2 shows per second.")
+    parser.add_argument("--trial", type=int, nargs="+", help="Benchmark recorded trials instead of synthetic streams.")
+    parser.add_argument("--folder", default=os.path.join(HERE, "..", "Clear_by_Mind", "engine", "data"), help="The data folder of the recorded trials.")
+    parser.add_argument("--only", nargs="+", help="The benchmarks to run, e.g. Epoch AverageERP.")
+    parser.add_argument("--no-memory", action="store_true", help="Do not measure the allocations (faster).")
+    parser.add_argument("--output", default=os.path.join(HERE, "results"), help="The folder of the results files.")
+    parser.add_argument("--compare", help="The results file to compare with. Default: the latest one in the output folder.")
+    parser.add_argument("--threshold", type=float, default=1.2, help="The ratio of the medians above which a change is a regression.")
+    parser.add_argument("--fail", action="store_true", help="Exit with an error if there is a regression.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR) # The nodes warn about the rejected epochs
+
+    if args.trial:
+        streams = [recorded_stream(trial_no, args.folder) for trial_no in args.trial]
+    else:
+        if args.quick:
+            args.rates, args.channels, args.densities = [256, 1000], [4, 32], [2]
+        streams = [
+            synthetic_stream(rate, channels, density, args.duration)
+            for rate in args.rates
+            for channels in args.channels
+            for density in args.densities
+        ]
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "fixtures": {},
+    }
+    for stream in streams:
+        fixture = "{} {:g}Hz {}ch {:g}/s".format(stream.name, stream.rate, len(stream.columns), stream.density)
+        start = time.perf_counter()
+        benchmarks = benchmark_stream(stream, args.only, memory=not args.no_memory)
+        results["fixtures"][fixture] = benchmarks
+        print("\n{} ({:.1f} s)".format(fixture, time.perf_counter() - start))
+        print("  {:<22} {:>8} {:>10} {:>10} {:>10} {:>12}".format("benchmark", "updates", "p50 µs", "p99 µs", "max µs", "p50 bytes"))
+        for name, result in benchmarks.items():
+            print("  {:<22} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>12}".format(
+                name, result["updates"], result["time_us"]["p50"], result["time_us"]["p99"], result["time_us"]["max"],
+                "{:.0f}".format(result["bytes"]["p50"]) if "bytes" in result else "-",
+            ))
+
+    previous = args.compare
+    if previous is None:
+        files = sorted(glob.glob(os.path.join(args.output, "*.json")))
+        previous = files[-1] if files else None
+    os.makedirs(args.output, exist_ok=True)
+    filename = os.path.join(args.output, "{}_{}.json".format(datetime.now().strftime("%Y%m%d-%H%M%S"), results["commit"]))
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=1)
+    print("\nResults written to {}".format(filename))
+
+    if previous is not None:
+        with open(previous) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for fixture, name, metric, ratio in regressions:
+            print("Regression: {} {} {} is {:.2f}x slower/larger".format(fixture, name, metric, ratio))
+        if regressions and args.fail:
+            sys.exit(1)
@@ -12,8 +12,10 @@ from mne.decoding import PSDEstimator
 
 from timeflux.core.node import Node
 from timeflux.helpers.port import make_event
+from timeflux.nodes_dev.profiler import profiled
 
 
+@profiled
 class ChannelVarianceNode(Node):
 
     def __init__(self, device="museS", output_style="by_channel"):
@@ -86,6 +88,9 @@ class ChannelVariance(BaseEstimator, TransformerMixin):
     def fit(self, X, y=None):
         return self # nothing else to do
 
+    def __sklearn_is_fitted__(self):
+        return True # Stateless, so the pipeline can transform without fit (checked by scikit-learn >= 1.3)
+
     def transform(self, X):
 
         if self.data_shape is not None:
@@ -0,0 +1,393 @@
+"""Preallocated buffers for streaming data"""
+
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-capacity circular buffer of samples and timestamps.
+
+    Samples are written in place into preallocated arrays, so appending new data never
+    reallocates or copies the history. Each sample is addressed by its absolute index,
+    i.e. the number of samples written before it. Only the last ``capacity`` samples
+    are retained.
+
+    Timestamps are stored as int64 (the integer representation of the DataFrame index)
+    and are assumed to be monotonic.
+
+    Args:
+        capacity (int): The maximum number of retained samples.
+        channels (int): The number of channels.
+        dtype (dtype): The data type of the samples.
+
+    """
+
+    def __init__(self, capacity, channels, dtype=np.float64):
+
+        self._capacity = max(int(capacity), 1)
+        self._data = np.empty((self._capacity, channels), dtype=dtype)
+        self._times = np.empty(self._capacity, dtype=np.int64)
+        self._count = 0
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def capacity(self):
+        """The maximum number of retained samples."""
+        return self._capacity
+
+    @property
+    def start(self):
+        """The absolute index of the oldest retained sample."""
+        return max(0, self._count - self._capacity)
+
+    @property
+    def stop(self):
+        """The absolute index of the next sample to be written."""
+        return self._count
+
+    @property
+    def first(self):
+        """The timestamp of the oldest retained sample, or `None` if the buffer is empty."""
+        if self._count == 0:
+            return None
+        return self._times[self.start % self._capacity]
+
+    @property
+    def last(self):
+        """The timestamp of the most recent sample, or `None` if the buffer is empty."""
+        if self._count == 0:
+            return None
+        return self._times[(self._count - 1) % self._capacity]
+
+    def stamps(self, indices):
+        """Get the timestamps of retained samples.
+
+        Args:
+            indices (int|ndarray): The absolute indices of the samples.
+
+        Returns:
+            (int|ndarray): The int64 timestamps.
+
+        """
+        return self._times[np.asarray(indices) % self._capacity]
+
+    def reserve(self, capacity):
+        """Grow the buffer so it can retain at least ``capacity`` samples.
+
+        Retained samples are kept. This is a no-op if the buffer is already large enough.
+
+        Args:
+            capacity (int): The requested capacity.
+
+        """
+        if capacity <= self._capacity:
+            return
+        new_capacity = self._capacity
+        while new_capacity < capacity:
+            new_capacity *= 2
+        data, times = self.read(self.start, self.stop)
+        self._capacity = new_capacity
+        self._data = np.empty((new_capacity, self._data.shape[1]), dtype=self._data.dtype)
+        self._times = np.empty(new_capacity, dtype=np.int64)
+        self._count = self.stop - len(times)
+        self.write(data, times)
+
+    def write(self, values, times):
+        """Append samples, overwriting the oldest ones if needed.
+
+        Args:
+            values (ndarray): The samples, of shape (n_samples, n_channels).
+            times (ndarray): The int64 timestamps, of shape (n_samples,).
+
+        """
+        n = len(times)
+        if n == 0:
+            return
+        if n > self._capacity:
+            values = values[-self._capacity :]
+            times = times[-self._capacity :]
+            self._count += n - self._capacity
+            n = self._capacity
+        pos = self._count % self._capacity
+        first = min(n, self._capacity - pos)
+        self._data[pos : pos + first] = values[:first]
+        self._times[pos : pos + first] = times[:first]
+        if first < n:
+            self._data[: n - first] = values[first:]
+            self._times[: n - first] = times[first:]
+        self._count += n
+
+    def read(self, start, stop, data=None, times=None):
+        """Copy retained samples between two absolute indices.
+
+        The range is clipped to the retained samples.
+
+        Args:
+            start (int): The absolute index of the first sample.
+            stop (int): The absolute index after the last sample.
+            data (ndarray|None): Optional destination for the samples.
+            times (ndarray|None): Optional destination for the timestamps.
+
+        Returns:
+            (tuple): The samples and the timestamps.
+
+        """
+        start = max(start, self.start)
+        stop = min(stop, self.stop)
+        n = max(stop - start, 0)
+        if data is None:
+            data = np.empty((n, self._data.shape[1]), dtype=self._data.dtype)
+        if times is None:
+            times = np.empty(n, dtype=np.int64)
+        if n == 0:
+            return data[:0], times[:0]
+        pos = start % self._capacity
+        first = min(n, self._capacity - pos)
+        data[:first] = self._data[pos : pos + first]
+        times[:first] = self._times[pos : pos + first]
+        if first < n:
+            data[first:n] = self._data[: n - first]
+            times[first:n] = self._times[: n - first]
+        return data[:n], times[:n]
+
+    def search(self, timestamps, side="left"):
+        """Find the absolute indices where timestamps would be inserted.
+
+        This is the equivalent of :py:func:`numpy.searchsorted` over the retained
+        timestamps, which are stored in at most two contiguous segments.
+
+        Args:
+            timestamps (int|ndarray): The int64 timestamps to look for.
+            side (`left`|`right`): See :py:func:`numpy.searchsorted`.
+
+        Returns:
+            (int|ndarray): The absolute indices.
+
+        """
+        start = self.start
+        size = self.stop - start
+        pos = start % self._capacity
+        if pos + size <= self._capacity:
+            return start + np.searchsorted(
+                self._times[pos : pos + size], timestamps, side=side
+            )
+        older = self._times[pos:]
+        newer = self._times[: size - len(older)]
+        a = np.searchsorted(older, timestamps, side=side)
+        b = np.searchsorted(newer, timestamps, side=side)
+        return np.where(a < len(older), start + a, start + len(older) + b)
+
+
+class EpochStore:
+    """Growable store of epochs, labels and timestamps.
+
+    Epochs are copied into preallocated arrays whose capacity doubles when they are
+    full, so accumulating epochs over a session has an amortized constant cost per
+    epoch instead of copying the whole history on every append. The arrays are
+    allocated on the first append, from the shape and dtype of the epochs.
+
+    The properties return views of the filled part of the arrays. They are only valid
+    until the next append or clear.
+
+    Args:
+        capacity (int): The initial number of epochs.
+
+    """
+
+    def __init__(self, capacity=64):
+
+        self._initial_capacity = max(int(capacity), 1)
+        self._data = None
+        self._times = None
+        self._labels = None
+        self._onsets = None
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self):
+        """The number of epochs that fit before the arrays grow."""
+        return 0 if self._data is None else len(self._data)
+
+    @property
+    def shape(self):
+        """The shape of one epoch, or `None` if the store is empty."""
+        return None if self._count == 0 else self._data.shape[1:]
+
+    @property
+    def data(self):
+        """The epochs (n_epochs x n_channels x n_samples), or `None` if the store is empty."""
+        return None if self._count == 0 else self._data[: self._count]
+
+    @property
+    def times(self):
+        """The timestamps of each sample (n_epochs x n_samples), or `None` if the store is empty."""
+        return None if self._count == 0 else self._times[: self._count]
+
+    @property
+    def labels(self):
+        """The label of each epoch, as an object array, or `None` if the store is empty."""
+        return None if self._count == 0 else self._labels[: self._count]
+
+    @property
+    def onsets(self):
+        """The onset of each epoch, or `None` if the store is empty."""
+        return None if self._count == 0 else self._onsets[: self._count]
+
+    def append(self, data, times=None, labels=None, onsets=None):
+        """Append epochs.
+
+        Args:
+            data (ndarray): The epochs (n_epochs x n_channels x n_samples).
+            times (ndarray|None): The timestamps of each sample (n_epochs x n_samples).
+            labels (list|None): The label of each epoch.
+            onsets (list|None): The onset of each epoch.
+
+        """
+        data = np.asarray(data)
+        n = len(data)
+        if self._count == 0 and (self._data is None or self._data.shape[1:] != data.shape[1:]):
+            self._allocate(data, times, max(self._initial_capacity, n))
+        elif data.shape[1:] != self._data.shape[1:]:
+            raise ValueError("Invalid shape: {}".format(data.shape[1:]))
+        self.reserve(self._count + n)
+        stop = self._count + n
+        self._data[self._count : stop] = data
+        if times is not None:
+            self._times[self._count : stop] = times
+        if labels is not None:
+            self._labels[self._count : stop] = labels
+        if onsets is not None:
+            self._onsets[self._count : stop] = onsets
+        self._count = stop
+
+    def reserve(self, capacity):
+        """Grow the arrays so they can hold at least ``capacity`` epochs.
+
+        Args:
+            capacity (int): The requested capacity.
+
+        """
+        if capacity <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < capacity:
+            new_capacity *= 2
+        for name in ("_data", "_times", "_labels", "_onsets"):
+            array = getattr(self, name)
+            grown = np.empty((new_capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[: self._count] = array[: self._count]
+            setattr(self, name, grown)
+
+    def clear(self):
+        """Remove all epochs, keeping the allocated arrays."""
+        self._count = 0
+
+    def _allocate(self, data, times, capacity):
+        times_shape = data.shape[2:] if times is None else np.shape(times)[1:]
+        self._data = np.empty((capacity,) + data.shape[1:], dtype=data.dtype)
+        self._times = np.empty((capacity,) + times_shape, dtype="datetime64[ns]")
+        self._labels = np.empty(capacity, dtype=object)
+        self._onsets = np.empty(capacity, dtype="datetime64[ns]")
+
+
+class RunningAverages:
+    """Running per-class averages of epochs.
+
+    Only the per-class sums and counts are kept, so adding an epoch and getting the
+    averages have a constant cost, whatever the number of epochs received so far. The
+    per-class variance can optionally be tracked as well, with Welford's algorithm.
+
+    Args:
+        classes (list): The classes, in the order of the averages.
+        variance (bool): Track the per-class variance.
+
+    """
+
+    def __init__(self, classes, variance=False):
+
+        self.classes = list(classes)
+        self._codes = {label: code for code, label in enumerate(self.classes)}
+        self._variance = variance
+        self._counts = np.zeros(len(self.classes), dtype=np.int64)
+        self._sums = None
+        self._m2 = None
+
+    @property
+    def counts(self):
+        """The number of epochs of each class."""
+        return self._counts
+
+    @property
+    def shape(self):
+        """The shape of one epoch, or `None` if no epoch was added."""
+        return None if self._sums is None else self._sums.shape[1:]
+
+    def update(self, data, labels):
+        """Add epochs.
+
+        Epochs whose label is not one of the classes are ignored.
+
+        Args:
+            data (ndarray): The epochs (n_epochs x n_channels x n_samples).
+            labels (list): The class of each epoch.
+
+        """
+        data = np.asarray(data, dtype=np.float64)
+        codes = np.array([self._codes.get(label, -1) for label in labels], dtype=np.int64)
+        keep = codes >= 0
+        data, codes = data[keep], codes[keep]
+        if len(codes) == 0:
+            return
+        if self._sums is None:
+            self._sums = np.zeros((len(self.classes),) + data.shape[1:])
+            if self._variance:
+                self._m2 = np.zeros_like(self._sums)
+        if not self._variance:
+            np.add.at(self._sums, codes, data)
+            np.add.at(self._counts, codes, 1)
+            return
+        for code, epoch in zip(codes, data):
+            delta = epoch - self._mean(code)
+            self._sums[code] += epoch
+            self._counts[code] += 1
+            self._m2[code] += delta * (epoch - self._mean(code))
+
+    def mean(self):
+        """Get the averages.
+
+        Returns:
+            (ndarray): The average epoch of each class (n_classes x n_channels x n_samples).
+            Classes without epochs are NaN.
+
+        """
+        if self._sums is None:
+            return None
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._sums / self._counts[:, None, None]
+
+    def std(self):
+        """Get the standard deviations, as :py:func:`numpy.std` would compute them.
+
+        Returns:
+            (ndarray): The standard deviation of each class (n_classes x n_channels x n_samples).
+            Classes without epochs are NaN.
+
+        """
+        if self._m2 is None:
+            return None
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self._m2 / self._counts[:, None, None])
+
+    def reset(self):
+        """Remove all epochs."""
+        self._counts[:] = 0
+        self._sums = None
+        self._m2 = None
+
+    def _mean(self, code):
+        count = self._counts[code]
+        return self._sums[code] / count if count else 0.0
@@ -4,9 +4,30 @@ import numpy as np
 import pandas as pd
 import json
 import xarray as xr
+from time import time
 from timeflux.core.node import Node
 from timeflux.core.exceptions import WorkerInterrupt
 from timeflux.helpers.port import match_events
+from timeflux.nodes_dev.buffers import RingBuffer
+from timeflux.nodes_dev.profiler import profiled
+
+
+def _contexts(matches):
+    """Parse the context of each matched event."""
+    contexts = []
+    for data in matches["data"].values:
+        try:
+            contexts.append(json.loads(data))
+        except json.JSONDecodeError:
+            contexts.append(data)
+        except TypeError:
+            contexts.append({})
+    return contexts
+
+
+def _to_int(timestamps, dtype):
+    """Convert timestamps to the int64 representation of a datetime64 dtype."""
+    return np.asarray(timestamps, dtype="datetime64[ns]").astype(dtype).view(np.int64)
 
 
 class Samples(Node):
@@ -17,6 +38,8 @@ class Samples(Node):
     Non-monotonic data, late data, late events, jittered data and jumbled events are all handled reasonably well.
     Multiple epochs are automatically assigned to dynamic outputs ports. For convenience, the first epoch is bound to the default output, so you can avoid enumerating all output ports if you expects only one epoch.
 
+    Samples are kept in a preallocated ring buffer. The first sample of each pending epoch is resolved once, with a single search over the buffer timestamps, and the epoch is copied out of the buffer when it is complete.
+
     Attributes:
         i (Port): Default data input, expects DataFrame.
         i_events (Port): Event input, expects DataFrame.
@@ -38,7 +61,7 @@ class Samples(Node):
         self._rate = rate
         self._length_epoch = None
         self._length_buffer = None
-        self._buffer = None
+        self._ring = None
         self._epochs = []
 
     def update(self):
@@ -55,58 +78,61 @@ class Samples(Node):
             if not self._length_epoch:
                 self._length_epoch = round(self._duration_epoch * self._rate)
 
-        # Append to main buffer
-        if self._buffer is None:
-            self._buffer = self.i.data
-        else:
-            self._buffer = pd.concat([self._buffer, self.i.data])
+            # Append to main buffer
+            if self._ring is None:
+                self._columns = self.i.data.columns
+                self._index_dtype = self.i.data.index.values.dtype
+                self._ring = RingBuffer(
+                    max(self._length_buffer, self._length_epoch),
+                    len(self._columns),
+                    self.i.data.values.dtype,
+                )
+            self._ring.reserve(max(self._length_buffer, self._length_epoch) + len(self.i.data))
+            self._ring.write(self.i.data.values, self.i.data.index.values.view(np.int64))
 
         # Detect onsets
         matches = match_events(self.i_events, self._trigger)
         if matches is not None:
-            for index, row in matches.iterrows():
+            for index, context in zip(matches.index, _contexts(matches)):
                 # Start a new epoch
-                try:
-                    context = json.loads(row["data"])
-                except json.JSONDecodeError:
-                    context = row["data"]
-                except TypeError:
-                    context = {}
                 self._epochs.append(
                     {
-                        "data": None,
+                        "start": None,
                         "meta": {"onset": index, "context": context},
                     }
                 )
 
         # Update epochs
         if self._epochs and self.i.ready():
+            # Find the first sample of all pending epochs at once
+            pending = [epoch for epoch in self._epochs if epoch["start"] is None]
+            if pending:
+                onsets = _to_int(
+                    [epoch["meta"]["onset"] for epoch in pending], self._index_dtype
+                )
+                starts = np.atleast_1d(self._ring.search(onsets, side="left"))
+                for epoch, onset, start in zip(pending, onsets, starts):
+                    if onset < self._ring.first:
+                        epoch["start"] = -1 # Outdated
+                    elif start < self._ring.stop:
+                        epoch["start"] = int(start)
             indices = []
             for index, epoch in enumerate(self._epochs):
-                if epoch["data"] is None:
-                    # Discard if the event is outdated
-                    if epoch["meta"]["onset"] < self._buffer.index[0]:
-                        self.logger.warning("Oudated event")
-                        indices.append(index)
-                    # Find the first sample and initialize the epoch
-                    mask = self._buffer.index >= epoch["meta"]["onset"]
-                    data = self._buffer[mask][: self._length_epoch]
-                    if len(data) > 0:
-                        epoch["data"] = data
-                else:
-                    # Append
-                    mask = self._buffer.index > epoch["data"].index[-1]
-                    remaining = self._length_epoch - len(epoch["data"])
-                    epoch["data"] = pd.concat(
-                        [epoch["data"], self._buffer[mask][:remaining]]
-                    )
+                if epoch["start"] is None:
+                    continue
+                # Discard if the event is outdated
+                if epoch["start"] < self._ring.start:
+                    self.logger.warning("Oudated event")
+                    indices.append(index)
+                    continue
                 # Send if the epoch is complete
-                if (
-                    epoch["data"] is not None
-                    and len(epoch["data"]) == self._length_epoch
-                ):
+                stop = epoch["start"] + self._length_epoch
+                if stop <= self._ring.stop:
+                    data, times = self._ring.read(epoch["start"], stop)
                     o = getattr(self, "o_" + str(len(indices)))
-                    o.data = epoch["data"]
+                    o.data = pd.DataFrame(
+                        data, index=times.view(self._index_dtype), columns=self._columns
+                    )
                     o.meta = {"rate": self._rate, "epoch": epoch["meta"]}
                     indices.append(index)
             if len(indices) > 0:
@@ -115,13 +141,8 @@ class Samples(Node):
                     del self._epochs[index]
                 self.o = self.o_0  # Bind default output to the first epoch
 
-        # Trim main buffer
-        if self._buffer is not None:
-            if len(self._buffer) > self._length_buffer:
-                low = len(self._buffer) - self._length_buffer
-                self._buffer = self._buffer[low:]
-
 
+@profiled
 class Epoch(Node):
     """Event-triggered epoching.
 
@@ -130,16 +151,28 @@ class Epoch(Node):
     It then sends the epoched data to an output stream, and sets the metadata to a dictionary containing the triggering marker and optional event data.
     Multiple, overlapping epochs are authorized. Each concurrent epoch is assigned its own `Port`. For convenience, the first epoch is bound to the default output, so you can avoid enumerating all output ports if you expects only one epoch.
 
+    Incoming samples are kept in a preallocated ring buffer, and each epoch is accumulated in its own preallocated array.
+    The DataFrame of an epoch is only built once, when the epoch is complete.
+
+    By default, epochs are cut by timestamps, so their length varies with jitter. When ``index`` is ``sample``, the onset is instead mapped to the sample with the nearest timestamp,
+    and each epoch contains exactly ``round(before * rate) + round(after * rate)`` samples, taken from the ring buffer. There is then no need for a `Trim` node.
+
+    In batched mode, all the epochs completed during one update are instead sent together to the default output, as a single contiguous array of shape (n_epochs, n_channels, n_samples).
+    Epochs shorter than ``n_samples`` are padded with NaN. The meta contains a parallel structured array ``epochs`` with the ``onset``, ``context``, number of valid ``samples`` and wall clock time when it was ``completed`` (:py:func:`time.time`, to measure the latency) of each epoch, an array ``times`` of shape (n_epochs, n_samples) with the timestamp of each sample, and the ``columns`` of the channels.
+
     Attributes:
         i (Port): Default data input, expects DataFrame.
         i_events (Port): Event input, expects DataFrame.
-        o (Port): Default output, provides DataFrame and meta.
+        o (Port): Default output, provides DataFrame and meta (or ndarray and meta in batched mode).
         o_* (Port): Dynamic outputs, provide DataFrame and meta.
 
     Args:
         event_trigger (string): The marker name.
         before (float): Length before onset, in seconds.
         after (float): Length after onset, in seconds.
+        rate (float): The rate of the input stream, used to size the buffers. If None (the default), it will be taken from the meta data, or estimated from the first chunk of data.
+        batch (bool): If ``True``, send all the epochs completed during one update as one array.
+        index (`time`|`sample`): Cut epochs by timestamps, or by a fixed number of samples around the onset sample.
 
     Example:
         .. literalinclude:: /../examples/epoch.yaml
@@ -147,90 +180,237 @@ class Epoch(Node):
 
     """
 
-    def __init__(self, event_trigger, before=0.2, after=0.6):
+    def __init__(self, event_trigger, before=0.2, after=0.6, rate=None, batch=False, index="time"):
 
         self._event_trigger = event_trigger
         self._before = pd.Timedelta(seconds=before)
         self._after = pd.Timedelta(seconds=after)
-        self._buffer = None
+        self._rate = rate
+        self._batch = batch
+        self._index = index
+        self._ring = None
+        self._disorder = -1 # Absolute index of the last non-monotonic sample
         self._epochs = [] # List whose elements will be dictionaries (Edit)
         self._epoch_id = 1  # Adding epoch id. (Edit)
 
     def update(self):
 
         # Append to main buffer
-        if self.i.data is not None:
-            if not self.i.data.empty:
-                if self._buffer is None:
-                    self._buffer = self.i.data
-                else:
-                    self._buffer = pd.concat([self._buffer, self.i.data])
+        if self.i.ready():
+            if self._ring is None:
+                self._initialize()
+            values = self.i.data.values
+            times = self.i.data.index.values.view(np.int64)
+            last = self._ring.last
+            if (last is not None and times[0] < last) or np.any(np.diff(times) < 0):
+                self._disorder = self._ring.stop + len(times) - 1
+            # Keep at least ``before`` seconds of data (or whole epochs in sample mode), plus the current chunk
+            self._ring.reserve(self._length_before + len(times))
+            self._ring.write(values, times)
 
         # Detect onset
         matches = match_events(self.i_events, self._event_trigger)
-        if matches is not None:
-            for index, row in matches.iterrows():
+        if matches is not None and self._ring is not None:
+            if self._disorder >= self._ring.start:
+                self.logger.warning("Index must be monotonic. Skipping epoch.")
+                matches = matches[:0]
+            onsets = _to_int(matches.index.values, self._index_dtype)
+            for index, onset, context in zip(matches.index, onsets, _contexts(matches)):
                 # Start a new epoch
-                low = index - self._before
-                high = index + self._after
-                if self._buffer is not None:
-                    if not self._buffer.index.is_monotonic_increasing:
-                        self.logger.warning("Index must be monotonic. Skipping epoch.")
-                        return
-                    try:
-                        context = json.loads(row["data"])
-                    except json.JSONDecodeError:
-                        context = row["data"]
-                    except TypeError:
-                        context = {}
-                    self._epochs.append(
-                        {
-                            "data": self._buffer[low:high],
-                            "meta": {
-                                "onset": index,
-                                "context": context,
-                                "before": self._before.total_seconds(),
-                                "after": self._after.total_seconds(),
-                            },
-                        }
-                    )
-
-        # Trim main buffer
-        if self._buffer is not None:
-            low = self._buffer.index[-1] - self._before 
-            try: # Edit: this line is sometimes chrashing the program, add warning
-                self._buffer = self._buffer[low:] 
-            except:
-                self.logger.warning("Problem with timestamps in Epochs node. Restarting the Timeflux application usually reolves this.")
+                self._epochs.append(
+                    {
+                        "data": None,
+                        "times": None,
+                        "length": 0,
+                        "onset": onset,
+                        "next": None, # The first sample, resolved once it is received
+                        "high": onset + self._after_int,
+                        "meta": {
+                            "onset": index,
+                            "context": context,
+                            "before": self._before.total_seconds(),
+                            "after": self._after.total_seconds(),
+                        },
+                    }
+                )
 
         # Update epochs
         if self._epochs and self.i.ready():
-            complete = 0
-            for epoch in self._epochs:
-                high = epoch["meta"]["onset"] + self._after
-                last = self.i.data.index[-1]
-                if epoch["data"].empty:
-                    low = epoch["meta"]["onset"] - self._before
-                    mask = (self.i.data.index >= low) & (self.i.data.index <= high)
-                else:
-                    low = epoch["data"].index[-1]
-                    mask = (self.i.data.index > low) & (self.i.data.index <= high)
-                # Append
-                epoch["data"] = pd.concat([epoch["data"], self.i.data[mask]])
-                # Send if we have enough data
-                if last >= high:
-                    o = getattr(self, "o_" + str(complete))
-                    o.data = epoch["data"]
-                    o.meta = {"epoch"+str(self._epoch_id): epoch["meta"]} # Edit
-                    complete += 1 
-                    self._epoch_id += 1 # Edit
-                else:
-                    pass
-            if complete > 0:
-                del self._epochs[:complete]  # Unqueue
-                self.o = self.o_0  # Bind default output to the first epoch
-
+            if self._index == "sample":
+                complete = self._update_samples()
+            else:
+                complete = self._update_times()
+            if complete:
+                epochs = [self._epochs[index] for index in complete if "outdated" not in self._epochs[index]]
+                completed = time()
+                for epoch in epochs:
+                    epoch["meta"]["completed"] = completed
+                if self._batch and epochs:
+                    self._send_batch(epochs)
+                elif epochs:
+                    for port, epoch in enumerate(epochs):
+                        o = getattr(self, "o_" + str(port))
+                        length = epoch["length"]
+                        o.data = pd.DataFrame(
+                            epoch["data"][:length],
+                            index=epoch["times"][:length].view(self._index_dtype),
+                            columns=self._columns,
+                        )
+                        o.meta = {"epoch"+str(self._epoch_id): epoch["meta"]} # Edit
+                        self._epoch_id += 1 # Edit
+                    self.o = self.o_0  # Bind default output to the first epoch
+                for index in reversed(complete):
+                    del self._epochs[index] # Unqueue
+
+    def _update_times(self):
+        """Accumulate the epochs cut by timestamps, and return the indices of the complete ones."""
+        complete = []
+        last = self._ring.last
+        # Find the first sample of the pending epochs at once, once the data reaches it
+        # (the marker is often received before the data)
+        pending = [
+            epoch
+            for epoch in self._epochs
+            if epoch["next"] is None and epoch["onset"] - self._before_int <= last
+        ]
+        if pending:
+            lows = np.array([epoch["onset"] for epoch in pending], dtype=np.int64) - self._before_int
+            for epoch, low in zip(pending, np.atleast_1d(self._ring.search(lows, side="left"))):
+                epoch["next"] = int(low)
+        # Find the last sample of all epochs at once, so only the new samples are copied
+        highs = np.array([epoch["high"] for epoch in self._epochs], dtype=np.int64)
+        stops = np.atleast_1d(self._ring.search(highs, side="right"))
+        for index, (epoch, stop) in enumerate(zip(self._epochs, stops)):
+            if epoch["next"] is None:
+                continue
+            if epoch["data"] is None:
+                epoch["data"] = np.empty((self._length_epoch, self._ring_channels), dtype=self._dtype)
+                epoch["times"] = np.empty(self._length_epoch, dtype=np.int64)
+            # Copy the new samples that belong to this epoch
+            start = max(epoch["next"], self._ring.start)
+            stop = int(stop)
+            if stop > start:
+                self._append(epoch, start, stop)
+                epoch["next"] = stop
+            # Send if we have enough data
+            if last >= epoch["high"]:
+                complete.append(index)
+        return complete
+
+    def _update_samples(self):
+        """Cut the epochs of a fixed number of samples, and return the indices of the complete ones."""
+        complete = []
+        last = self._ring.last
+        # Map all the pending onsets to their nearest sample at once
+        pending = [
+            epoch for epoch in self._epochs if epoch["next"] is None and epoch["onset"] <= last
+        ]
+        if pending:
+            onsets = np.array([epoch["onset"] for epoch in pending], dtype=np.int64)
+            after = np.atleast_1d(self._ring.search(onsets, side="left"))
+            before = np.maximum(after - 1, self._ring.start)
+            nearest = np.where(
+                onsets - self._ring.stamps(before) <= self._ring.stamps(after) - onsets,
+                before,
+                after,
+            )
+            for epoch, sample in zip(pending, nearest):
+                epoch["next"] = int(sample) - self._samples_before
+        for index, epoch in enumerate(self._epochs):
+            if epoch["next"] is None:
+                continue
+            if epoch["next"] < self._ring.start:
+                self.logger.warning("Outdated event. Skipping epoch.")
+                epoch["outdated"] = True
+                complete.append(index)
+            elif epoch["next"] + self._length_epoch <= self._ring.stop:
+                epoch["data"], epoch["times"] = self._ring.read(
+                    epoch["next"], epoch["next"] + self._length_epoch
+                )
+                epoch["length"] = self._length_epoch
+                complete.append(index)
+        return complete
+
+    def _initialize(self):
+        """Size the buffers from the first chunk of data."""
+        if not self._rate:
+            if "rate" in self.i.meta and self.i.meta["rate"]:
+                self._rate = self.i.meta["rate"]
+            elif len(self.i.data) > 1:
+                span = (self.i.data.index[-1] - self.i.data.index[0]).total_seconds()
+                self._rate = (len(self.i.data) - 1) / span
+            else:
+                self.logger.error("Rate is not specified")
+                raise WorkerInterrupt()
+        self._columns = self.i.data.columns
+        self._dtype = self.i.data.values.dtype
+        self._index_dtype = self.i.data.index.values.dtype
+        self._unit = np.datetime_data(self._index_dtype)[0]
+        self._before_int = self._before.to_timedelta64().astype(f"timedelta64[{self._unit}]").astype(np.int64)
+        self._after_int = self._after.to_timedelta64().astype(f"timedelta64[{self._unit}]").astype(np.int64)
+        if self._index == "sample":
+            self._samples_before = round(self._before.total_seconds() * self._rate)
+            self._length_epoch = self._samples_before + round(self._after.total_seconds() * self._rate)
+            self._length_before = self._length_epoch
+        else:
+            self._length_before = int(np.ceil(self._before.total_seconds() * self._rate)) + 1
+            self._length_epoch = int(np.ceil((self._before + self._after).total_seconds() * self._rate)) + 2
+        self._ring_channels = len(self._columns)
+        self._ring = RingBuffer(self._length_before + len(self.i.data), self._ring_channels, self._dtype)
+
+    def _send_batch(self, epochs):
+        """Send complete epochs as one (n_epochs, n_channels, n_samples) array."""
+        samples = max(self._length_epoch, max(epoch["length"] for epoch in epochs))
+        data = np.full((len(epochs), self._ring_channels, samples), np.nan)
+        times = np.full((len(epochs), samples), np.iinfo(np.int64).min) # NaT
+        meta = np.empty(
+            len(epochs),
+            dtype=[
+                ("onset", self._index_dtype),
+                ("context", object),
+                ("samples", np.int64),
+                ("completed", np.float64),
+            ],
+        )
+        for k, epoch in enumerate(epochs):
+            length = epoch["length"]
+            data[k, :, :length] = epoch["data"][:length].T
+            times[k, :length] = epoch["times"][:length]
+            meta[k] = (
+                epoch["meta"]["onset"].to_datetime64(),
+                epoch["meta"]["context"],
+                length,
+                epoch["meta"]["completed"],
+            )
+        self.o.data = data
+        self.o.meta = {
+            "rate": self._rate,
+            "before": self._before.total_seconds(),
+            "after": self._after.total_seconds(),
+            "epochs": meta,
+            "times": times.view(self._index_dtype),
+            "columns": list(self._columns),
+        }
 
+    def _append(self, epoch, start, stop):
+        """Copy samples from the ring buffer to the end of an epoch."""
+        length = epoch["length"]
+        needed = length + stop - start
+        if needed > len(epoch["times"]):
+            # Jittered data can slightly exceed the expected length
+            capacity = max(needed, 2 * len(epoch["times"]))
+            data = np.empty((capacity, self._ring_channels), dtype=self._dtype)
+            times = np.empty(capacity, dtype=np.int64)
+            data[:length] = epoch["data"][:length]
+            times[:length] = epoch["times"][:length]
+            epoch["data"], epoch["times"] = data, times
+        data, times = self._ring.read(
+            start, stop, epoch["data"][length:], epoch["times"][length:]
+        )
+        epoch["length"] = length + len(times)
+
+
+@profiled
 class Trim(Node):
     """Trim data so epochs are of equal length.
 
@@ -238,10 +418,11 @@ class Trim(Node):
     provide dataframes of equal dimensions. This can be problematic if the data is
     further processed by the `Pipeline` node, for example. This simple node takes care
     of trimming the extra samples. It should be placed just after an `Epoch` node.
+    Batches of epochs sent by an `Epoch` node in batched mode are trimmed as a whole.
 
     Attributes:
-        i_* (Port): Epoched data input, expects DataFrame.
-        o_* (Port): Trimmed epochs, provides DataFrame and meta.
+        i_* (Port): Epoched data input, expects DataFrame (or ndarray and meta for batches).
+        o_* (Port): Trimmed epochs, provides DataFrame and meta (or ndarray and meta for batches).
 
     Args:
         samples (int): The maximum number of samples per epoch.
@@ -255,7 +436,10 @@ class Trim(Node):
     def update(self):
         ports = []
         for a, b, port in self.iterate("i*"): # Edit "i_*" -> "i*"
-            if port.ready():
+            if port.ready() and isinstance(port.data, np.ndarray):
+                if self._trim_batch(port):
+                    ports.append(port)
+            elif port.ready():
                 if self.samples == 0:
                     self.samples = len(port.data)
                 if len(port.data) < self.samples:
@@ -270,6 +454,28 @@ class Trim(Node):
             o.data = port.data
             o.meta = port.meta
 
+    def _trim_batch(self, port):
+        """Trim a batch of epochs in place, and return `False` if nothing is left."""
+        epochs = port.meta["epochs"]
+        if self.samples == 0:
+            self.samples = int(epochs["samples"][0])
+        keep = epochs["samples"] >= self.samples
+        for samples in epochs["samples"][~keep]:
+            self.logger.warn(
+                f"Epoch rejected: not enough sample ({samples}<{self.samples})"
+            )
+        if not keep.any():
+            return False
+        epochs = epochs[keep]
+        epochs["samples"] = self.samples
+        port.data = np.ascontiguousarray(port.data[keep, :, : self.samples])
+        port.meta = {
+            **port.meta,
+            "epochs": epochs,
+            "times": np.ascontiguousarray(port.meta["times"][keep, : self.samples]),
+        }
+        return True
+
 
 class ToXArray(Node):
     """Convert multiple epochs to DataArray
@@ -279,12 +485,21 @@ class ToXArray(Node):
     epoch corresponds to th input ports, time to the ports data index and space to the
     ports data columns.
     A port is considered to be valid if it has meta with key 'epoch' and data with
-    expected number of samples.
+    expected number of samples. Batches of epochs sent by an `Epoch` node in batched
+    mode are also accepted: each epoch of the batch with the expected number of valid
+    samples is used, and the channels are named after the ``columns`` of the meta (or
+    numbered, if there are none).
     If some epoch have an invalid length (which happens when the data has jitter), the
     node either raises a warning, an error or pass.
 
+    If ``max_epochs`` is set, epochs are copied straight into a preallocated block of
+    shape (max_epochs, time, space) that is reused on every update, and the output
+    wraps a view of this block with cached coordinates. In that case, the output is
+    only valid until the next update, so downstream nodes must not keep a reference
+    to it. The block grows if more than ``max_epochs`` epochs are received at once.
+
     Attributes:
-        i_* (Port): Dynamic inputs, expects DataFrame and meta.
+        i_* (Port): Dynamic inputs, expects DataFrame and meta (or ndarray and meta for batches).
         o (Port): Default output, provides DataArray and meta.
 
     Args:
@@ -294,15 +509,20 @@ class ToXArray(Node):
         output (`DataArray`|`Dataset`): Type of output to return
         context_key (string|None): If output type is `Dataset`, key to define the
             target of the event. If `None`, the whole context is considered.
+        max_epochs (int|None): The number of epochs in the reused block. If `None`,
+            a new array is allocated on every update.
 
     """
 
-    def __init__(self, reporting="warn", output="DataArray", context_key=None):
+    def __init__(self, reporting="warn", output="DataArray", context_key=None, max_epochs=None):
 
         self._reporting = reporting
         self._output = output
         self._context_key = context_key
+        self._max_epochs = max_epochs
         self._columns = self._before = self._after = None
+        self._block = None
+        self._targets = {}
         self._ready = False
 
     def update(self):
@@ -314,29 +534,53 @@ class ToXArray(Node):
             # initialize attributes on first ready port
             port = ports_ready[0]
             if port.ready():
-                self._columns = port.data.columns
-                self._before = port.meta["epoch"]["before"]
-                self._after = port.meta["epoch"]["after"]
-                self._num_times = len(port.data)
+                if isinstance(port.data, np.ndarray):
+                    self._columns = pd.Index(
+                        port.meta.get("columns", range(port.data.shape[1]))
+                    )
+                    self._before = port.meta["before"]
+                    self._after = port.meta["after"]
+                    self._num_times = int(port.meta["epochs"]["samples"][0])
+                else:
+                    self._columns = port.data.columns
+                    self._before = port.meta["epoch"]["before"]
+                    self._after = port.meta["epoch"]["after"]
+                    self._num_times = len(port.data)
                 self._times = pd.TimedeltaIndex(
                     data=np.linspace(-self._before, self._after, self._num_times),
                     unit="s",
                 )
                 self._rate = 1 / (self._times[1] - self._times[0]).total_seconds()
+                if self._max_epochs:
+                    self._allocate(self._max_epochs, np.asarray(port.data).dtype)
                 self._ready = True
 
-        ports_ready = [
-            port for _, _, port in self.iterate(name="i*") if self._valid_port(port)
+        valid = [
+            epoch
+            for _, _, port in self.iterate(name="i*")
+            for epoch in self._valid_epochs(port)
         ]
 
-        if not ports_ready:
+        if not valid:
             return
 
-        list_onset = [port.meta["epoch"].get("onset") for port in ports_ready]
-        list_context = [port.meta["epoch"].get("context") for port in ports_ready]
-        list_epochs = [port.data for port in ports_ready]
+        list_epochs = [values for values, _, _ in valid]
+        list_onset = [onset for _, onset, _ in valid]
+        list_context = [context for _, _, context in valid]
 
-        data = np.stack([epoch.values for epoch in list_epochs], axis=0)
+        if self._block is not None:
+            if len(list_epochs) > len(self._block):
+                self.logger.warning(
+                    f"Received {len(list_epochs)} epochs, more than max_epochs. Growing."
+                )
+                self._allocate(2 * len(list_epochs), self._block.dtype)
+            for index, epoch in enumerate(list_epochs):
+                self._block[index] = epoch
+            data = self._block[: len(list_epochs)]
+            epochs = self._epoch_coords[: len(list_epochs)]
+        else:
+            data = np.stack(list_epochs, axis=0)
+            epochs = np.arange(data.shape[0])
 
         meta = {
             "epochs_context": list_context,
@@ -359,7 +603,7 @@ class ToXArray(Node):
                 data_array = xr.DataArray(
                     data,
                     dims=("epoch", "time", "space"),
-                    coords=(np.arange(data.shape[0]), self._times, self._columns),
+                    coords=(epochs, self._times, self._columns),
                 )
             self.o.data = data_array
             self.o.meta = meta
@@ -367,7 +611,7 @@ class ToXArray(Node):
             data_array = xr.DataArray(
                 data,
                 dims=("epoch", "time", "space"),
-                coords=(np.arange(data.shape[0]), self._times, self._columns),
+                coords=(epochs, self._times, self._columns),
             )
             self.o.data = xr.Dataset(
                 {
@@ -379,29 +623,56 @@ class ToXArray(Node):
             )
             self.o.meta = meta
 
+    def _allocate(self, max_epochs, dtype):
+        """Allocate the reused block and its epoch coordinates."""
+        self._block = np.empty(
+            (max_epochs, self._num_times, len(self._columns)), dtype=dtype
+        )
+        self._epoch_coords = np.arange(max_epochs)
+
     def _extract_target(self, context):
         if self._context_key is None:
             return context
         else:
             if isinstance(context, str):
-                context = json.loads(context)
+                # Contexts are repeated, so parse each of them only once
+                if context not in self._targets:
+                    self._targets[context] = json.loads(context).get(self._context_key)
+                return self._targets[context]
             return context.get(self._context_key)
 
-    def _valid_port(self, port):
-        """Checks that the port has valid meta and data."""
-        if port.data is None or port.data.empty:
-            return False
-        if "epoch" not in port.meta:
-            return False
-        if port.data.shape[0] != self._num_times:
+    def _valid_epochs(self, port):
+        """Get the valid epochs of a port, as (values, onset, context) tuples."""
+        if port.data is None:
+            return []
+        if isinstance(port.data, np.ndarray):
+            # A batch of epochs (n_epochs, n_channels, n_samples), padded with NaN
+            if port.data.size == 0 or "epochs" not in port.meta:
+                return []
+            epochs = port.meta["epochs"]
+            return [
+                (port.data[k, :, : self._num_times].T, pd.Timestamp(epoch["onset"]), epoch["context"])
+                for k, epoch in enumerate(epochs)
+                if self._valid_length(int(epoch["samples"]))
+            ]
+        if port.data.empty or "epoch" not in port.meta:
+            return []
+        if not self._valid_length(port.data.shape[0]):
+            return []
+        epoch = port.meta["epoch"]
+        return [(port.data.values, epoch.get("onset"), epoch.get("context"))]
+
+    def _valid_length(self, samples):
+        """Checks that an epoch has the expected number of samples."""
+        if samples != self._num_times:
             if self._reporting == "error":
                 raise WorkerInterrupt(
-                    f"Received an epoch with {port.data.shape[0]} "
+                    f"Received an epoch with {samples} "
                     f"samples instead of {self._num_times}."
                 )
             elif self._reporting == "warn":
                 self.logger.warning(
-                    f"Received an epoch with {port.data.shape[0]} "
+                    f"Received an epoch with {samples} "
                     f"samples instead of {self._num_times}. "
                     f"Skipping."
                 )
@@ -1,4 +1,6 @@
-from timeflux.helpers.port import match_events
+import numpy as np
+import pandas as pd
+from timeflux.helpers.port import match_events, get_meta
 
 def match_keys(port, key):
     """Find the given key in an event DataFrame
@@ -99,4 +101,83 @@ def get_dict_keys_by_start(dict, key_start, default=None):
 
 
 
-    
\ No newline at end of file
+    
+
+
+def get_epochs(port, samples):
+    """Get all epochs from an epoch port
+
+    Epochs are either sent one by one by the `Epoch` node (and possibly concatenated by
+    the `Sub` node, with one ``epoch*`` key per epoch in the meta), or as one array in
+    batched mode.
+
+    Args:
+        port (Port): The epoch port.
+        samples (int): The number of samples per epoch, used to split concatenated epochs.
+
+    Returns:
+        (tuple): A tuple containing:
+
+        * data (`ndarray`): The epochs (n_epochs x n_channels x n_samples).
+        * index (`ndarray`): The timestamp of each sample (n_epochs x n_samples).
+        * labels (`list`): The context of each epoch.
+        * onsets (`list`): The onset of each epoch.
+
+    """
+    if isinstance(port.data, np.ndarray):
+        epochs = port.meta["epochs"]
+        onsets = list(pd.to_datetime(epochs["onset"]))
+        return port.data, port.meta["times"], list(epochs["context"]), onsets
+    keys = get_dict_keys_by_start(port.meta, "epoch")
+    labels = [get_meta(port, (key, "context")) for key in keys]
+    onsets = [get_meta(port, (key, "onset")) for key in keys]
+    index = np.reshape(port.data.index.values, (len(keys), samples))
+    data = np.reshape(port.data.values, (len(keys), samples, -1)).transpose(0, 2, 1)
+    return data, index, labels, onsets
+
+
+def trace_id(timestamp):
+    """Get the trace id of a timestamp
+
+    The trace id identifies the data a prediction is about, to measure the latency from
+    the stimulus to the prediction. It is the timestamp in milliseconds, i.e. the client
+    timestamp sent with a marker when the timestamp is the onset of an epoch.
+
+    Args:
+        timestamp (Timestamp|datetime64): The timestamp.
+
+    Returns:
+        int: The trace id.
+
+    """
+    return int(round(pd.Timestamp(timestamp).value / 1e6))
+
+
+def get_trace(port):
+    """Get the trace of the most recent epoch from an epoch port
+
+    Args:
+        port (Port): The epoch port, as for :py:func:`get_epochs`.
+
+    Returns:
+        dict: The ``id`` of the trace (see :py:func:`trace_id`) and the time when the
+        epoch was ``completed`` (`None` if unknown), or `None` if there is no epoch.
+
+    """
+    if isinstance(port.data, np.ndarray):
+        epochs = port.meta["epochs"]
+        if len(epochs) == 0:
+            return None
+        completed = epochs["completed"][-1] if "completed" in epochs.dtype.names else None
+        onset = epochs["onset"][-1]
+    else:
+        keys = [key for key in get_dict_keys_by_start(port.meta, "epoch") if key[5:].isdigit()]
+        if not keys:
+            return None
+        meta = port.meta[max(keys, key=lambda key: int(key[5:]))]
+        completed = meta.get("completed")
+        onset = meta["onset"]
+    return {
+        "id": trace_id(onset),
+        "completed": None if completed is None else float(completed),
+    }
@@ -10,29 +10,44 @@
 import pandas as pd
 import numpy as np
 import uuid
+import threading
 from pylsl import (
     StreamInfo,
     StreamOutlet,
     StreamInlet,
-    resolve_stream,
     resolve_byprop,
-    pylsl,
+    local_clock,
+    proc_dejitter,
+    cf_float32,
+    cf_double64,
+    cf_int32,
+    cf_int16,
+    cf_int8,
+    cf_int64,
 )
 from time import time
 from timeflux.core.node import Node
+from timeflux.nodes_dev.profiler import profiled
 
+_MAX_SECONDS = 9e9 # The timestamps in ns must fit in an int64, with the offset of the clock
 
+
+@profiled
 class Send(Node):
 
     """Send to a LSL stream.
 
+    The columns of the right type are selected from the first frame. Each frame is then
+    converted once to an array of the format of the stream, and pushed as one chunk with
+    the timestamp of each sample.
+
     Attributes:
         i (Port): Default data input, expects DataFrame.
 
     Args:
         name (string): The name of the stream.
         type (string): The content type of the stream, .
-        format (string): The format type for each channel. Currently, only ``double64`` and ``string`` are supported.
+        format (string): The format type for each channel. Currently, only ``double64``, ``float32`` and ``string`` are supported.
         rate (float): The nominal sampling rate. Set to ``0.0`` to indicate a variable sampling rate.
         source (string, None): The unique identifier for the stream. If ``None``, it will be auto-generated.
 
@@ -42,7 +57,8 @@ class Send(Node):
 
     """
 
-    _dtypes = {"double64": np.number, "string": np.object}
+    _dtypes = {"double64": np.number, "float32": np.number, "string": object}
+    _np_dtypes = {"double64": np.float64, "float32": np.float32, "string": None}
 
     def __init__(self, name, type="Signal", format="double64", rate=0.0, source=None):
         if not source:
@@ -53,6 +69,9 @@ class Send(Node):
         self._rate = rate
         self._source = source
         self._outlet = None
+        self._labels = None # The columns sent, selected from the first frame
+        self._frame_columns = None # The columns of the last frame, and the position of the labels in them
+        self._indices = None
 
     def update(self):
 
@@ -60,32 +79,149 @@ class Send(Node):
         for name, suffix, port in gen_obj:
             if isinstance(port.data, pd.core.frame.DataFrame):
                 if not self._outlet:
-                    labels = list(
-                        port.data.select_dtypes(include=[self._dtypes[self._format]])
-                    ) # essentially df.columns 
+                    self._labels = port.data.select_dtypes(
+                        include=[self._dtypes[self._format]]
+                    ).columns
                     info = StreamInfo(
                         self._name,
                         self._type,
-                        len(labels),
+                        len(self._labels),
                         self._rate,
                         self._format,
                         self._source,
                     )
                     channels = info.desc().append_child("channels")
-                    for label in labels:
+                    for label in self._labels:
                         if not isinstance("string", type(label)):
                             label = str(label)
                         channels.append_child("channel").append_child_value("label", label)
                     self._outlet = StreamOutlet(info)
-                values = port.data.select_dtypes(
-                    include=[self._dtypes[self._format]]
-                ).values
+                    # Older versions of pylsl only take the timestamp of the last sample of a chunk
+                    self._stamps_per_sample = hasattr(self._outlet, "do_push_chunk_n")
+                if len(port.data) == 0:
+                    continue
+                values = self._values(port.data)
+                if values is None:
+                    continue
                 stamps = port.data.index.values.astype(np.float64)
+                if self._stamps_per_sample:
+                    self._outlet.push_chunk(values, stamps)
+                elif self._rate:
+                    # The other timestamps are derived from the nominal rate
+                    self._outlet.push_chunk(values, stamps[-1])
+                else:
+                    for row, stamp in zip(values, stamps):
+                        self._outlet.push_sample(row, stamp)
+
+    def _values(self, data):
+        """Get the values of the sent columns, in the format of the outlet.
+
+        The position of the sent columns is only looked up again when the columns of
+        the frame change.
+
+        """
+        if data.columns is not self._frame_columns:
+            if not data.columns.equals(self._frame_columns):
+                indices = data.columns.get_indexer(self._labels)
+                if (indices < 0).any():
+                    self.logger.error(
+                        f"Missing columns: {list(self._labels[indices < 0])}"
+                    )
+                    return None
+                self._indices = (
+                    None if np.array_equal(indices, np.arange(data.shape[1])) else indices
+                )
+            self._frame_columns = data.columns
+        if self._indices is not None:
+            data = data.iloc[:, self._indices]
+        dtype = self._np_dtypes[self._format]
+        if dtype is None:
+            return data.to_numpy().astype(str).tolist()
+        return np.ascontiguousarray(data.to_numpy(dtype=dtype))
+
+
+class StreamResolver:
+
+    """Resolve a LSL stream and open an inlet in a background thread.
+
+    :py:func:`pylsl.resolve_byprop` blocks until a stream is found or the timeout
+    expires, which would stall the whole graph if it was called from ``update()``. The
+    resolution is retried, ``timeout`` seconds at a time, until a stream is found or the
+    resolver is stopped. The inlet is opened with ``recover=False``, so that a lost
+    stream raises :py:class:`pylsl.LostError` instead of waiting silently for a
+    stream that may never come back: the owner then calls :py:meth:`start` to find
+    the stream again, e.g. when a headset reconnects with a new stream.
+
+    Args:
+        prop (string): The property to look for (e.g., ``name``, ``type``, ``source_id``).
+        value (string): The value that the property should have.
+        timeout (float): The timeout of each resolution attempt, in seconds.
+        logger (Logger): The logger of the node.
+        processing_flags (int): The post-processing of the timestamps by the inlet (e.g., ``proc_clocksync``).
+
+    """
+
+    def __init__(self, prop, value, timeout=1.0, logger=None, processing_flags=0):
+        self._prop = prop
+        self._value = value
+        self._timeout = timeout
+        self._logger = logger
+        self._processing_flags = processing_flags
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._found = None
+
+    def start(self):
+        """Start looking for the stream, unless already looking."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
 
+    def get(self):
+        """Take the inlet, without blocking.
 
-                for row, stamp in zip(values, stamps):
-                    self._outlet.push_sample(row, stamp)
+        Returns:
+            tuple, None: The inlet and the full stream info, or ``None`` if no stream
+            was found yet. The inlet is only returned once.
 
+        """
+        with self._lock:
+            found, self._found = self._found, None
+        return found
+
+    def stop(self):
+        """Stop looking for the stream."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if self._logger:
+                self._logger.debug(f"Resolving stream with {self._prop} {self._value}")
+            streams = resolve_byprop(self._prop, self._value, timeout=self._timeout)
+            if not streams or self._stopping.is_set():
+                continue
+            inlet = StreamInlet(
+                streams[0], recover=False, processing_flags=self._processing_flags
+            )
+            try:
+                info = inlet.info(timeout=max(self._timeout, 1.0))
+            except RuntimeError as error:
+                # pylsl.TimeoutError or pylsl.LostError, the stream is already gone
+                if self._logger:
+                    self._logger.debug(f"Could not open the stream: {error}")
+                continue
+            with self._lock:
+                self._found = (inlet, info)
+            return
+
+
+@profiled
 class Receive(Node):
 
     """Receive from a LSL stream.
@@ -96,12 +232,13 @@ class Receive(Node):
     Args:
         prop (string): The property to look for during stream resolution (e.g., ``name``, ``type``, ``source_id``).
         value (string): The value that the property should have (e.g., ``EEG`` for the type property).
-        timeout (float): The resolution timeout, in seconds.
+        timeout (float): The timeout of each resolution attempt, in seconds. The stream is resolved in the background, and again when it is lost, without blocking the graph.
         unit (string): Unit of the timestamps (e.g., ``s``, ``ms``, ``us``, ``ns``). The LSL library uses seconds by default. Timeflux uses nanoseconds. Default: ``s``.
         sync (string, None): The method used to synchronize timestamps. Use ``local`` if you receive the stream from another application on the same computer. Use ``network`` if you receive from another computer. Use ``None`` if you receive from a Timeflux instance on the same computer.
         channels (list, None): Override the channel names. If ``None``, the names defined in the LSL stream will be used.
         max_samples (int): The maximum number of samples to return per call.
         drop (string, list of string): name of columns to drop. 
+        preallocate (bool): Pull numeric streams into a buffer of ``max_samples`` samples, allocated once, instead of Python lists. The output is still a new array on each update.
 
     Example:
         .. literalinclude:: /../examples/lsl_multiple.yaml
@@ -109,6 +246,16 @@ class Receive(Node):
 
     """
 
+    _scales = {"s": 1e9, "ms": 1e6, "us": 1e3, "ns": 1}
+    _formats = {
+        cf_float32: np.float32,
+        cf_double64: np.float64,
+        cf_int32: np.int32,
+        cf_int16: np.int16,
+        cf_int8: np.int8,
+        cf_int64: np.int64,
+    }
+
     def __init__(
         self,
         prop="name",
@@ -119,9 +266,12 @@ class Receive(Node):
         channels=None,
         max_samples=1024,
         drop=None,
+        preallocate=False,
     ):
         if not value:
             raise ValueError("Please specify a stream name or a property and value.")
+        if unit not in self._scales:
+            raise ValueError(f"Invalid unit: {unit}")
         self._prop = prop
         self._value = value
         self._inlet = None
@@ -131,18 +281,20 @@ class Receive(Node):
         self._channels = channels
         self._timeout = timeout
         self._max_samples = max_samples
-        self._offset = np.timedelta64(int((time() - pylsl.local_clock()) * 1e9), "ns")
+        self._offset = np.timedelta64(int((time() - local_clock()) * 1e9), "ns")
         self.drop=drop
+        self._preallocate = preallocate
+        self._buffer = None
+        self._resolver = StreamResolver(prop, value, timeout, self.logger)
+        self._resolver.start()
 
     def update(self):
         if not self._inlet:
-            self.logger.debug(f"Resolving stream with {self._prop} {self._value}")
-            streams = resolve_byprop(self._prop, self._value, timeout=self._timeout)
-            if not streams:
+            found = self._resolver.get()
+            if not found:
                 return
             self.logger.debug("Stream acquired")
-            self._inlet = StreamInlet(streams[0])
-            info = self._inlet.info()
+            self._inlet, info = found
             self._meta = {
                 "name": info.name(),
                 "type": info.type(),
@@ -158,23 +310,329 @@ class Receive(Node):
                 for _ in range(info.channel_count() - 1):
                     channel = channel.next_sibling()
                     self._labels.append(channel.child_value("label"))
+            self._resolve_columns(info)
         if self._inlet:
-            values, stamps = self._inlet.pull_chunk(max_samples=self._max_samples)
-            if stamps:
-                stamps = pd.to_datetime(stamps, format=None, unit=self._unit)
-                if self._sync == "local":
-                    stamps += self._offset
-                elif self._sync == "network":
-                    stamps = (
-                        stamps
-                        + np.timedelta64(self._inlet.time_correction() * 1e9, "ns")
-                        + self._offset
+            try:
+                if self._buffer is not None:
+                    # Pull straight into the preallocated buffer, without Python lists
+                    _, stamps = self._inlet.pull_chunk(
+                        max_samples=self._max_samples, dest_obj=self._buffer
                     )
-            labels_to_keep = self._labels.copy() # To have the original labels left. Need to drop every time new data is pulled from LSL. 
-            if self.drop:
-                values = pd.DataFrame(values,index=stamps,columns=self._labels).drop(columns=self.drop) # Create a dataframe because it is easy to drop from.
-                if type(self.drop) == list: # If more than one column to drop. 
-                    [labels_to_keep.remove(i) for i in self.drop] # Drop the columns from list of labels
+                    values = self._buffer[: len(stamps)]
+                    if self._keep is not None:
+                        values = values[:, self._keep].astype(self._output_dtype, copy=False)
+                    else:
+                        values = values.astype(self._output_dtype) # Copy, the buffer is reused
                 else:
-                    labels_to_keep.remove(self.drop) # Drop the column from list of labels
-            self.o.set(values, stamps, labels_to_keep, self._meta) # Set data to output port with our target labels. 
+                    values, stamps = self._inlet.pull_chunk(max_samples=self._max_samples)
+                    if self._keep is not None and len(stamps):
+                        values = np.asarray(values)[:, self._keep]
+            except RuntimeError as error:
+                # pylsl.LostError: look for the stream again, e.g. a reconnected headset
+                self.logger.warning(f"Lost the stream ({error}), resolving it again")
+                self._inlet = None
+                self._resolver.start()
+                return
+            stamps = self._timestamps(stamps)
+            self.o.set(values, stamps, self._labels_to_keep, self._meta) # Set data to output port with our target labels.
+
+    def terminate(self):
+        self._resolver.stop()
+
+    def _resolve_columns(self, info):
+        """Find the columns to keep and allocate the pull buffer, once per stream."""
+        drop = [] if not self.drop else self.drop if type(self.drop) == list else [self.drop]
+        for label in drop:
+            if label not in self._labels:
+                raise ValueError(f"Cannot drop {label}, the columns are {self._labels}")
+        keep = [index for index, label in enumerate(self._labels) if label not in drop]
+        self._labels_to_keep = [self._labels[index] for index in keep]
+        self._keep = np.array(keep, dtype=np.intp) if drop else None
+        self._buffer = None
+        dtype = self._formats.get(info.channel_format())
+        if self._preallocate and dtype is not None:
+            self._buffer = np.empty((self._max_samples, info.channel_count()), dtype=dtype)
+            # The same dtype as the lists of the default mode
+            self._output_dtype = np.float64 if np.issubdtype(dtype, np.floating) else np.int64
+
+    def _timestamps(self, stamps):
+        """Convert the LSL timestamps to datetime64, with integer arithmetic."""
+        stamps = np.round(np.asarray(stamps, dtype=np.float64) * self._scales[self._unit])
+        offset = 0
+        if self._sync == "local":
+            offset = int(self._offset.astype(np.int64))
+        elif self._sync == "network" and len(stamps):
+            offset = int(self._inlet.time_correction() * 1e9) + int(self._offset.astype(np.int64))
+        # The cast would turn them into NaT silently
+        limit = float(np.iinfo(np.int64).max) - abs(offset)
+        if not (np.isfinite(stamps) & (np.abs(stamps) < limit)).all():
+            raise ValueError(
+                f"Out of bounds timestamps with the unit {self._unit}: "
+                f"{stamps[:3] / self._scales[self._unit]}"
+            )
+        stamps = stamps.astype(np.int64)
+        stamps += offset
+        return stamps.view("datetime64[ns]")
+
+
+@profiled
+class ReceiveAligned(Node):
+
+    """Receive from several LSL streams, aligned on a common clock, as one frame.
+
+    Each stream (e.g., one EEG headset per participant) is resolved in the background,
+    as with :py:class:`Receive`. The timestamps are dejittered by the inlets, converted
+    to seconds with ``unit``, and then to the local clock with the ``time_correction``
+    of each inlet, refreshed every second. The correction is applied by the node rather
+    than by the inlet (``proc_clocksync``), since the correction is in seconds whatever
+    the unit of the timestamps. The samples received before the first correction is
+    known are dropped. The samples of each stream are then linearly interpolated on a
+    common grid of ``rate`` Hz. The output has the channels
+    of all the streams side by side, named ``<prefix>_<label>``.
+
+    Rows are sent up to the last timestamp received from every stream, so the output
+    lags behind the slowest stream. A stream that is more than ``max_lag`` seconds
+    behind the others (e.g., a disconnected headset) is not waited for: its columns are
+    ``NaN`` until it catches up. The output starts once every stream has been found.
+
+    Downsampling is done without an anti-aliasing filter: use a ``rate`` at least as high
+    as the streams, or filter the streams first.
+
+    Attributes:
+        o (Port): Default output, provides DataFrame and meta.
+
+    Args:
+        prop (string): The property to look for during stream resolution (e.g., ``name``, ``type``, ``source_id``).
+        values (list of string): The value of the property for each stream (e.g., the ``source_id`` of each headset).
+        prefixes (list of string, None): The prefix of the columns of each stream. Default: ``values``.
+        rate (float, None): The rate of the output, in Hz. Default: the highest nominal rate of the streams.
+        max_lag (float): How long to wait for a late stream, in seconds.
+        unit (string): Unit of the timestamps of the streams (e.g., ``s``, ``ms``, ``us``, ``ns``). Default: ``s``.
+        sync (string, None): Use ``local`` to convert the local LSL clock to the time of this computer. Use ``None`` to keep the LSL clock, as the other ``Receive`` nodes of the graph with ``sync: null``.
+        timeout (float): The timeout of each resolution attempt, in seconds.
+        max_samples (int): The maximum number of samples to pull per stream, and of rows to send, per call. After a jump of the timestamps, the rows in between are skipped.
+
+    Example:
+        .. code-block:: yaml
+
+           - id: eeg_LSL_receiver
+             module: timeflux.nodes_dev.lsl
+             class: ReceiveAligned
+             params:
+               prop: source_id
+               values: [MuseS-1A2B, MuseS-3C4D]
+               prefixes: [p1, p2]
+               rate: 256
+               unit: s
+
+    """
+
+    def __init__(
+        self,
+        prop="name",
+        values=None,
+        prefixes=None,
+        rate=None,
+        max_lag=1.0,
+        unit="s",
+        sync="local",
+        timeout=1.0,
+        max_samples=1024,
+    ):
+        if not values or not isinstance(values, list):
+            raise ValueError("Please specify a list of stream names or property values.")
+        if unit not in Receive._scales:
+            raise ValueError(f"Invalid unit: {unit}")
+        if prefixes is None:
+            prefixes = [str(value) for value in values]
+        if len(prefixes) != len(values):
+            raise ValueError("Please specify one prefix per stream.")
+        self._streams = [
+            _AlignedStream(prop, value, prefix, unit, timeout, max_samples, self.logger)
+            for value, prefix in zip(values, prefixes)
+        ]
+        self._rate = rate
+        self._max_lag = max_lag
+        self._max_samples = max_samples
+        self._start = None
+        self._count = 0
+        self._offset = int((time() - local_clock()) * 1e9) if sync == "local" else 0
+        self._labels = None
+        self._meta = None
+
+    def update(self):
+        for stream in self._streams:
+            stream.pull()
+        if self._start is None:
+            if not self._ready():
+                return
+            # The grid starts when every stream has data
+            self._start = max(stream.times[0] for stream in self._streams)
+        newest = max(
+            (stream.times[-1] for stream in self._streams if len(stream.times)),
+            default=None,
+        )
+        if newest is None:
+            return
+        horizon = min(
+            stream.times[-1] if len(stream.times) else -np.inf for stream in self._streams
+        )
+        horizon = max(horizon, newest - self._max_lag)
+        if horizon < self._start + self._count / self._rate - self._max_lag:
+            # The timestamps went back, e.g. a stream restarted with another clock
+            self.logger.warning("The timestamps went back, starting a new grid")
+            self._start = max(stream.times[0] for stream in self._streams if len(stream.times))
+            self._count = 0
+        count = int(np.floor((horizon - self._start) * self._rate)) + 1 - self._count
+        if count <= 0:
+            return
+        if count > self._max_samples:
+            # After a jump of the timestamps, don't allocate the rows in between
+            self.logger.warning(f"Skipping {count - self._max_samples} rows")
+            self._start += (self._count + count - self._max_samples) / self._rate
+            self._count = 0
+            count = self._max_samples
+        grid = self._start + (self._count + np.arange(count)) / self._rate
+        self._count += count
+        values = np.hstack([stream.interpolate(grid) for stream in self._streams])
+        for stream in self._streams:
+            stream.trim(grid[-1])
+        stamps = (np.round(grid * 1e9).astype(np.int64) + self._offset).view("datetime64[ns]")
+        self.o.set(values, stamps, self._labels, self._meta)
+
+    def terminate(self):
+        for stream in self._streams:
+            stream.resolver.stop()
+
+    def _ready(self):
+        """Check that every stream was found and has data, and set the columns."""
+        for stream in self._streams:
+            if stream.labels is None:
+                return False
+        if self._labels is None:
+            self._labels = [label for stream in self._streams for label in stream.labels]
+            if self._rate is None:
+                self._rate = max(stream.meta["rate"] for stream in self._streams)
+            if not self._rate:
+                raise ValueError("Please specify a rate, the streams have no nominal rate.")
+            self._meta = {
+                "rate": self._rate,
+                "streams": [stream.meta for stream in self._streams],
+            }
+        if all(len(stream.times) for stream in self._streams):
+            return True
+        # Keep the last samples only, until every stream has data
+        for stream in self._streams:
+            if len(stream.times):
+                stream.trim(stream.times[-1] - self._max_lag)
+        return False
+
+
+class _AlignedStream:
+
+    """One stream of :py:class:`ReceiveAligned`, with the samples not yet interpolated."""
+
+    def __init__(self, prop, value, prefix, unit, timeout, max_samples, logger):
+        self.prefix = prefix
+        self.resolver = StreamResolver(
+            prop, value, timeout, logger, processing_flags=proc_dejitter
+        )
+        self.resolver.start()
+        self.inlet = None
+        self.labels = None
+        self.meta = None
+        self.times = np.empty(0)
+        self.values = None
+        self._value = value
+        self._unit = unit
+        self._scale = Receive._scales[unit] / 1e9 # To seconds
+        self._max_samples = max_samples
+        self._buffer = None
+        self._logger = logger
+
+    def pull(self):
+        """Append the available samples, and look for the stream again if it is lost."""
+        if not self.inlet:
+            found = self.resolver.get()
+            if not found:
+                return
+            self._open(*found)
+        try:
+            _, stamps = self.inlet.pull_chunk(
+                max_samples=self._max_samples, dest_obj=self._buffer
+            )
+        except RuntimeError as error:
+            # pylsl.LostError
+            self._logger.warning(f"Lost the stream {self._value} ({error}), resolving it again")
+            self.inlet = None
+            self.resolver.start()
+            return
+        now = local_clock()
+        if now >= self._next_correction:
+            try:
+                self._correction = self.inlet.time_correction(timeout=0.0)
+                self._next_correction = now + 1.0
+            except RuntimeError:
+                pass # pylsl.TimeoutError: not estimated yet, liblsl keeps trying
+        if not stamps or self._correction is None:
+            return
+        stamps = np.asarray(stamps) * self._scale
+        if not (np.isfinite(stamps) & (np.abs(stamps) < _MAX_SECONDS)).all():
+            raise ValueError(
+                f"Out of bounds timestamps of the stream {self._value} with the unit "
+                f"{self._unit}: {stamps[:3] / self._scale}"
+            )
+        self.times = np.concatenate((self.times, stamps + self._correction))
+        self.values = np.concatenate((self.values, self._buffer[: len(stamps)]))
+
+    def interpolate(self, grid):
+        """Interpolate the samples at the times of the grid, NaN where there are none."""
+        times = self.times
+        values = np.full((len(grid), len(self.labels)), np.nan)
+        if len(times) == 0:
+            return values
+        inside = (grid >= times[0]) & (grid <= times[-1])
+        if len(times) == 1:
+            values[inside] = self.values[0]
+            return values
+        index = np.clip(np.searchsorted(times, grid, side="right") - 1, 0, len(times) - 2)
+        span = times[index + 1] - times[index]
+        weight = np.divide(
+            grid - times[index], span, out=np.zeros(len(grid)), where=span > 0
+        )[:, np.newaxis]
+        before = self.values[index]
+        values[inside] = (before + weight * (self.values[index + 1] - before))[inside]
+        return values
+
+    def trim(self, time):
+        """Drop the samples that are no longer needed after this time."""
+        start = max(np.searchsorted(self.times, time, side="right") - 1, 0)
+        if start:
+            self.times = self.times[start:]
+            self.values = self.values[start:]
+
+    def _open(self, inlet, info):
+        dtype = Receive._formats.get(info.channel_format())
+        if dtype is None:
+            raise ValueError(f"The stream {self._value} is not numeric")
+        channel = info.desc().child("channels").first_child()
+        labels = []
+        for index in range(info.channel_count()):
+            labels.append(f"{self.prefix}_{channel.child_value('label') or index}")
+            channel = channel.next_sibling()
+        if self.labels is not None and labels != self.labels:
+            # The columns of the output can't change
+            raise ValueError(f"The channels of the stream {self._value} have changed: {labels}")
+        self.inlet = inlet
+        self.labels = labels
+        self.meta = {
+            "name": info.name(),
+            "type": info.type(),
+            "rate": info.nominal_srate(),
+            "info": str(info.as_xml()).replace("\n", "").replace("\t", ""),
+        }
+        self._buffer = np.empty((self._max_samples, info.channel_count()), dtype=dtype)
+        self._correction = None # The time correction of the inlet, in seconds
+        self._next_correction = 0
+        self.times = np.empty(0)
+        self.values = np.empty((0, info.channel_count()))
@@ -17,7 +17,9 @@ from pyriemann.estimation import Covariances
 
 from timeflux.core.node import Node
 from timeflux.helpers.port import make_event, match_events, get_meta
-from timeflux.nodes_dev.helpers import get_data, get_dict_keys_by_start
+from timeflux.nodes_dev.buffers import RunningAverages
+from timeflux.nodes_dev.helpers import get_data, get_epochs, get_trace, trace_id
+from timeflux.nodes_dev.profiler import profiled
 
 from pylsl import StreamInfo, StreamOutlet, StreamInlet, resolve_byprop
 
@@ -36,6 +38,7 @@ FITTING = 2
 READY = 3
 
 
+@profiled
 class Inference(Node):
     """
     Load ML-model and predict.
@@ -113,8 +116,9 @@ class Inference(Node):
                 pred = str(int(pred[0]))
                 self.logger.debug("Prediction: {}, type: {}".format(pred,type(pred)))
 
-                # Create event and set output port
-                pred_event = make_event("predictions", {"class": pred} ,serialize=True)
+                # Create event and set output port. The trace is the last sample of the window, for the latency measurements of the engine.
+                trace = {"id": trace_id(self.i_rolling.data.index[-1]), "model": time()}
+                pred_event = make_event("predictions", {"class": pred, "trace": trace} ,serialize=True)
                 self.o.data = pred_event
                 self.o.meta = self.i.meta
 
@@ -200,19 +204,24 @@ class Transform(Node):
 
 
 
+@profiled
 class AverageERP(Node):
     """
     Average ERPs for each label
 
     For epochs with different class labels (from the CBM-game), this node is trying to find the odd-one-out class.
         - Epoched data is collected for each class of stimili. 
-        - For each class the epochs are then averaged. 
+        - For each class the epochs are then averaged (running averages, the epochs themselves are not kept). 
         - Covariance matrices for each average epochs are then computed. 
         - The covariance matrices are then compared and one is picked to be the odd-one-out.
+
+    Args:
+        variance (bool): Also keep the running standard deviation of each class (logged with the predictions).
     """
 
     def __init__(
         self,
+        variance=False,
         ):
 
         super(AverageERP, self).__init__()
@@ -224,8 +233,11 @@ class AverageERP(Node):
         # Parameters NOT set by user
         self._status_admin = IDLE
         self._shape = None
-        self._X_train = None
-        self._y_train = None
+        self._variance = variance
+        self._colors = {key: str(value) for value, key in enumerate(colors_str, start=0)}
+        self._attributes = {key: str(value) for value, key in enumerate(attributes_str, start=0)}
+        self._color_of = {value: key for key, value in self._colors.items()} # Marker digit -> color
+        self._averages = RunningAverages(self._colors.keys(), variance) # Per-color running averages of the current trial
         self._cov = Covariances()
 
     def update(self):
@@ -243,8 +255,7 @@ class AverageERP(Node):
                 if matches is not None and int(matches['data'][-1]) == ACCUMULATING: # If there is a status sent
                     if self.accumulate_data == False: # If this is first update where data is accumulating, generate filename and reset params.
                         self._shape = None
-                        self._X_train = None
-                        self._y_train = None
+                        self._averages.reset()
                     self.accumulate_data = True
                 elif matches is not None: # If the status is not ACCUMULATING (if matches is none, no status sent, continue with the latest activity)
                     self.accumulate_data = False
@@ -259,8 +270,7 @@ class AverageERP(Node):
                 if matches_start is not None:
                     for user_no in matches_start['data']:
                         self._shape = None
-                        self._X_train = None
-                        self._y_train = None
+                        self._averages.reset()
                         self.accumulate_data = True
 
 
@@ -274,8 +284,7 @@ class AverageERP(Node):
 
                             # Reset data arrays
                             self._shape = None
-                            self._X_train = None
-                            self._y_train = None
+                            self._averages.reset()
 
                 matches_end = match_events(self.i_events,'end') # 1 is data value for status == ACCUMULATING
                 if matches_end is not None:
@@ -285,8 +294,7 @@ class AverageERP(Node):
 
                             # Reset data arrays
                             self._shape = None
-                            self._X_train = None
-                            self._y_train = None
+                            self._averages.reset()
 
         # == Accumulate incoming data (similar to save_numpy.py) ==
 
@@ -295,103 +303,51 @@ class AverageERP(Node):
             port = self.i_epochs # Port with EEG data. 
             if self.i_epochs.ready():
 
-                index = port.data.index.values # earliest timestamp of recieved epoch # NOT USED ATM?
-                data = port.data.values
-                data = data.transpose(1,0) # transpose data to match scikit learn input
-                label = get_meta(port, self.meta_label) # get label of epoch
-
-                # Funcitonallity for recieving multiple epochs during one update iteration.
-                keys = get_dict_keys_by_start(port.meta, "epoch")
-                labels = []
-                tss = [] # Timestamps
-                for key in keys:
-                    #label = get_meta(port, self.meta_label) # get label of epoch
-                    label = str(get_meta(port, (key,"context"))) # get label of epoch
-                    ts = get_meta(port, (key, "onset"))
-                    labels.append(label)
-                    tss.append(ts)
-
-                if len(keys) != len(labels):
-                    die # Variable that does not exist -> crashes the program.
-
-                index = np.reshape(index, (len(keys), self.no_epoch_samples))
-                data = np.reshape(data, (len(keys), data.shape[0], self.no_epoch_samples))
+                # Funcitonallity for recieving multiple epochs during one update iteration (one by one or batched).
+                # data is (n_epochs, n_channels, n_samples) to match scikit learn input. Timestamps are not used atm.
+                data, index, labels, tss = get_epochs(port, self.no_epoch_samples)
+                labels = [str(label) for label in labels]
 
                 # Check shape of epoch
                 if self._shape and (data.shape[1:] != self._shape):
                     self.logger.warning("Invalid shape: {}".format(data.shape[1:]))
-                elif self.meta_label is not None and len(labels)!=len(keys):
+                elif self.meta_label is not None and len(labels)!=len(data):
                     self.logger.warning("Invalid label")
 
                 else:
 
-                    # == Append data/labels to data matrix/label vector ==
-                    # TODO: If we are ony interested in the averaged matrices, there is no point in saving the full dataframes like this.
-
-                    # If _X_train is None: create array, else: append to _X_train
-                    if self._X_train is None:
-                        self._X_train = np.array(data)
-                        self._shape = self._X_train.shape[1:]
-                        # self._X_train_ts = np.array(index) # skip timestamps for now.
-
-                    else:
-                        self._X_train = np.vstack((self._X_train, data))
-                        #self._X_train_ts = np.vstack((self._X_train_ts, index)) # skip timestamps for now.
-
-                    # If _y_train is None: create array, else: append to _y_train
-                    if label is not None:
-                        if self._y_train is None:
-                            self._y_train = np.array(labels)
-                            #self._y_train_ts = np.array([tss]) # skip timestamps for now.
-                        else:
-                            self._y_train = np.append(self._y_train, labels)
-                            #self._y_train_ts = np.append(self._y_train_ts, [tss]) # skip timestamps for now.
+                    # == Update the running average of each color ==
+                    # The color is given by the 'marker_color_position'-th position in each label.
+                    labels_color = [self._color_of.get(label[marker_color_position]) if len(label) > marker_color_position else None for label in labels]
+                    self._averages.update(data, labels_color)
+                    self._shape = data.shape[1:]
 
                 # ==== Data averageing and analysis =====
     
-                if (self._X_train is not None) and (self._y_train is not None):
-
-                    # Check the unique labels
-
-                    labels_unique = pd.unique(self._y_train) # pd.unique() is faster than np.unique() (+ gives unsorted values by default)
-                    labels = self._y_train # pd.unique() is faster than np.unique() (+ gives unsorted values by default)
-                    self.logger.debug("Shape self._y_train;: {}. labels_unique: {}".format(self._y_train.shape, labels_unique))
-
-                    colors = {key: str(value) for value, key in enumerate(colors_str, start=0)}
-                    attributes = {key: str(value) for value, key in enumerate(attributes_str, start=0)}
-
-                    labels_color =  np.empty(labels.shape, dtype=object)
-                    labels_attribute =  np.empty(labels.shape, dtype=object)
-
-                    # For each color, ceate a list of indices indicating this color. Then, build a new labels_color vector based on color only.
-                    # (Done by checking the 'marker_color_position'-th position in each label to see what is the corresponding color)
-                    for key, value in colors.items():
-                        indices = [index for index, entry in enumerate(labels) if entry[marker_color_position] == value]
-                        labels_color[indices] = key 
-
-                    # Do the same for attributes...
-                    for key, value in attributes.items():
-                        indices = [index for index,entry in enumerate(labels) if entry[marker_attribute_position] == value]
-                        labels_attribute[indices] = key
+                if self._averages.shape is not None:
 
+                    colors = self._colors
+                    attributes = self._attributes
+                    self.logger.debug("Number of epochs per color: {}".format(dict(zip(colors.keys(), self._averages.counts))))
 
                     # ==== If we have enough labels: Find indicating indices for each color and attribute ====
-                    if len(np.unique(labels_color)) >= 5:
+                    if np.count_nonzero(self._averages.counts) >= 5:
 
                         # == Average epochs for colors/attributes respectively ==
 
                         # By color
-                        X_avg_color, color_order = average_epochs(self._X_train, labels_color, colors.keys())
+                        X_avg_color = self._averages.mean()
                         X_avg = X_avg_color
-                        category_order = list(color_order)
+                        category_order = list(self._averages.classes)
 
-                        # By color and attribute
+                        # By color and attribute (would need running averages by attribute as well)
                         """
-                        X_avg_attribute, attribute_order = self.average_epochs(self._X_train, labels_attribute, attributes.keys()) 
+                        X_avg_attribute = self._attribute_averages.mean()
                         X_avg = np.vstack((X_avg_color, X_avg_attribute))
-                        category_order = list(color_order) + list(attribute_order)
+                        category_order = list(category_order) + list(self._attribute_averages.classes)
                         """
-                        self.logger.debug("shape _X_train: {}".format(self._X_train.shape))
+                        if self._variance:
+                            self.logger.debug("Std. dev. per color (mean over channels and samples): {}".format(self._averages.std().mean(axis=(1, 2))))
 
          
                         # == Decide how to run the algorithm here ==
@@ -410,6 +366,11 @@ class AverageERP(Node):
                     labels_list = list(colors.keys()) + list(attributes.keys())
                     pred_dict = dict(zip(labels_list, pred))
 
+                    # The trace of the last epoch, for the latency measurements of the engine
+                    trace = get_trace(port)
+                    if trace is not None:
+                        pred_dict["trace"] = {"id": trace["id"], "epoch": trace["completed"], "model": time()}
+
                     # Create event and set output port
                     pred_event = make_event("predictions", pred_dict ,serialize=True)
                     self.o.data = pred_event
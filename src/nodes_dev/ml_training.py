@@ -17,6 +17,7 @@ from timeflux.core.exceptions import ValidationError
 from timeflux.helpers.background import Task
 from timeflux.helpers.port import make_event, match_events
 from timeflux.helpers.clock import now
+from timeflux.nodes_dev.profiler import profiled
 
 # status_fitting
 FITTING_IDLE = 0
@@ -31,6 +32,7 @@ FITTING = 2
 READY = 3
 
 
+@profiled
 class TrainingML(Node):
     """
 
@@ -129,18 +131,16 @@ class TrainingML(Node):
 
             for filename_x in glob.glob('{}/X_*'.format(folder)): # Go through all files with X-data
                 self.logger.debug("Loading X-data from file: {}".format(filename_x))
-                with open(filename_x,'rb') as file:
-                    X = pickle.load(file)   # Load file
-                    if X is not None:
-                        if X_training_data is None:
-                            X_training_data = np.empty((0, X.shape[1], X.shape[2]))   
-                        X_training_data = np.concatenate((X_training_data,X),axis=0) # Concatenate new data with previous data.
+                X = self._load(filename_x)   # Load file
+                if X is not None:
+                    if X_training_data is None:
+                        X_training_data = np.empty((0, X.shape[1], X.shape[2]))   
+                    X_training_data = np.concatenate((X_training_data,X),axis=0) # Concatenate new data with previous data.
                 for filename_y in glob.glob('{}/y_*{}'.format(folder,filename_x[-23:])): # Go through all y-data. Use the date and time from the x-file to open matching y-file.
                     self.logger.debug("Loading y-data from file: {}".format(filename_y))
-                    with open(filename_y,'rb') as file:
-                        y = pickle.load(file)    # Load file
-                        if y is not None:
-                            y_training_data = np.concatenate((y_training_data,y),axis=0) # Concatenate new data with previous data.
+                    y = self._load(filename_y)    # Load file
+                    if y is not None:
+                        y_training_data = np.concatenate((y_training_data,y),axis=0) # Concatenate new data with previous data.
 
             # Set combined data to training data.
             self._X_train = X_training_data 
@@ -254,6 +254,13 @@ class TrainingML(Node):
         if self._task is not None:
             self._task.stop()
 
+    def _load(self, filename):
+        """Load data saved by `SaveNumpy`, either pickled (.sav) or appended to a .npy file."""
+        if filename.endswith(".npy"):
+            return np.load(filename)
+        with open(filename,'rb') as file:
+            return pickle.load(file)
+
     def _make_pipeline(self, steps):
 
         # Load pipeline from file
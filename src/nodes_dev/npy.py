@@ -0,0 +1,133 @@
+"""Append-only .npy files"""
+
+import os
+
+import numpy as np
+
+
+class NpyWriter:
+    """Growable .npy file, written incrementally.
+
+    Rows are appended at the end of the file and the header is rewritten in place
+    after each append, so saving new data never rewrites what is already on disk. The
+    header is padded to a fixed size when the file is created, which leaves room for
+    the first dimension to grow. The result is a regular .npy file that can be read
+    at any time with :py:func:`numpy.load`, including with ``mmap_mode``.
+
+    The dtype and the shape of a row are fixed by the first append. Later rows must
+    have a compatible dtype, and are never truncated. Strings are stored with a fixed
+    width of at least ``min_str_len`` characters: when longer strings are appended, the
+    width is increased. When numbers that don't fit the dtype are appended (e.g.
+    floats after integers), the dtype is promoted. In both cases, the file is
+    rewritten once with the new dtype. Other dtypes (e.g. strings after numbers) raise
+    a `ValueError`.
+
+    Args:
+        path (str): The path of the file. An existing file is overwritten.
+        min_str_len (int): The minimum width of string dtypes.
+
+    """
+
+    def __init__(self, path, min_str_len=32):
+
+        self.path = path
+        self._min_str_len = min_str_len
+        self._file = None
+        self._dtype = None
+        self._shape = None
+        self._header_size = None
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def dtype(self):
+        """The dtype of the rows, or `None` until the first append."""
+        return self._dtype
+
+    def append(self, rows):
+        """Append rows at the end of the file.
+
+        Args:
+            rows (ndarray): The rows to append, of shape (n_rows, ...).
+
+        """
+        rows = np.asarray(rows)
+        if self._file is None:
+            self._create(rows)
+        elif rows.shape[1:] != self._shape:
+            raise ValueError(
+                "Invalid shape: {}, expected {}".format(rows.shape[1:], self._shape)
+            )
+        if len(rows) == 0:
+            return
+        if self._dtype.kind in "US" and rows.dtype.kind in "US":
+            if _width(rows.dtype) > _width(self._dtype):
+                self._widen(np.dtype("{}{}".format(self._dtype.char, _width(rows.dtype))))
+        elif not np.can_cast(rows.dtype, self._dtype, "safe"):
+            if self._dtype.kind not in "biuf" or rows.dtype.kind not in "biuf":
+                raise ValueError(
+                    "Invalid dtype: {}, expected {}".format(rows.dtype, self._dtype)
+                )
+            self._widen(np.result_type(self._dtype, rows.dtype))
+        self._file.seek(0, os.SEEK_END)
+        np.ascontiguousarray(rows, dtype=self._dtype).tofile(self._file)
+        self._count += len(rows)
+        self._write_header()
+        self._file.flush()
+
+    def close(self):
+        """Close the file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _create(self, rows):
+        dtype = rows.dtype
+        if dtype.kind in "US":
+            width = max(_width(dtype), self._min_str_len)
+            dtype = np.dtype("{}{}".format(dtype.char, width))
+        elif dtype.kind == "O":
+            raise ValueError("Object arrays can not be appended")
+        self._dtype = dtype
+        self._shape = rows.shape[1:]
+        self._header_size = len(self._header(np.iinfo(np.int64).max))
+        self._file = open(self.path, "w+b")
+        self._write_header()
+
+    def _widen(self, dtype):
+        # Rewrite the rows already on disk with a wider dtype
+        self._file.seek(self._header_size)
+        size = self._count * int(np.prod(self._shape))
+        rows = np.fromfile(self._file, dtype=self._dtype, count=size)
+        self._dtype = dtype
+        self._header_size = len(self._header(np.iinfo(np.int64).max))
+        self._file.seek(0)
+        self._file.truncate()
+        self._write_header()
+        rows.astype(self._dtype).tofile(self._file)
+
+    def _header(self, count, size=None):
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+            np.lib.format.dtype_to_descr(self._dtype), (count,) + self._shape
+        )
+        prefix = len(np.lib.format.magic(1, 0)) + 2
+        if size is None:
+            size = -(-(prefix + len(header) + 1) // 64) * 64
+        header += " " * (size - prefix - len(header) - 1) + "\n"
+        return (
+            np.lib.format.magic(1, 0)
+            + np.uint16(len(header)).astype("<u2").tobytes()
+            + header.encode("latin1")
+        )
+
+    def _write_header(self):
+        self._file.seek(0)
+        self._file.write(self._header(self._count, self._header_size))
+
+
+def _width(dtype):
+
+    # The number of characters of a string dtype
+    return dtype.itemsize // np.dtype(dtype.char + "1").itemsize
@@ -0,0 +1,292 @@
+"""Opt-in profiling of nodes"""
+
+import os
+import functools
+import itertools
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+import zmq
+import timeflux.core.message
+from timeflux.helpers.port import make_event
+
+_sockets = {}
+_instances = itertools.count(1)
+
+
+def enabled(name):
+    """Check whether a node class is profiled
+
+    Profiling is enabled with the ``TIMEFLUX_PROFILE`` environment variable, either for
+    all the decorated nodes (``1`` or ``all``) or for a comma-separated list of node
+    class names (e.g. ``Epoch,AverageERP``).
+
+    Args:
+        name (str): The name of the node class.
+
+    Returns:
+        bool: `True` if the node is profiled.
+
+    """
+    names = os.environ.get("TIMEFLUX_PROFILE", "").strip()
+    if names.lower() in ("", "0", "false", "no"):
+        return False
+    if names.lower() in ("1", "true", "yes", "all"):
+        return True
+    return name in [name.strip() for name in names.split(",")]
+
+
+def profiled(cls):
+    """Class decorator that profiles the ``update()`` method of a node.
+
+    When profiling is disabled (see :py:func:`enabled`), the original ``update()`` is
+    called directly and nothing is measured. Otherwise, a :py:class:`NodeProfiler` is
+    created on the first update of each instance.
+
+    Args:
+        cls (type): The node class.
+
+    Returns:
+        type: The same class, with a wrapped ``update()``.
+
+    """
+    update = cls.update
+
+    @functools.wraps(update)
+    def profiled_update(self):
+        try:
+            profiler = self._profiler
+        except AttributeError:
+            profiler = self._profiler = (
+                NodeProfiler(self, cls.__name__) if enabled(cls.__name__) else None
+            )
+        if profiler is None:
+            return update(self)
+        return profiler.run(update)
+
+    cls.update = profiled_update
+    return cls
+
+
+def count_rows(data):
+    """Count the rows of the data of a port
+
+    Args:
+        data (DataFrame|ndarray): The data. Batches of epochs (n_epochs x n_channels x
+            n_samples) count as one row per sample of each epoch.
+
+    Returns:
+        int: The number of rows.
+
+    """
+    if data is None:
+        return 0
+    if isinstance(data, np.ndarray):
+        if data.ndim == 0:
+            return 1
+        if data.ndim == 3:
+            return data.shape[0] * data.shape[2]
+        return data.shape[0]
+    try:
+        return len(data)
+    except TypeError:
+        return 1
+
+
+def count_epochs(port):
+    """Count the epochs sent on a port
+
+    Args:
+        port (Port): The port, with an ``epoch`` in the meta for a single epoch, one
+            ``epoch*`` key per epoch for concatenated epochs, or an ``epochs`` array for
+            a batch.
+
+    Returns:
+        int: The number of epochs.
+
+    """
+    if not port.meta:
+        return 0
+    if "epochs" in port.meta:
+        return len(port.meta["epochs"])
+    return sum(
+        1 for key in port.meta if key == "epoch" or (key.startswith("epoch") and key[5:].isdigit())
+    )
+
+
+class NodeProfiler:
+    """Timing and throughput statistics of a node.
+
+    Each update records the wall time, the number of rows on the input and output ports,
+    the number of epochs sent and, if the ``TIMEFLUX_PROFILE_MEMORY`` environment
+    variable is set, the peak memory allocated by the update (with :py:mod:`tracemalloc`,
+    which slows down all the nodes of the graph). The last ``window`` updates are kept
+    for the percentiles.
+
+    Every ``interval`` seconds, a ``metrics`` event is published on the topic
+    ``metrics`` of the ZMQ broker, as with a ``Pub`` node, so the metrics of all the
+    graphs can be received with a ``Sub`` node or any ZMQ subscriber. The data of the
+    event is a JSON object with the node name, the number of updates, the rows and
+    epochs per second, the fraction of the time spent in the node (``busy``), and the
+    mean, p50, p90, p99 and max of the time (in ms) and of the allocated bytes.
+
+    The interval, the window and the address of the broker are set with the
+    ``TIMEFLUX_PROFILE_INTERVAL``, ``TIMEFLUX_PROFILE_WINDOW`` and
+    ``TIMEFLUX_PROFILE_ADDRESS`` environment variables.
+
+    Args:
+        node (Node): The profiled node.
+        name (str): The name of the node class.
+
+    """
+
+    def __init__(self, node, name):
+
+        self.node = node
+        self.name = "%s-%d@%d" % (name, next(_instances), os.getpid())
+        self.interval = float(os.environ.get("TIMEFLUX_PROFILE_INTERVAL", 10))
+        self.window = int(os.environ.get("TIMEFLUX_PROFILE_WINDOW", 1024))
+        self.memory = bool(os.environ.get("TIMEFLUX_PROFILE_MEMORY"))
+        self.address = os.environ.get("TIMEFLUX_PROFILE_ADDRESS", "tcp://127.0.0.1:5559")
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # Connect now, the messages sent before the connection is established are lost
+        self._socket = _connect(self.address, node.logger)
+        self._times = np.zeros(self.window)
+        self._bytes = np.zeros(self.window, dtype=np.int64)
+        self._count = 0
+        self._reset()
+        node.logger.info("Profiling %s", self.name)
+
+    def run(self, update):
+        """Call and measure an update
+
+        Args:
+            update (function): The unwrapped ``update()`` of the node.
+
+        """
+        rows_in = 0
+        for name, port in self.node.ports.items():
+            if name[0] == "i":
+                rows_in += count_rows(port.data)
+        if self.memory:
+            tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+        start = perf_counter()
+        try:
+            return update(self.node)
+        finally:
+            stop = perf_counter()
+            if self.memory:
+                allocated = tracemalloc.get_traced_memory()[1] - allocated
+            else:
+                allocated = 0
+            rows_out = 0
+            epochs_out = 0
+            for name, port in self.node.ports.items():
+                if name[0] == "o":
+                    rows_out += count_rows(port.data)
+                    epochs_out += count_epochs(port)
+            self._record(stop - start, rows_in, rows_out, epochs_out, allocated)
+            if stop - self._start >= self.interval:
+                self.publish(stop)
+
+    def stats(self, now=None):
+        """Get the statistics since the last publication
+
+        Args:
+            now (float): The current ``perf_counter()`` time.
+
+        Returns:
+            dict: The statistics.
+
+        """
+        if now is None:
+            now = perf_counter()
+        elapsed = max(now - self._start, 1e-9)
+        times = self._times[: min(self._count, self.window)] * 1000
+        stats = {
+            "node": self.name,
+            "updates": self._updates,
+            "elapsed": elapsed,
+            "busy": self._busy / elapsed,
+            "rows_in": self._rows_in,
+            "rows_out": self._rows_out,
+            "epochs_out": self._epochs_out,
+            "rows_in_per_s": self._rows_in / elapsed,
+            "rows_out_per_s": self._rows_out / elapsed,
+            "epochs_out_per_s": self._epochs_out / elapsed,
+            "time_ms": _summary(times),
+        }
+        if self.memory:
+            stats["bytes"] = _summary(self._bytes[: min(self._count, self.window)])
+        return stats
+
+    def publish(self, now=None):
+        """Publish the statistics as a ``metrics`` event and start a new interval
+
+        Args:
+            now (float): The current ``perf_counter()`` time.
+
+        """
+        stats = self.stats(now)
+        self.node.logger.debug("Metrics: %s", stats)
+        try:
+            self._socket.send_serialized(
+                [b"metrics", make_event("metrics", stats), {}],
+                timeflux.core.message.pickle_serialize,
+            )
+        except (zmq.ZMQError, AttributeError) as e:
+            self.node.logger.error(e)
+        self._reset(now)
+
+    def _record(self, seconds, rows_in, rows_out, epochs_out, allocated):
+
+        index = self._count % self.window
+        self._times[index] = seconds
+        self._bytes[index] = allocated
+        self._count += 1
+        self._updates += 1
+        self._busy += seconds
+        self._rows_in += rows_in
+        self._rows_out += rows_out
+        self._epochs_out += epochs_out
+
+    def _reset(self, now=None):
+
+        self._start = perf_counter() if now is None else now
+        self._updates = 0
+        self._busy = 0.0
+        self._rows_in = 0
+        self._rows_out = 0
+        self._epochs_out = 0
+
+
+def _connect(address, logger):
+
+    # One socket per address is shared by the nodes of a process
+    if address not in _sockets:
+        try:
+            socket = zmq.Context.instance().socket(zmq.PUB)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(address)
+            _sockets[address] = socket
+        except zmq.ZMQError as e:
+            logger.error(e)
+            return None
+    return _sockets[address]
+
+
+def _summary(values):
+
+    if len(values) == 0:
+        return None
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "mean": float(np.mean(values)),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "max": float(np.max(values)),
+    }
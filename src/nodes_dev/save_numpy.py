@@ -9,7 +9,10 @@ import pandas as pd
 
 from timeflux.core.node import Node
 from timeflux.helpers.port import get_meta, match_events
-from timeflux.nodes_dev.helpers import get_dict_keys_by_start
+from timeflux.nodes_dev.buffers import EpochStore
+from timeflux.nodes_dev.helpers import get_epochs
+from timeflux.nodes_dev.npy import NpyWriter
+from timeflux.nodes_dev.profiler import profiled
 
 # Statuses
 IDLE = 0
@@ -17,6 +20,7 @@ ACCUMULATING = 1
 FITTING = 2
 READY = 3
 
+@profiled
 class SaveNumpy(Node):
     """Save to nympy arrays
 
@@ -34,6 +38,9 @@ class SaveNumpy(Node):
         session (str): ...
         subject (str): ...
         data_folder (str): ...
+        storage (str): `pickle` to re-pickle all the data of the trial every save
+            interval, or `npy` to append only the new epochs to .npy files. With `npy`,
+            epochs are kept in memory only until they are written.
         ...
 
     Example:
@@ -49,7 +56,8 @@ class SaveNumpy(Node):
         data_folder=".",
         status_admin = False,
         save_interval = 3, # How long before writing new data to file (in seconds)
-        no_epoch_samples=256 # How many samples each epoch is expected to contain.
+        no_epoch_samples=256, # How many samples each epoch is expected to contain.
+        storage="pickle" # "pickle" or "npy"
     ):
 
         # Parameters set by user
@@ -61,6 +69,9 @@ class SaveNumpy(Node):
         self._folder = '{}/{}/{}'.format(self._data_folder, self._subject, self._session)
         self.save_interval = save_interval
         self.no_epoch_samples = no_epoch_samples
+        if storage not in ("pickle", "npy"):
+            raise ValueError("Invalid storage: {}".format(storage))
+        self._storage = storage
         
 
         # Parameters NOT set by user
@@ -68,14 +79,11 @@ class SaveNumpy(Node):
         self.accumulate_data = False
         self.save_data_continuously = False
         self._shape = None
-        self._X_train = None
-        self._y_train = None
+        self._epochs = EpochStore() # Epochs (with labels and timestamps) not yet written, or all epochs of the trial for pickle
         self.meta_label = ("epoch", "context")
 
-        self._X_train_ts = None
-        self._y_train_ts = None
-
         self.file_name = None
+        self._writers = {} # Open .npy files of the current trial, by prefix
 
     def update(self):
 
@@ -93,10 +101,10 @@ class SaveNumpy(Node):
                 # If there is an ACCUMULATING status received
                 if matches is not None and int(matches['data'][-1]) == ACCUMULATING: 
                     if self.accumulate_data == False: # If this is first update where data is accumulating, generate filename and reset params.
+                        self.close_files()
                         self.file_name = datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
                         self._shape = None
-                        self._X_train = None
-                        self._y_train = None
+                        self._epochs.clear()
                     self.accumulate_data = True
                     self.save_data_continuously = True
 
@@ -119,18 +127,14 @@ class SaveNumpy(Node):
                 matches_start = match_events(self.i_events,'start') # 1 is data value for status == ACCUMULATING
                 if matches_start is not None:
                     for user_no in matches_start['data']:
+                        self.close_files()
                         self.file_name = datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
                         self._shape = None
-                        self._X_train = None
-                        self._y_train = None
+                        self._epochs.clear()
                         self._subject="subject"+user_no
                         self.logger.debug("Subject was set to: {}".format(self._subject))
                         self._folder = '{}/{}/{}'.format(self._data_folder, self._subject, self._session)
 
-                        # Also save timestamps:
-                        self._y_train_ts = None
-                        self._X_train_ts = None
-
                         self.accumulate_data = True
                         self.save_data_continuously = True
 
@@ -145,14 +149,14 @@ class SaveNumpy(Node):
                             self.accumulate_data = False
                             self.save_data_continuously = False
 
+                            # Write the epochs received since the last save and close the files
+                            if self._storage == "npy":
+                                self.save_epochs_to_file()
+                            self.close_files()
+
                             # Reset data arrays
                             self._shape = None
-                            self._X_train = None
-                            self._y_train = None
-
-                            # Also reset timestamps:
-                            self._y_train_ts = None
-                            self._X_train_ts = None
+                            self._epochs.clear()
 
                 # Used in CBM when a session ends and the true labels is sent after the session/run
                 matches_end = match_events(self.i_events,'end')
@@ -172,14 +176,10 @@ class SaveNumpy(Node):
 
                             # Reset data arrays
                             self._shape = None
-                            self._X_train = None
-                            self._y_train = None
-
-                            # Also reset timestamps:
-                            self._y_train_ts = None
-                            self._X_train_ts = None
+                            self._epochs.clear()
 
                             # Remove files from trail.
+                            self.close_files()
                             self.remove_pickled_data()
                 """
                 # End session. Someting went wrong. Try to delete the data.
@@ -234,31 +234,14 @@ class SaveNumpy(Node):
             port = self.i_epochs # Port with epoched EEG data. 
             if self.i_epochs.ready():
 
-                index = port.data.index.values # Timestamp of receieved epoch 
-                data = port.data.values
-                data = data.transpose(1,0) # transpose data to match scikit learn input
-
-                # Functionality for recieving multiple epochs during one update iteration.
-                keys = get_dict_keys_by_start(port.meta, "epoch")
-                labels = []
-                tss = [] # Timestamps
-                for key in keys:
-                    #label = get_meta(port, self.meta_label) # get label of epoch # remove
-                    label = get_meta(port, (key,"context")) # get label of epoch
-                    ts = get_meta(port, (key, "onset"))
-                    labels.append(label)
-                    tss.append(ts)
-                
-                if len(keys) != len(labels):
-                    die # Make the program stop
-
-                index = np.reshape(index, (len(keys), self.no_epoch_samples))
-                data = np.reshape(data, (len(keys), data.shape[0], self.no_epoch_samples))
+                # Functionality for recieving multiple epochs during one update iteration (one by one or batched).
+                # data is (n_epochs, n_channels, n_samples) to match scikit learn input, index has the timestamps of each sample.
+                data, index, labels, tss = get_epochs(port, self.no_epoch_samples)
 
                 # Check shape of epoch
                 if self._shape and (data.shape[1:] != self._shape):
                     self.logger.warning("Invalid shape: {}".format(data.shape[1:]))
-                elif self.meta_label is not None and len(labels)!=len(keys):
+                elif self.meta_label is not None and len(labels)!=len(data):
                     self.logger.warning("Invalid label")
 
                 # Somtimes we get the twice the amount of samples in our epochs. In the meanwhile do simple fix with else...
@@ -266,23 +249,9 @@ class SaveNumpy(Node):
 
                 else:
 
-                    # If _X_train is None: create array, else: append to _X_train
-                    if self._X_train is None:
-                        self._X_train = np.array(data)
-                        self._X_train_ts = np.array(index)
-                        self._shape = self._X_train.shape[1:]
-                    else:
-                        self._X_train = np.vstack((self._X_train, data))
-                        self._X_train_ts = np.vstack((self._X_train_ts, index))
-                        
-                    # If _y_train is None: create array, else: append to _y_train
-                    if label is not None:
-                        if self._y_train is None:
-                            self._y_train = np.array([labels])
-                            self._y_train_ts = np.array([tss])
-                        else:
-                            self._y_train = np.append(self._y_train, [labels])
-                            self._y_train_ts = np.append(self._y_train_ts, [tss])
+                    # Append data, labels and timestamps (the store grows by doubling its capacity)
+                    self._epochs.append(data, index, labels, tss)
+                    self._shape = data.shape[1:]
 
         # Continuously save data to specified file (instead of just writing once upon termination)
         if self.save_data_continuously and datetime.now() >= self._save_time_next:
@@ -291,10 +260,13 @@ class SaveNumpy(Node):
 
     def save_epochs_to_file(self):
 
+        if self._storage == "npy":
+            self.append_epochs_to_files()
+            return
 
         self.logger.debug("Trying to save data to: {}/Xts_{}.sav".format(self._folder, self.file_name))
 
-        if self._X_train is not None:
+        if len(self._epochs) > 0:
             
             # Check if folder exists. If not, create it.
             if not (os.path.exists(self._folder) and os.path.isdir(self._folder)):
@@ -306,37 +278,74 @@ class SaveNumpy(Node):
             
             # Save data and labels.
             filename_pickle = '{}/X_{}.sav'.format(self._folder, self.file_name)
-            pickle.dump(self._X_train, open(filename_pickle, 'wb'))
+            pickle.dump(self._epochs.data, open(filename_pickle, 'wb'))
             filename_pickle = '{}/y_{}.sav'.format(self._folder, self.file_name)
-            pickle.dump(self._y_train, open(filename_pickle, 'wb'))
+            pickle.dump(np.array(self._epochs.labels.tolist()), open(filename_pickle, 'wb'))
 
             # Also save the timestamps.
             filename_pickle = '{}/Xts_{}.sav'.format(self._folder, self.file_name)
-            pickle.dump(self._X_train_ts, open(filename_pickle, 'wb'))
+            pickle.dump(self._epochs.times, open(filename_pickle, 'wb'))
             filename_pickle = '{}/yts_{}.sav'.format(self._folder, self.file_name)
-            pickle.dump(self._y_train_ts, open(filename_pickle, 'wb'))
+            pickle.dump(self._epochs.onsets, open(filename_pickle, 'wb'))
             
             self.logger.debug("Data saved.")
 
         else:
             self.logger.debug("No data is available (yet).")
-   
+
+    def append_epochs_to_files(self):
+        """Append the epochs received since the last save to the .npy files of the trial.
+
+        The epochs are then released, so only the data of one save interval is kept in memory.
+
+        """
+        if len(self._epochs) == 0:
+            self.logger.debug("No new data is available.")
+            return
+
+        # Check if folder exists. If not, create it.
+        os.makedirs(self._folder, exist_ok=True)
+
+        labels = np.array(self._epochs.labels.tolist())
+        if labels.dtype.kind == "O":
+            labels = labels.astype(str)
+        new_data = {
+            "X": self._epochs.data,
+            "Xts": self._epochs.times,
+            "y": labels,
+            "yts": self._epochs.onsets,
+        }
+        for prefix, rows in new_data.items():
+            if prefix not in self._writers:
+                self._writers[prefix] = NpyWriter('{}/{}_{}.npy'.format(self._folder, prefix, self.file_name))
+            self._writers[prefix].append(rows)
+        self.logger.debug("{} epochs appended to: {}/X_{}.npy".format(len(self._epochs), self._folder, self.file_name))
+
+        # Release the data that is now on disk
+        self._epochs.clear()
+
+    def close_files(self):
+        """Close the .npy files of the current trial."""
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
 
 
     def remove_pickled_data(self):
         self.logger.debug("Trying to remove [data, label, timestamp]-files: {}/*_{}".format(self._folder, self.file_name))        
 
         # Remove files from trail.
+        extension = "sav" if self._storage == "pickle" else "npy"
         try:
-            filename_pickle = '{}/X_{}.sav'.format(self._folder, self.file_name)
+            filename_pickle = '{}/X_{}.{}'.format(self._folder, self.file_name, extension)
             os.remove(filename_pickle)
-            filename_pickle = '{}/y_{}.sav'.format(self._folder, self.file_name)
+            filename_pickle = '{}/y_{}.{}'.format(self._folder, self.file_name, extension)
             os.remove(filename_pickle)
 
             # Also remove timestamps
-            filename_pickle = '{}/Xts_{}.sav'.format(self._folder, self.file_name)
+            filename_pickle = '{}/Xts_{}.{}'.format(self._folder, self.file_name, extension)
             os.remove(filename_pickle)
-            filename_pickle = '{}/yts_{}.sav'.format(self._folder, self.file_name)
+            filename_pickle = '{}/yts_{}.{}'.format(self._folder, self.file_name, extension)
             os.remove(filename_pickle)
 
             self.logger.debug("Removal of files ok: {}/*_{}".format(self._folder, self.file_name))        
@@ -354,5 +363,6 @@ class SaveNumpy(Node):
     # Save the data upon termination of the application.
     def terminate(self):
         # Pickle training data
-        if self._save_data and self._X_train is not None:
-            self.save_epochs_to_file()
\ No newline at end of file
+        if self._save_data and len(self._epochs) > 0:
+            self.save_epochs_to_file()
+        self.close_files()
\ No newline at end of file
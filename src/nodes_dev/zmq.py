@@ -0,0 +1,77 @@
+"""ZeroMQ nodes for batched epochs"""
+
+import numpy as np
+import pandas as pd
+from timeflux.nodes.zmq import Sub as _Sub
+
+
+class Sub(_Sub):
+    """Subscriber that also merges batches of epochs.
+
+    This is a drop-in replacement for :py:class:`timeflux.nodes.zmq.Sub`. When several
+    messages are received for the same topic during one update, DataFrames are
+    concatenated as usual, while arrays (such as the batches sent by the `Epoch` node
+    in batched mode) are concatenated on their first axis. Array values in the meta
+    (such as the ``epochs`` and ``times`` of a batch) are concatenated as well instead
+    of being overwritten. Batches with epochs of different lengths (e.g. cut by
+    timestamps) are padded to the longest, with NaN for the data and NaT for the times,
+    as the `Epoch` node pads the shorter epochs of a batch.
+
+    Attributes:
+        o_* (Port): Dynamic outputs, provide DataFrame or ndarray and meta.
+
+    Args:
+        topics (list): The topics to subscribe to.
+        address (string): The address of the broker.
+        deserializer (string): The deserializer.
+
+    """
+
+    def _append_meta(self, topic, meta):
+        if meta:
+            current = self._chunks[topic]["meta"]
+            for key, value in meta.items():
+                if isinstance(value, np.ndarray) and isinstance(
+                    current.get(key), np.ndarray
+                ):
+                    current[key] = _concatenate((current[key], value))
+                else:
+                    current[key] = value
+
+    def _update_ports(self):
+        for topic in self._chunks.keys():
+            chunks = self._chunks[topic]["data"]
+            if len(chunks) == 0:
+                data = None
+            elif len(chunks) == 1:
+                data = chunks[0]
+            elif isinstance(chunks[0], np.ndarray):
+                data = _concatenate(chunks)
+            else:
+                data = pd.concat(chunks)
+            meta = self._chunks[topic]["meta"]
+            self._update_port(topic, data, meta)
+
+
+def _concatenate(arrays):
+    """Concatenate arrays on their first axis, padding their last axis if needed."""
+    shapes = {array.shape[1:-1] for array in arrays}
+    if len(shapes) > 1 or any(array.ndim < 2 for array in arrays):
+        return np.concatenate(arrays)
+    length = max(array.shape[-1] for array in arrays)
+    if all(array.shape[-1] == length for array in arrays):
+        return np.concatenate(arrays)
+    dtype = arrays[0].dtype
+    if dtype.kind == "f":
+        fill = np.nan
+    elif dtype.kind in "mM":
+        fill = np.array("NaT", dtype=dtype)
+    else:
+        raise ValueError(f"Cannot pad arrays of {dtype} to the same length")
+    shape = (sum(len(array) for array in arrays),) + arrays[0].shape[1:-1] + (length,)
+    padded = np.full(shape, fill, dtype=dtype)
+    start = 0
+    for array in arrays:
+        padded[start : start + len(array), ..., : array.shape[-1]] = array
+        start += len(array)
+    return padded